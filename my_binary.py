@@ -0,0 +1,533 @@
+import sys
+import json
+import mmap
+import struct
+
+from my_ir import INSTRUCTION_KEYS, LABEL, OPCODES, Symbols
+from my_parallel import open_program, parse_args
+
+
+# the file starts with the magic and the version, and ends with the footer:
+# offsets of the string table, the types, the extra program keys and the
+# index (0 when there is none), the number of functions and the magic again
+MAGIC = b"BRLB"
+VERSION = 1
+
+HEADER = struct.Struct("<4sB3x")
+FOOTER = struct.Struct("<QQQQQ4s")
+
+# an index entry per function, the offset of it's record
+INDEX_ENTRY = struct.Struct("<Q")
+
+DOUBLE = struct.Struct("<d")
+
+# which keys an instruction has, in the byte after it's op
+DEST = 1
+TYPE = 2
+ARGS = 4
+FUNCS = 8
+LABELS = 16
+VALUE = 32
+EXTRA = 64
+
+# which keys a function has
+FUNCTION_ARGS = 1
+FUNCTION_TYPE = 2
+FUNCTION_EXTRA = 4
+
+# args with keys other than name and type are kept as json
+FUNCTION_ARGS_JSON = 8
+
+# tag of a const value
+FALSE = 0
+TRUE = 1
+INT = 2
+FLOAT = 3
+OTHER = 4
+
+
+def put_varint(out: bytearray, value: int) -> None:
+  while value >= 0x80:
+    out.append((value & 0x7f) | 0x80)
+    value = value >> 7
+
+  out.append(value)
+
+
+def put_string(out: bytearray, string: str) -> None:
+  data = string.encode()
+
+  put_varint(out, len(data))
+  out += data
+
+
+def get_varint(data, position: int) -> tuple:
+  # (value, position after it)
+  byte = data[position]
+  position = position + 1
+
+  if byte < 0x80:
+    return (byte, position)
+
+  value = byte & 0x7f
+  shift = 7
+
+  while True:
+    byte = data[position]
+    position = position + 1
+    value = value | ((byte & 0x7f) << shift)
+
+    if byte < 0x80:
+      return (value, position)
+
+    shift = shift + 7
+
+
+def get_strings(data, position: int) -> tuple:
+  # (list of strings, position after them)
+  (count, position) = get_varint(data, position)
+  strings = []
+
+  for _ in range(count):
+    (size, position) = get_varint(data, position)
+    strings.append(str(data[position:position + size], "utf-8"))
+    position = position + size
+
+  return (strings, position)
+
+
+def is_binary(source) -> bool:
+  # whether the file holds a binary program, nothing is read from it
+  buffer = getattr(source, "buffer", source)
+
+  return hasattr(buffer, "peek") and buffer.peek(len(MAGIC))[:len(MAGIC)] == MAGIC
+
+
+def read_binary(source):
+  # the contents of the file, mapped when it is a regular file so
+  # only the pages of the functions decoded are read in
+  buffer = getattr(source, "buffer", source)
+
+  try:
+    return mmap.mmap(buffer.fileno(), 0, access=mmap.ACCESS_READ)
+  except (OSError, ValueError, AttributeError):
+    # pipes can not be mapped
+    return buffer.read()
+
+
+class Encoder:
+  # strings shared by the functions: function names, types, ops outside
+  # OPCODES and json of whatever does not fit the format. variable and label
+  # names are interned per function, so a function decodes on it's own
+  def __init__(self) -> None:
+    self.strings = Symbols()
+
+    # json of a type -> id, in their own table, they are decoded up front
+    self.types = Symbols()
+
+  def type_id(self, type) -> int:
+    return self.types.intern(json.dumps(type))
+
+  def value(self, out: bytearray, value) -> None:
+    if value is False:
+      out.append(FALSE)
+    elif value is True:
+      out.append(TRUE)
+    elif type(value) is int:
+      # zigzag, small negative numbers stay short
+      out.append(INT)
+      put_varint(out, (value << 1) if value >= 0 else ((-value << 1) - 1))
+    elif type(value) is float:
+      out.append(FLOAT)
+      out += DOUBLE.pack(value)
+    else:
+      out.append(OTHER)
+      put_varint(out, self.strings.intern(json.dumps(value)))
+
+  def function(self, function: dict) -> bytes:
+    names = Symbols()
+    body = bytearray()
+
+    instrs = function["instrs"]
+    put_varint(body, len(instrs))
+
+    for inst in instrs:
+      extra = [ key for key in inst if key not in INSTRUCTION_KEYS ]
+
+      if "label" in inst:
+        put_varint(body, LABEL)
+        body.append(EXTRA if extra else 0)
+        put_varint(body, names.intern(inst["label"]))
+      else:
+        op = inst["op"]
+        put_varint(body, OPCODES.index[op] if op in OPCODES.index else len(OPCODES) + self.strings.intern(op))
+
+        flags = (DEST if "dest" in inst else 0) | (TYPE if "type" in inst else 0) \
+                | (ARGS if "args" in inst else 0) | (FUNCS if "funcs" in inst else 0) \
+                | (LABELS if "labels" in inst else 0) | (VALUE if "value" in inst else 0) \
+                | (EXTRA if extra else 0)
+        body.append(flags)
+
+        if flags & DEST:
+          put_varint(body, names.intern(inst["dest"]))
+
+        if flags & TYPE:
+          put_varint(body, self.type_id(inst["type"]))
+
+        if flags & ARGS:
+          put_varint(body, len(inst["args"]))
+
+          for arg in inst["args"]:
+            put_varint(body, names.intern(arg))
+
+        if flags & FUNCS:
+          put_varint(body, len(inst["funcs"]))
+
+          for func in inst["funcs"]:
+            put_varint(body, self.strings.intern(func))
+
+        if flags & LABELS:
+          put_varint(body, len(inst["labels"]))
+
+          for label in inst["labels"]:
+            put_varint(body, names.intern(label))
+
+        if flags & VALUE:
+          self.value(body, inst["value"])
+
+      if extra:
+        put_varint(body, self.strings.intern(json.dumps({ key: inst[key] for key in extra })))
+
+    # the header of the function goes before the body, it holds the
+    # names the body interned
+    record = bytearray()
+    put_varint(record, self.strings.intern(function["name"]))
+
+    args = function.get("args")
+    args_json = args is not None and any([ set(arg.keys()) != { "name", "type" } for arg in args ])
+    extra = { key: value for (key, value) in function.items() if key not in ("name", "args", "type", "instrs") }
+
+    record.append((FUNCTION_ARGS if args is not None and not args_json else 0)
+                  | (FUNCTION_ARGS_JSON if args_json else 0)
+                  | (FUNCTION_TYPE if "type" in function else 0)
+                  | (FUNCTION_EXTRA if extra else 0))
+
+    if args is not None and not args_json:
+      for arg in args:
+        names.intern(arg["name"])
+
+    put_varint(record, len(names))
+
+    for name in names.names:
+      put_string(record, name)
+
+    if args is not None and not args_json:
+      put_varint(record, len(args))
+
+      for arg in args:
+        put_varint(record, names.index[arg["name"]])
+        put_varint(record, self.type_id(arg["type"]))
+    elif args_json:
+      put_varint(record, self.strings.intern(json.dumps(args)))
+
+    if "type" in function:
+      put_varint(record, self.type_id(function["type"]))
+
+    if extra:
+      put_varint(record, self.strings.intern(json.dumps(extra)))
+
+    return bytes(record + body)
+
+
+def write_binary(functions, out, extra: dict = None, index: bool = True) -> None:
+  # the binary counterpart of write_functions: each function is written as
+  # soon as it is done, the tables it refers to go after all of them
+  encoder = Encoder()
+  offsets = []
+
+  out.write(HEADER.pack(MAGIC, VERSION))
+  position = HEADER.size
+
+  for function in functions:
+    record = encoder.function(function)
+    size = bytearray()
+    put_varint(size, len(record))
+
+    offsets.append(position)
+    out.write(size)
+    out.write(record)
+    position = position + len(size) + len(record)
+
+  tables = bytearray()
+
+  strings_offset = position
+  put_varint(tables, len(encoder.strings))
+
+  for string in encoder.strings.names:
+    put_string(tables, string)
+
+  types_offset = position + len(tables)
+  put_varint(tables, len(encoder.types))
+
+  for type in encoder.types.names:
+    put_string(tables, type)
+
+  extra_offset = position + len(tables)
+  put_string(tables, json.dumps(extra or {}))
+
+  index_offset = 0
+
+  if index:
+    index_offset = position + len(tables)
+
+    for offset in offsets:
+      tables += INDEX_ENTRY.pack(offset)
+
+  tables += FOOTER.pack(strings_offset, types_offset, extra_offset, index_offset, len(offsets), MAGIC)
+
+  out.write(tables)
+  out.flush()
+
+
+class BinaryProgram:
+  # a binary program over bytes or a mmap of the file. the tables are read
+  # up front, a function only when it is asked for. iterating gives the
+  # functions in json form, like a FunctionReader
+  def __init__(self, data) -> None:
+    self.data = data
+
+    (magic, version) = HEADER.unpack_from(data, 0)
+
+    if magic != MAGIC or len(data) < HEADER.size + FOOTER.size:
+      raise ValueError("not a binary bril program")
+
+    if version != VERSION:
+      raise ValueError(f'binary bril program of version {version}, expected {VERSION}')
+
+    (strings_offset, types_offset, extra_offset, index_offset, count, magic) = \
+      FOOTER.unpack_from(data, len(data) - FOOTER.size)
+
+    if magic != MAGIC:
+      raise ValueError("binary bril program is cut short")
+
+    (self.strings, _) = get_strings(data, strings_offset)
+    self.types = [ json.loads(type) for type in get_strings(data, types_offset)[0] ]
+
+    (size, position) = get_varint(data, extra_offset)
+
+    # top level key -> value, the keys other than functions
+    self.extra = json.loads(str(data[position:position + size], "utf-8"))
+
+    self.count = count
+
+    if index_offset:
+      self.offsets = [ INDEX_ENTRY.unpack_from(data, index_offset + INDEX_ENTRY.size * position)[0]
+                       for position in range(count) ]
+    else:
+      # no index, the records are skipped over by their sizes
+      self.offsets = []
+      position = HEADER.size
+
+      for _ in range(count):
+        self.offsets.append(position)
+        (size, position) = get_varint(data, position)
+        position = position + size
+
+    self.positions = None
+
+  def __len__(self) -> int:
+    return self.count
+
+  def __iter__(self):
+    for position in range(self.count):
+      yield self.function(position)
+
+  def name(self, position: int) -> str:
+    # the name is the first thing in the record, nothing else is decoded
+    (_, start) = get_varint(self.data, self.offsets[position])
+
+    return self.strings[get_varint(self.data, start)[0]]
+
+  def find(self, name: str) -> dict:
+    if self.positions is None:
+      self.positions = { self.name(position): position for position in range(self.count) }
+
+    return self.function(self.positions[name])
+
+  def function(self, position: int) -> dict:
+    (size, start) = get_varint(self.data, self.offsets[position])
+
+    # one copy of the record, indexing bytes is quicker than the map
+    data = bytes(self.data[start:start + size])
+    strings = self.strings
+    types = self.types
+
+    (name, p) = get_varint(data, 0)
+    flags = data[p]
+    p = p + 1
+
+    function = { "name": strings[name] }
+
+    (names, p) = get_strings(data, p)
+
+    if flags & FUNCTION_ARGS:
+      (count, p) = get_varint(data, p)
+      args = []
+
+      for _ in range(count):
+        (arg, p) = get_varint(data, p)
+        (type, p) = get_varint(data, p)
+        args.append({ "name": names[arg], "type": types[type] })
+
+      function["args"] = args
+    elif flags & FUNCTION_ARGS_JSON:
+      (args, p) = get_varint(data, p)
+      function["args"] = json.loads(strings[args])
+
+    if flags & FUNCTION_TYPE:
+      (type, p) = get_varint(data, p)
+      function["type"] = types[type]
+
+    if flags & FUNCTION_EXTRA:
+      (extra, p) = get_varint(data, p)
+      function.update(json.loads(strings[extra]))
+
+    (count, p) = get_varint(data, p)
+    instrs = []
+
+    opcodes = OPCODES.names
+    opcode_count = len(opcodes)
+
+    narrow = len(names) <= 0x80
+
+    for _ in range(count):
+      # the ids are mostly below 0x80, those are read inline
+      op = data[p]
+      p = p + 1
+
+      if op >= 0x80:
+        (op, p) = get_varint(data, p - 1)
+
+      flags = data[p]
+      p = p + 1
+
+      if op == LABEL:
+        (label, p) = get_varint(data, p)
+        inst = { "label": names[label] }
+      else:
+        inst = { "op": opcodes[op] if op < opcode_count else strings[op - opcode_count] }
+
+        if flags & DEST:
+          dest = data[p]
+          p = p + 1
+
+          if dest >= 0x80:
+            (dest, p) = get_varint(data, p - 1)
+
+          inst["dest"] = names[dest]
+
+        if flags & TYPE:
+          type = data[p]
+          p = p + 1
+
+          if type >= 0x80:
+            (type, p) = get_varint(data, p - 1)
+
+          inst["type"] = types[type]
+
+        if flags & ARGS:
+          (arg_count, p) = get_varint(data, p)
+
+          if narrow:
+            # every variable id is one byte
+            inst["args"] = [ names[arg] for arg in data[p:p + arg_count] ]
+            p = p + arg_count
+          else:
+            args = []
+
+            for _ in range(arg_count):
+              (arg, p) = get_varint(data, p)
+              args.append(names[arg])
+
+            inst["args"] = args
+
+        if flags & FUNCS:
+          (func_count, p) = get_varint(data, p)
+          funcs = []
+
+          for _ in range(func_count):
+            (func, p) = get_varint(data, p)
+            funcs.append(strings[func])
+
+          inst["funcs"] = funcs
+
+        if flags & LABELS:
+          (label_count, p) = get_varint(data, p)
+          labels = []
+
+          for _ in range(label_count):
+            (label, p) = get_varint(data, p)
+            labels.append(names[label])
+
+          inst["labels"] = labels
+
+        if flags & VALUE:
+          tag = data[p]
+          p = p + 1
+
+          if tag == FALSE:
+            inst["value"] = False
+          elif tag == TRUE:
+            inst["value"] = True
+          elif tag == INT:
+            (value, p) = get_varint(data, p)
+            inst["value"] = (value >> 1) if not value & 1 else -((value + 1) >> 1)
+          elif tag == FLOAT:
+            inst["value"] = DOUBLE.unpack_from(data, p)[0]
+            p = p + DOUBLE.size
+          else:
+            (value, p) = get_varint(data, p)
+            inst["value"] = json.loads(strings[value])
+
+      if flags & EXTRA:
+        (extra, p) = get_varint(data, p)
+        inst.update(json.loads(strings[extra]))
+
+      instrs.append(inst)
+
+    function["instrs"] = instrs
+
+    return function
+
+  def to_json(self) -> dict:
+    program = {}
+    program["functions"] = list(self)
+    program.update(self.extra)
+
+    return program
+
+
+def add_options(parser) -> None:
+  parser.add_argument("-n", "--no-index", action="store_true",
+                      help="leave out the per function offset index")
+
+
+if __name__ == "__main__":
+  # Python dictionary beign used is expected
+  # in the ordered fashion, which is a feature
+  # in python 3.7 and above
+
+  assert sys.version_info >= (3, 7)
+
+  args = parse_args("conversion between json and the binary form of bril", add_options)
+
+  with open_program(args.program) as source:
+    if is_binary(source):
+      program = BinaryProgram(read_binary(source))
+      json.dump(program.to_json(), sys.stdout)
+      print()
+    else:
+      program = json.load(source)
+      extra = { key: value for (key, value) in program.items() if key != "functions" }
+
+      write_binary(program["functions"], sys.stdout.buffer, extra, not args.no_index)
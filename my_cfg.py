@@ -0,0 +1,259 @@
+import copy
+
+
+GENERATED_BLOCK_NAME_PERFIX = 'r'
+
+TERMINATORS = ("br", "jmp", "ret")
+
+
+class NameGenerator:
+  def __init__(self, taken: set, prefix: str = GENERATED_BLOCK_NAME_PERFIX) -> None:
+    # names which are already in use in the function (i.e. labels)
+    self.taken = taken
+
+    self.prefix = prefix
+    self.counter = 0
+
+  def fresh(self) -> str:
+    # counter based, so the same function always gets the same names
+    while True:
+      name = f'{self.prefix}_{self.counter}'
+      self.counter = self.counter + 1
+
+      if name not in self.taken:
+        self.taken.add(name)
+        return name
+
+
+class CFG:
+  def __init__(self, func: str, names: list, blocks: list,
+               generated: list, name_gen: NameGenerator) -> None:
+    # name of the function this graph belongs to
+    self.func = func
+
+    # hands out the names of the blocks without labels
+    # passes creating new blocks should use it as well
+    self.name_gen = name_gen
+
+    # block id -> label of the basic block
+    self.names = names
+
+    # block id -> instructions of the basic block
+    self.blocks = blocks
+
+    # block id -> True if the block has no label of it's own and starts
+    # right after a terminator, i.e. nothing can reach it. the entry
+    # block has no label either, but is reached
+    self.generated = generated
+
+    # label -> block id
+    self.index = { name: id for (id, name) in enumerate(names) }
+
+    # block id -> [block id]
+    self.preds = [ [] for _ in names ]
+    self.succs = [ [] for _ in names ]
+
+    # the entry block is always the first one
+    self.entry = 0
+
+    # analyses computed from the edges alone: block orders, dominators.
+    # the copies with_blocks makes have the same edges, so they share them
+    self.edge_analyses = {}
+
+    # analyses which also read the instructions, e.g. live variables.
+    # with_blocks starts them over
+    self.analyses = {}
+
+  def __len__(self) -> int:
+    return len(self.names)
+
+  def add_edge(self, source: int, target: int) -> None:
+    self.succs[source].append(target)
+    self.preds[target].append(source)
+
+  def instrs(self) -> list:
+    func_insts = []
+
+    for block_insts in self.blocks:
+      func_insts.extend(block_insts)
+
+    return func_insts
+
+  def with_blocks(self, blocks: list) -> "CFG":
+    # same graph, new block contents
+    # only valid if the terminators of the blocks are unchanged
+    assert len(blocks) == len(self.blocks)
+
+    cfg = copy.copy(self)
+    cfg.blocks = blocks
+    cfg.analyses = {}
+
+    return cfg
+
+  def subgraph(self, keep: list) -> "CFG":
+    # keep only the given block ids (in the given order)
+    # edges are rebuilt from the block contents
+    return connect(CFG(self.func,
+                       [ self.names[id] for id in keep ],
+                       [ self.blocks[id] for id in keep ],
+                       [ self.generated[id] for id in keep ],
+                       self.name_gen))
+
+
+def blockify(insts: list, func: str) -> tuple:
+  names = []
+  blocks = []
+  generated = []
+
+  name_gen = NameGenerator({ inst["label"] for inst in insts if "label" in inst })
+
+  # the entry block is named after the function, unless a label took it
+  if func not in name_gen.taken:
+    current_block_name = func
+    name_gen.taken.add(func)
+  else:
+    current_block_name = name_gen.fresh()
+  current_block_generated = False
+  current_block_insts = []
+
+  def close_block() -> None:
+    names.append(current_block_name)
+    blocks.append(current_block_insts)
+    generated.append(current_block_generated)
+
+  for inst in insts:
+    if "op" in inst:
+      current_block_insts.append(inst)
+
+      if inst["op"] in TERMINATORS:
+        close_block()
+
+        current_block_name = name_gen.fresh()
+        current_block_generated = True
+        current_block_insts = []
+
+    elif "label" in inst:
+      if current_block_insts:
+        close_block()
+
+      current_block_name = inst["label"]
+      current_block_generated = False
+      current_block_insts = [ inst ]
+    else:
+      print(f"Illegal instruction detected: {inst}")
+      exit(1)
+
+  if current_block_insts:
+    close_block()
+
+  return (names, blocks, generated, name_gen)
+
+
+def connect(cfg: CFG) -> CFG:
+  for (id, insts) in enumerate(cfg.blocks):
+    # passes may leave a block empty, it just falls through
+    op = insts[-1].get("op") if insts else None
+
+    if op == "br" or op == "jmp":
+      for target_label in insts[-1]["labels"]:
+        if target_label not in cfg.index:
+          print(f"Unknown label {target_label} in {cfg.func}")
+          exit(1)
+
+        cfg.add_edge(id, cfg.index[target_label])
+    elif op == "ret":
+      pass
+    elif id + 1 < len(cfg.blocks):
+      # flows to the next block implicitly
+      cfg.add_edge(id, id + 1)
+
+  return cfg
+
+
+def build_cfg(function: dict) -> CFG:
+  (names, blocks, generated, name_gen) = blockify(function["instrs"], function["name"])
+
+  return connect(CFG(function["name"], names, blocks, generated, name_gen))
+
+
+def with_entry_block(cfg: CFG) -> CFG:
+  # a fresh empty entry falling through to the old one,
+  # for when something has to run before the old entry is reached
+  # (e.g. the old entry is a loop header and needs phis).
+  # it is reached like any entry, so it is not a generated block and
+  # what passes put in it is kept
+  name = cfg.name_gen.fresh()
+
+  return connect(CFG(cfg.func,
+                     [ name ] + cfg.names,
+                     [ [] ] + cfg.blocks,
+                     [ False ] + cfg.generated,
+                     cfg.name_gen))
+
+
+def reverse_postorder(cfg: CFG, unreachable: bool = False) -> list:
+  # iterative dfs from the entry, deep graphs would blow the recursion limit.
+  # with unreachable, the blocks the entry does not reach root further dfs
+  # trees, so every edge except the back edges still goes forward in the order.
+  #
+  # the successors are visited last to first, so the first one ends up right
+  # after its block: for `br cond .body .exit` the loop body comes before
+  # the code after the loop, and the solvers do not sweep that code per loop
+  key = ("reverse postorder", unreachable)
+
+  if key in cfg.edge_analyses:
+    return list(cfg.edge_analyses[key])
+
+  order = []
+  visited = bytearray(len(cfg))
+
+  roots = [ cfg.entry ] if len(cfg) else []
+
+  if unreachable:
+    roots.extend(range(len(cfg)))
+
+  for root in roots:
+    if visited[root]:
+      continue
+
+    visited[root] = 1
+    stack = [ (root, 0) ]
+
+    while stack:
+      (node, next_succ) = stack[-1]
+      succs = cfg.succs[node]
+
+      if next_succ < len(succs):
+        stack[-1] = (node, next_succ + 1)
+        succ = succs[len(succs) - 1 - next_succ]
+
+        if not visited[succ]:
+          visited[succ] = 1
+          stack.append((succ, 0))
+      else:
+        stack.pop()
+        order.append(node)
+
+  order.reverse()
+  cfg.edge_analyses[key] = tuple(order)
+
+  return order
+
+
+def function_args(function: dict) -> list:
+  return [ arg["name"] for arg in function.get("args", []) ]
+
+
+def new_function(function: dict, instrs: list) -> dict:
+  new_function = {}
+
+  new_function["instrs"] = instrs
+  new_function["name"] = function["name"]
+
+  if "args" in function:
+    new_function["args"] = function["args"]
+
+  if "type" in function:
+    new_function["type"] = function["type"]
+
+  return new_function
@@ -1,14 +1,25 @@
 import sys
-import time
 import json
 import numbers
 
-
-ACTUAL_BLOCK_NAME_PERFIX = 'o'
-GENERATED_BLOCK_NAME_PERFIX = 'r'
+from my_cfg import CFG, build_cfg, function_args, new_function, reverse_postorder
+from my_dom import compute_dominators
+from my_ir import Names
+from my_iv import iv_cfg
+from my_licm import licm_cfg
+from my_mem import mem_cfg
+from my_ops import COMMUTATIVE_OPS, COMPARISON_OPS, EVALUATORS, SWAPPED_COMPARISONS, constant_key, evaluate
+from my_parallel import map_functions, parse_args
+from my_sccp import sccp_cfg
+from my_ssa import ssa_cfg, out_of_ssa_cfg
+from my_stream import load_program, open_program, stream_program
 
 
 class Code:
+  # value keys of the value numbering table, they are hashed into it's index
+  # so they must not be modified once built
+  __slots__ = ("is_const", "is_commutive")
+
   def __init__(self) -> None:
     self.is_const = False
     self.is_commutive = False
@@ -16,12 +27,16 @@ class Code:
   def __eq__(self, _: object) -> bool:
     return False
 
+  def __hash__(self) -> int:
+    return id(self)
+
 
 class ID(Code):
+  __slots__ = ("id",)
+
   def __init__(self, id: int) -> None:
     super().__init__()
 
-    print(f"id: {id}")
     self.id = id
 
   def __eq__(self, other: object) -> bool:
@@ -30,31 +45,44 @@ class ID(Code):
 
     return False
 
+  def __hash__(self) -> int:
+    return hash((ID, self.id))
+
 
 class Const(Code):
-  def __init__(self, value: numbers.Number) -> None:
+  __slots__ = ("value", "type", "key")
+
+  def __init__(self, value: numbers.Number, type=None) -> None:
     super().__init__()
 
     self.is_const = True
     self.value = value
 
+    # bril type of the constant, `const true` and `const 1` are different values
+    self.type = type
+
+    # -0.0 and 0.0 compare equal, but are not the same value
+    self.key = constant_key(value)
+
   def __eq__(self, other: object) -> bool:
     if isinstance(other, Const):
-      return self.value == other.value
+      return self.key == other.key and self.type == other.type
 
     return False
 
+  def __hash__(self) -> int:
+    return hash((Const, self.key))
+
 
 class Arithematic(Code):
+  __slots__ = ("op", "args")
+
   def __init__(self, op: str, args: list, is_commutive: bool = True) -> None:
     super().__init__()
 
     self.op = op
     self.is_commutive = is_commutive
-    self.args = args.copy()
-
-    if is_commutive:
-      self.args.sort()
+    self.args = tuple(sorted(args)) if is_commutive else tuple(args)
 
   def __eq__(self, other: object) -> bool:
     if isinstance(other, Arithematic):
@@ -62,15 +90,22 @@ class Arithematic(Code):
 
     return False
 
+  def __hash__(self) -> int:
+    return hash((Arithematic, self.op, self.args))
+
 
 class NonDeterminant(Code):
+  __slots__ = ("args",)
+
   def __init__(self, args: list) -> None:
     super().__init__()
 
-    self.args = args
+    self.args = tuple(args)
 
 
 class Determinant(Code):
+  __slots__ = ("symbol",)
+
   def __init__(self, symbol: str) -> None:
     super().__init__()
 
@@ -82,6 +117,9 @@ class Determinant(Code):
 
     return False
 
+  def __hash__(self) -> int:
+    return hash((Determinant, self.symbol))
+
 
 class RenameEntry:
   def __init__(self, code: Code, name: str) -> None:
@@ -89,414 +127,421 @@ class RenameEntry:
     self.name = name
 
 
-def gen_rand_name() -> str:
-  t = time.time()
-  return f'{GENERATED_BLOCK_NAME_PERFIX}_{t}'
+def func_var_rename(blocks: list, args: list) -> tuple:
+  renamed_blocks = []
 
+  # variable -> (name, type) of it's last definition
+  dest_names = {}
 
-def get_block_name(label: str) -> str:
-  return f'{ACTUAL_BLOCK_NAME_PERFIX}_{label}'
+  # the names handed out so far, the function args to begin with. a new
+  # version skips these, whatever else the function uses does not matter
+  names = Names(args)
 
+  # number of definitions which got a new name or type
+  # (the uses only change if some definition did)
+  changes = 0
 
-def blockify(insts: list, func: str) -> dict:
-  blocks = {}
+  for insts in blocks:
+    renamed_insts = []
 
-  current_block_name = get_block_name(func)
-  current_block_insts = []
+    for inst in insts:
+      inst = inst.copy()
 
-  for inst in insts:
-    if "op" in inst.keys():
-      op = inst["op"]
+      if "args" in inst.keys():
+        # an arg without a definition so far may be the function argument,
+        # it is not renamed
+        inst["args"] = [ dest_names[arg][0] if arg in dest_names else arg for arg in inst["args"] ]
 
-      if op == "br" or op == "jmp" or op == "ret":
-        current_block_insts.append(inst)
+      if "dest" in inst.keys():
+        dest = inst["dest"]
 
-        blocks[current_block_name] = current_block_insts
+        if dest in dest_names:
+          (_, dest_type) = dest_names[dest]
+        else:
+          assert "type" in inst.keys()
+          dest_type = inst["type"]
 
-        current_block_name = gen_rand_name()
-        current_block_insts = []        
-      else:
-        current_block_insts.append(inst)
+        # the first definition keeps the name, the later ones become
+        # <var>_2, <var>_3, ... so <var> and <var>_2 in the source do not clash
+        if dest not in dest_names and dest not in names:
+          new_dest = names.spelling(names.intern(dest))
+        else:
+          new_dest = names.spelling(names.fresh(dest, 2))
 
-    elif "label" in inst.keys():
-      if current_block_insts:
-        blocks[current_block_name] = current_block_insts
+        if new_dest != dest:
+          changes = changes + 1
 
-      current_block_name = get_block_name(inst["label"])
-      current_block_insts = [ inst ]
-    else:
-      print(f"Illegal instruction detected: {inst}")
-      exit(1)
+        inst["dest"] = new_dest
 
-  if current_block_insts:
-    blocks[current_block_name] = current_block_insts
+        if "type" not in inst.keys():
+          inst["type"] = dest_type
+          changes = changes + 1
 
-  return blocks
+        dest_names[dest] = (new_dest, dest_type)
 
+      renamed_insts.append(inst)
 
-def unblockify(block: dict) -> list:
-  func_insts = []
+    renamed_blocks.append(renamed_insts)
 
-  for (_, block_insts) in block.items():
-    func_insts.extend(block_insts)
+  return (renamed_blocks, changes)
 
-  return func_insts
 
+def dce_insts(input_blocks: list, args: list) -> tuple:
+  (blocks, changes) = func_var_rename(input_blocks, args)
 
-def get_arg_name(arg: str, counter: int) -> str:
-  if 1 == counter:
-    return arg
-  else:
-    return f'{arg}_{counter}'
+  # variable -> number of arguments referring to it
+  use_count = {}
 
+  # variable -> [(block id, instruction id)] defining it
+  def_chain = {}
 
-def counter_inc_to_avoid_collision(arg: str, counter: int, all_args: list) -> int:
-  while True:
-    counter = counter + 1
-    name = get_arg_name(arg, counter)
+  for (block_id, insts) in enumerate(blocks):
+    for (inst_id, inst) in enumerate(insts):
+      if "args" in inst.keys():
+        for arg in inst["args"]:
+          use_count[arg] = use_count.get(arg, 0) + 1
 
-    if name not in all_args:
-      return counter
+      if "dest" in inst.keys():
+        def_chain.setdefault(inst["dest"], []).append((block_id, inst_id))
 
+  alive = [ [ True ] * len(insts) for insts in blocks ]
 
-def func_var_rename(insts: list, args: list) -> list:
-  renamed_insts = []
-  dest_counter = {}
-  all_args = []
+  # definitions nobody uses, deleting them may free up more
+  work_list = [ dest for dest in def_chain.keys() if dest not in use_count ]
 
-  all_args.extend(args)
+  while work_list:
+    dest = work_list.pop()
 
-  for inst in insts:
-    inst = inst.copy()
+    for (block_id, inst_id) in def_chain[dest]:
+      inst = blocks[block_id][inst_id]
 
-    if "args" in inst.keys():
-      new_args = []
+      if inst.get("op") == "call":
+        # the callee may print or store, only the result is dead
+        continue
 
-      for arg in inst["args"]:
-        if arg not in dest_counter.keys():
-          # maybe this is the function argument
-          # So, do not rename
-          new_args.append(arg)
-        else:
-          (counter, _) = dest_counter[arg]
-          new_args.append(get_arg_name(arg, counter))
+      alive[block_id][inst_id] = False
+      changes = changes + 1
 
-      inst["args"] = new_args
+      if "args" in inst.keys():
+        for arg in inst["args"]:
+          use_count[arg] = use_count[arg] - 1
 
-    if "dest" in inst.keys():
-      dest = inst["dest"]
+          if 0 == use_count[arg] and arg in def_chain:
+            work_list.append(arg)
 
-      if dest in dest_counter.keys():
-        counter, dest_type = dest_counter[dest]
-      else:
-        assert "type" in inst.keys()
-        counter, dest_type = (0, inst["type"])
+  dce_blocks = []
 
-      # simple +1 would be enough
-      # But, if the source code has <var> and <var>_2 in it's names
-      # then this will break. So, using the fancy counter
-      # counter = counter + 1
+  for (block_id, insts) in enumerate(blocks):
+    dce_blocks.append([ inst for (inst, keep) in zip(insts, alive[block_id]) if keep ])
 
-      counter = counter_inc_to_avoid_collision(dest, counter, all_args)
+  return (dce_blocks, changes)
 
-      new_dest = get_arg_name(dest, counter)
 
-      inst["dest"] = new_dest
-      all_args.append(new_dest)
+def without_phi_edges(insts: list, labels: set) -> list:
+  # the phis forget the edges coming from the labels
+  new_insts = []
 
-      if "type" not in inst.keys():
-        inst["type"] = dest_type
+  for inst in insts:
+    if inst.get("op") == "phi" and labels.intersection(inst["labels"]):
+      live = [ (arg, label) for (arg, label) in zip(inst["args"], inst["labels"]) if label not in labels ]
 
-      dest_counter[dest] = (counter, dest_type)
+      inst = dict(inst)
+      inst["args"] = [ arg for (arg, _) in live ]
+      inst["labels"] = [ label for (_, label) in live ]
 
-    renamed_insts.append(inst)
+    new_insts.append(inst)
 
-  return renamed_insts
+  return new_insts
 
 
-def dce_insts(input_insts: list, args: list) -> list:
-  insts = []
-  insts.extend(func_var_rename(input_insts, args))
+def dce_cfg(cfg: CFG, args: list) -> tuple:
+  # delete the blocks the entry does not reach, the dead code after a jump
+  # as well as the labelled blocks nothing jumps to any more
+  reachable = set(reverse_postorder(cfg))
+  keep = [ id for id in range(len(cfg)) if id in reachable ]
+  changes = sum([ len(insts) for insts in cfg.blocks ]) \
+            - sum([ len(cfg.blocks[id]) for id in keep ])
 
-  while True:
-    dce_insts = []
-    variables_used = []
+  if len(keep) != len(cfg):
+    gone = set([ cfg.names[id] for id in range(len(cfg)) if id not in reachable ])
+    cfg = cfg.with_blocks([ without_phi_edges(insts, gone) for insts in cfg.blocks ]).subgraph(keep)
 
-    for inst in insts:
-      if "args" in inst.keys():
-        variables_used.extend(inst["args"])
+  (blocks, dce_changes) = dce_insts(cfg.blocks, args)
 
-    for inst in insts:
-      if "dest" in inst.keys():
-        dest = inst["dest"]
+  return (cfg.with_blocks(blocks), changes + dce_changes)
 
-        if dest in variables_used:
-          dce_insts.append(inst)
-      else:
-        dce_insts.append(inst)
 
-    if insts == dce_insts:
-      # converged, let's return
-      break
-    else:
-      # continue to iterate till convergence
-      insts = dce_insts
+def dce_function(function: dict) -> dict:
+  (cfg, _) = dce_cfg(build_cfg(function), function_args(function))
 
-  return insts
+  return new_function(function, cfg.instrs())
 
 
-def dce(program: dict) -> dict:
+def dce(program: dict, jobs: int = 1) -> dict:
   new_program = {}
-  new_functions = []
+  new_program["functions"] = map_functions(dce_function, jobs, program["functions"])
 
-  for function in program["functions"]:
-    new_function = {}
+  return new_program
 
-    dce_blocks = {}
-    og_blocks = blockify(function["instrs"], function["name"])
 
-    # print('------------------------------------')
-    # print(f'{function["name"]}:')
-    # print(f'{og_blocks}')
-    # print('------------------------------------')
+def find_entry(entry: RenameEntry, index: dict) -> int:
+  # NonDeterminant codes never compare equal, so they never hit
+  return index.get(entry.code, -1)
 
-    # delete the blocks which are not jump targets
-    for (label, insts) in og_blocks.items():
 
-      assert label.startswith(ACTUAL_BLOCK_NAME_PERFIX) \
-              or label.startswith(GENERATED_BLOCK_NAME_PERFIX)
+def add_entry(entry: RenameEntry, table: list, index: dict) -> int:
+  id = len(table)
+  table.append(entry)
+  index[entry.code] = id
 
-      if label.startswith(ACTUAL_BLOCK_NAME_PERFIX):
-        dce_blocks[label] = insts
+  return id
 
-    new_function["instrs"] = dce_insts(unblockify(dce_blocks), [ arg["name"] for arg in ([] if "args" not in function.keys() else function["args"]) ])
-    new_function["name"] = function["name"]
 
-    if "args" in function.keys():
-      new_function["args"] = function["args"]
+def const_inst(inst: dict, code: Const) -> dict:
+  # the folded instruction, same dest and type
+  return { "op": "const", "dest": inst["dest"], "type": inst.get("type"), "value": code.value }
 
-    if "type" in function.keys():
-      new_function["type"] = function["type"]
 
-    new_functions.append(new_function)
+def algebraic_identity(op: str, entry_args: list, codes: list, type):
+  # x + 0, x * 1, x * 0, x - x, ... as the id of the value they copy or
+  # a Const. None if nothing applies. only the integer and boolean ops,
+  # the float ones have nans and signed zeros in the way
+  def is_value(position: int, value) -> bool:
+    return codes[position].is_const and codes[position].value == value
 
-  new_program["functions"] = new_functions
+  if 2 != len(entry_args):
+    return None
 
-  return new_program
+  same = entry_args[0] == entry_args[1]
 
+  if op == "add":
+    if is_value(1, 0):
+      return entry_args[0]
 
-def find_entry(entry: RenameEntry, table: list) -> int:
-  index = -1
+    if is_value(0, 0):
+      return entry_args[1]
+  elif op == "sub":
+    if is_value(1, 0):
+      return entry_args[0]
 
-  for (i, item) in enumerate(table):
-    if item.code == entry.code:
-      assert (index == -1)
-      index = i
+    if same:
+      return Const(0, type)
+  elif op == "mul":
+    if is_value(0, 0) or is_value(1, 0):
+      return Const(0, type)
 
-  return index
+    if is_value(1, 1):
+      return entry_args[0]
 
+    if is_value(0, 1):
+      return entry_args[1]
+  elif op == "div":
+    if is_value(1, 1):
+      return entry_args[0]
+  elif op == "and" or op == "or":
+    # x and false / x or true decide it, x and true / x or false are x
+    absorbing = op == "or"
 
-def block_lvn(insts: list, table: list, state: dict, func_args: list) -> list:
-  trim_insts = []
+    if same:
+      return entry_args[0]
 
-  # id -> RenameEntry(Code, canonical name)
-  # table = []
+    if is_value(0, absorbing) or is_value(1, absorbing):
+      return Const(absorbing, type)
 
-  # variable -> id
-  # state = {}
+    if is_value(1, not absorbing):
+      return entry_args[0]
 
-  for func_arg in func_args:
-    entry = RenameEntry(Determinant(func_arg), func_arg)
+    if is_value(0, not absorbing):
+      return entry_args[1]
+  elif same and op in COMPARISON_OPS:
+    return Const(op in ("eq", "le", "ge"), type)
 
-    index = find_entry(entry, table)
+  return None
 
-    if -1 == index:
-      id = len(table)
-      table.append(entry)
-      state[func_arg] = id
-    else:
-      id = index
-      state[func_arg] = index
 
-  for inst in insts:
-    # print(f'inst: {inst}')
+def value_code(inst: dict, entry_args: list, table: list):
+  # the value an instruction computes from the value numbers of it's args.
+  # a Code (a Const if it folds), or the id of an existing value when
+  # an identity makes the instruction a copy of it
+  op = inst["op"]
 
-    if "dest" not in inst.keys():
-      trim_insts.append(inst)
-      continue
+  if op == "const":
+    assert "value" in inst.keys()
 
-    trim_inst = None
-    dest = inst["dest"]
-    args = [] if "args" not in inst.keys() else inst["args"]
-    entry_args = [ state[arg] for arg in args ]
+    return Const(inst["value"], inst.get("type"))
 
-    if "op" not in inst.keys():
-      # dest present AND op is not present
-      # this case shouldn't be possible
-      # Just here to make sure of the dirty code
+  if op not in EVALUATORS:
+    return NonDeterminant(entry_args)
 
-      entry = RenameEntry(NonDeterminant(inst, entry_args), dest)
+  codes = [ table[arg].code for arg in entry_args ]
 
-      id = len(table)
-      table.append(entry)
-      state[dest] = id
+  if all([ code.is_const for code in codes ]):
+    value = evaluate(op, [ code.value for code in codes ])
 
-      trim_inst = inst
-    else:
-      op = inst["op"]
+    if value is not None:
+      return Const(value, inst.get("type"))
 
-      if op == "id":
-        assert (1 == len(args))
+  identity = algebraic_identity(op, entry_args, codes, inst.get("type"))
 
-        entry_id = state[args[0]]
-        state[dest] = entry_id
-      elif op == "const":
-        assert "value" in inst.keys()
+  if identity is not None:
+    return identity
 
-        entry = RenameEntry(Const(inst["value"]), dest)
+  if op in ("gt", "ge", "fgt", "fge"):
+    # a > b is b < a, one key for both
+    return Arithematic(SWAPPED_COMPARISONS[op], list(reversed(entry_args)), False)
 
-        index = find_entry(entry, table)
+  return Arithematic(op, entry_args, op in COMMUTATIVE_OPS)
 
-        if -1 == index:
-          # not found, insert
-          id = len(table)
-          table.append(entry)
-          state[dest] = id
 
-          trim_inst = inst
-        else:
-          # const already present, reuse it
-          id = index
-          state[dest] = id
-      elif op == "add":
-        entry = RenameEntry(Arithematic(op, entry_args), dest)
+def gvn_cfg(cfg: CFG, args: list) -> tuple:
+  # global value numbering, the cfg has to be in ssa form: every variable has
+  # one definition, so a value number holds everywhere the variable is defined.
+  # the table is scoped to the dominator tree, an entry is visible only in the
+  # subtree of the block adding it, i.e. where it's name is defined
+  doms = compute_dominators(cfg)
 
-        index = find_entry(entry, table)
+  # id -> RenameEntry(Code, canonical name), Code -> id, variable -> id
+  table = []
+  index = {}
+  state = {}
 
-        if -1 == index:
-          # not found, insert
-          id = len(table)
-          table.append(entry)
-          state[dest] = id
+  for func_arg in args:
+    state[func_arg] = add_entry(RenameEntry(Determinant(func_arg), func_arg), table, index)
 
-          trim_inst = inst
-        else:
-          id = index
-          state[dest] = id
-      elif op == "mul":
-        entry = RenameEntry(Arithematic(op, entry_args), dest)
+  blocks = list(cfg.blocks)
+  changes = 0
 
-        index = find_entry(entry, table)
+  # block id -> [Code] added to the index by the block
+  scopes = [ None ] * len(cfg)
 
-        if -1 == index:
-          # not found, insert
-          id = len(table)
-          table.append(entry)
-          state[dest] = id
+  work_list = [ (cfg.entry, False) ] if len(cfg) else []
 
-          trim_inst = inst
-        else:
-          id = index
-          state[dest] = id
-      elif op == "sub":
-        entry = RenameEntry(Arithematic(op, entry_args, False), dest)
+  while work_list:
+    (node, leaving) = work_list.pop()
 
-        index = find_entry(entry, table)
+    if leaving:
+      for code in scopes[node]:
+        del index[code]
 
-        if -1 == index:
-          # not found, insert
-          id = len(table)
-          table.append(entry)
-          state[dest] = id
+      scopes[node] = None
+      continue
 
-          trim_inst = inst
-        else:
-          id = index
-          state[dest] = id
-      elif op == "div":
-        entry = RenameEntry(Arithematic(op, entry_args, False), dest)
+    scope = []
+    trim_insts = []
 
-        index = find_entry(entry, table)
+    for inst in blocks[node]:
+      if "dest" not in inst.keys() or "op" not in inst.keys():
+        trim_insts.append(inst)
+        continue
 
-        if -1 == index:
-          # not found, insert
-          id = len(table)
-          table.append(entry)
-          state[dest] = id
+      op = inst["op"]
+      dest = inst["dest"]
+      args = inst.get("args", [])
 
-          trim_inst = inst
+      if op == "phi":
+        if all([ arg in state for arg in args ]):
+          # same incoming values on the same edges, only within the block
+          code = Arithematic(("phi", cfg.names[node]),
+                             list(zip(inst.get("labels", []), [ state[arg] for arg in args ])))
         else:
-          id = index
-          state[dest] = id
+          # a back edge, the value is not known yet
+          code = NonDeterminant([])
+      elif not all([ arg in state for arg in args ]):
+        # reads something undefined
+        code = NonDeterminant([])
+      elif op == "id":
+        state[dest] = state[args[0]]
+        changes = changes + 1
+        continue
       else:
-        entry = RenameEntry(NonDeterminant(entry_args), dest)
-
-        id = len(table)
-        table.append(entry)
-        state[dest] = id
+        code = value_code(inst, [ state[arg] for arg in args ], table)
 
-        trim_inst = inst
+      if isinstance(code, int):
+        # an identity, a copy of a dominating value
+        state[dest] = code
+        changes = changes + 1
+        continue
 
-    if trim_inst is not None:
-      trim_insts.append(trim_inst)
+      entry = RenameEntry(code, dest)
+      index_id = find_entry(entry, index)
 
-  # rename the args with the new ones for each instruction
-  for trim_inst in trim_insts:
-    if "args" in trim_inst.keys():
-      trim_args = []
+      if -1 == index_id:
+        state[dest] = add_entry(entry, table, index)
+        scope.append(code)
 
-      for arg in trim_inst["args"]:
-        if arg not in state:
-          trim_args.append(arg)
+        if code.is_const and op != "const":
+          trim_insts.append(const_inst(inst, code))
+          changes = changes + 1
         else:
-          trim_args.append(table[state[arg]].name)
+          trim_insts.append(inst)
+      else:
+        # computed by a dominating instruction already
+        state[dest] = index_id
+        changes = changes + 1
 
-      trim_inst["args"] = trim_args
+    blocks[node] = trim_insts
+    scopes[node] = scope
 
-  return trim_insts
+    work_list.append((node, True))
 
+    for child in reversed(doms.children[node]):
+      work_list.append((child, False))
 
-def lvn(program: dict) -> dict:
-  new_program = {}
-  new_functions = []
+  # the uses go to the canonical names, which dominate them
+  for (id, insts) in enumerate(blocks):
+    renamed_insts = []
+
+    for inst in insts:
+      if "args" in inst.keys():
+        new_args = [ table[state[arg]].name if arg in state else arg for arg in inst["args"] ]
 
-  for function in program["functions"]:
-    new_function = {}
-    function_args = [ arg["name"] for arg in ([] if "args" not in function.keys() else function["args"]) ]
+        if new_args != inst["args"]:
+          inst = inst.copy()
+          inst["args"] = new_args
+          changes = changes + 1
 
-    trim_blocks = {}
-    og_blocks = blockify(function["instrs"], function["name"])
+      renamed_insts.append(inst)
 
-    table = []
-    state = {}
+    blocks[id] = renamed_insts
 
-    for (label, insts) in og_blocks.items():
-      trim_blocks[label] = block_lvn(insts, table, state, function_args)
+  return (cfg.with_blocks(blocks), changes)
 
-    new_function["instrs"] = unblockify(trim_blocks)
-    new_function["name"] = function["name"]
 
-    if "args" in function.keys():
-      new_function["args"] = function["args"]
+def gvn_function(function: dict) -> dict:
+  cfg = ssa_cfg(build_cfg(function), function.get("args", []))
+  (cfg, _) = gvn_cfg(cfg, function_args(function))
+  cfg = out_of_ssa_cfg(cfg, function.get("args", []))
 
-    if "type" in function.keys():
-      new_function["type"] = function["type"]
+  return new_function(function, cfg.instrs())
 
-    new_functions.append(new_function)
 
-  new_program["functions"] = new_functions
+def gvn(program: dict, jobs: int = 1) -> dict:
+  new_program = {}
+  new_program["functions"] = map_functions(gvn_function, jobs, program["functions"])
 
   return new_program
 
 
-def optimize(program: dict) -> dict:
-  while True:
-    optimized_program = lvn(dce(program))
+def optimize_function(function: dict) -> dict:
+  # sccp, memory forwarding, one gvn walk, licm, strength reduction and one
+  # dce sweep on the ssa form
+  cfg = ssa_cfg(build_cfg(function), function.get("args", []))
+  (cfg, _) = sccp_cfg(cfg, function_args(function))
+  (cfg, _) = mem_cfg(cfg, function_args(function))
+  (cfg, _) = gvn_cfg(cfg, function_args(function))
+  (cfg, _) = licm_cfg(cfg, function_args(function))
+  (cfg, _) = iv_cfg(cfg, function_args(function))
+  (cfg, _) = dce_cfg(cfg, function_args(function))
+  cfg = out_of_ssa_cfg(cfg, function.get("args", []))
+
+  return new_function(function, cfg.instrs())
+
 
-    if optimized_program == program:
-      return optimized_program
-    else:
-      program = optimized_program
+def optimize(program: dict, jobs: int = 1) -> dict:
+  new_program = {}
+  new_program["functions"] = map_functions(optimize_function, jobs, program["functions"])
+
+  return new_program
 
 
 if __name__ == "__main__":
@@ -506,11 +551,16 @@ if __name__ == "__main__":
 
   assert sys.version_info >= (3, 7)
 
-  assert(2 == len(sys.argv))
+  args = parse_args("global value numbering and dead code elimination", streaming=True)
 
-  with open(sys.argv[1]) as source:
-    program = json.load(source)
+  if args.stream:
+    stream_program(optimize_function, args.program, args.jobs, binary=args.binary)
+  else:
+    with open_program(args.program) as source:
+      program = load_program(source)
 
-    optimized_program = optimize(program)
+      optimized_program = optimize(program, args.jobs)
 
-    print(json.dumps(optimized_program, indent=2, sort_keys=True))
+      # written as it is encoded, not built into one string first
+      json.dump(optimized_program, sys.stdout, indent=2, sort_keys=True)
+      print()
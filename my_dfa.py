@@ -1,179 +1,536 @@
 import sys
-import time
 import json
+import heapq
 
+from my_cfg import CFG, build_cfg, function_args, reverse_postorder
+from my_ir import Symbols
+from my_ops import COMMUTATIVE_OPS, PURE_OPS, constant_key, evaluate
+from my_parallel import parse_args, report_functions
+from my_stream import load_program, open_program
 
-GENERATED_BLOCK_NAME_PERFIX = 'r'
 
+class Variables(Symbols):
+  # the id of a variable is it's bit position
 
-class Node:
-  def __init__(self, name: str,
-               predecessors: list,
-               successors: list) -> None:
-    # name of this basic block
-    self.name = name
+  def bit(self, name: str) -> int:
+    return 1 << self.intern(name)
 
-    # labels of the basic blocks
-    self.predecessors = predecessors
-    self.successors = successors
+  def to_names(self, bits: int) -> list:
+    return sorted([ self.names[position] for position in bit_positions(bits) ])
 
 
-def gen_rand_name() -> str:
-  t = time.time()
-  return f'{GENERATED_BLOCK_NAME_PERFIX}_{t}'
+def bit_positions(bits: int) -> list:
+  positions = []
 
+  while bits:
+    low = bits & -bits
+    positions.append(low.bit_length() - 1)
+    bits = bits ^ low
 
-def get_block_name(label: str) -> str:
-  return label
+  return positions
 
 
-def blockify(insts: list, func: str) -> dict:
-  blocks = {}
+class Dataflow:
+  # a lattice and the transfer functions of one analysis over one cfg.
+  # the solver only needs top, boundary, meet and transfer
+  forward = True
 
-  current_block_name = get_block_name(func)
-  current_block_insts = []
+  def __init__(self, cfg: CFG) -> None:
+    self.cfg = cfg
 
-  for inst in insts:
-    if "op" in inst.keys():
-      op = inst["op"]
+  def top(self):
+    # the initial (optimistic) value of every block
+    raise NotImplementedError
 
-      if op == "br" or op == "jmp" or op == "ret":
-        current_block_insts.append(inst)
+  def boundary(self):
+    # the value flowing into the entry (forward) or out of the exits (backward)
+    raise NotImplementedError
 
-        blocks[current_block_name] = current_block_insts
+  def meet(self, left, right):
+    raise NotImplementedError
 
-        current_block_name = gen_rand_name()
-        current_block_insts = []        
-      else:
-        current_block_insts.append(inst)
+  def transfer(self, block: int, value):
+    raise NotImplementedError
 
-    elif "label" in inst.keys():
-      if current_block_insts:
-        blocks[current_block_name] = current_block_insts
+  def flow(self, source: int, target: int, value):
+    # the value along one edge, in the direction of the analysis
+    return value
 
-      current_block_name = get_block_name(inst["label"])
-      current_block_insts = [ inst ]
-    else:
-      print(f"Illegal instruction detected: {inst}")
-      exit(1)
+  def format(self, value) -> str:
+    return str(value)
 
-  if current_block_insts:
-    blocks[current_block_name] = current_block_insts
 
-  return blocks
+class BitVectorDataflow(Dataflow):
+  # gen / kill problems over bitsets stored in python ints
+  union = True
 
+  def __init__(self, cfg: CFG) -> None:
+    super().__init__(cfg)
 
-def build_cfg(blocks: dict) -> dict:
-  # label -> Node
-  cfg = {}
+    # the universe of the facts, all ones
+    self.universe = 0
 
-  for (label, insts) in blocks.items():
-    last_inst = insts[-1]
+    # block id -> bitset
+    self.gen = []
+    self.kill = []
 
-    if "op" in last_inst:
-      op = last_inst["op"]
+  def top(self) -> int:
+    return 0 if self.union else self.universe
 
-      if op == "br" or op == "jmp":
-        target_labels = last_inst["labels"]
-      elif op == "ret":
-        target_labels = []
-      else:
-        # implicit return maybe
-        target_labels = []
+  def boundary(self) -> int:
+    return 0
 
-      if label not in cfg.keys():
-        cfg[label] = Node(label, [], target_labels)
-      else:
-        cfg[label].successors = target_labels
+  def meet(self, left: int, right: int) -> int:
+    return left | right if self.union else left & right
+
+  def transfer(self, block: int, value: int) -> int:
+    return self.gen[block] | (value & ~self.kill[block])
+
+
+class DataflowResult:
+  def __init__(self, analysis: Dataflow, ins: list, outs: list) -> None:
+    self.analysis = analysis
+
+    # block id -> value at the start / end of the block (in program order)
+    self.ins = ins
+    self.outs = outs
+
+
+def solve(cfg: CFG, analysis: Dataflow) -> DataflowResult:
+  n = len(cfg)
+
+  # reverse postorder for forward problems, the reverse of it for backward ones
+  order = reverse_postorder(cfg, True)
+
+  if not analysis.forward:
+    order.reverse()
+
+  rank = [ 0 ] * n
+
+  for (position, id) in enumerate(order):
+    rank[id] = position
+
+  if analysis.forward:
+    (sources, targets) = (cfg.preds, cfg.succs)
+  else:
+    (sources, targets) = (cfg.succs, cfg.preds)
 
-      for target_label in target_labels:
-        if target_label not in cfg.keys():
-          cfg[target_label] = Node(target_label, [], [])
+  # value before / after the transfer function, in the direction of the analysis
+  before = [ analysis.top() ] * n
+  after = [ analysis.top() ] * n
 
-        target = cfg[target_label]
-        target.predecessors.append(label)
+  # priority worklist, the block earliest in the order goes first
+  work_list = list(range(n))
+  in_work_list = bytearray([ 1 ]) * n
+
+  heapq.heapify(work_list)
+
+  while work_list:
+    current = order[heapq.heappop(work_list)]
+    in_work_list[rank[current]] = 0
+
+    if (analysis.forward and current == cfg.entry) or not sources[current]:
+      value = analysis.boundary()
     else:
-      # implicit return maybe?
-      if label not in cfg.keys():
-        cfg[label] = Node(label, [], [])
+      value = None
+
+    for source in sources[current]:
+      if analysis.forward:
+        source_value = analysis.flow(source, current, after[source])
+      else:
+        source_value = analysis.flow(current, source, after[source])
+
+      value = source_value if value is None else analysis.meet(value, source_value)
+
+    before[current] = value
+    value = analysis.transfer(current, value)
+
+    if value != after[current]:
+      after[current] = value
+
+      for target in targets[current]:
+        if not in_work_list[rank[target]]:
+          in_work_list[rank[target]] = 1
+          heapq.heappush(work_list, rank[target])
+
+  if analysis.forward:
+    return DataflowResult(analysis, before, after)
+  else:
+    return DataflowResult(analysis, after, before)
+
+
+class ReachingDefinitions(BitVectorDataflow):
+  forward = True
+  union = True
+
+  def __init__(self, cfg: CFG, args: list) -> None:
+    super().__init__(cfg)
+
+    # definition id -> (block id or None for the function args, variable)
+    self.definitions = [ (None, arg) for arg in args ]
+
+    # block id -> { variable -> definition id of the last definition in it }
+    # only the last definition of a variable leaves the block
+    block_last = []
+
+    for (id, insts) in enumerate(cfg.blocks):
+      last = {}
+
+      for inst in insts:
+        if "dest" in inst:
+          last[inst["dest"]] = len(self.definitions)
+          self.definitions.append((id, inst["dest"]))
+
+      block_last.append(last)
+
+    # variable -> bitset of all the definitions of it
+    self.var_definitions = {}
+
+    for (position, (_, dest)) in enumerate(self.definitions):
+      self.var_definitions[dest] = self.var_definitions.get(dest, 0) | (1 << position)
+
+    self.universe = (1 << len(self.definitions)) - 1
+    self.arg_definitions = (1 << len(args)) - 1
+
+    # a block kills all the other definitions of what it defines
+    for last in block_last:
+      block_gen = 0
+      block_kill = 0
+
+      for (dest, position) in last.items():
+        block_gen = block_gen | (1 << position)
+        block_kill = block_kill | self.var_definitions[dest]
+
+      self.gen.append(block_gen)
+      self.kill.append(block_kill)
+
+  def boundary(self) -> int:
+    return self.arg_definitions
+
+  def format(self, value: int) -> str:
+    names = []
+
+    for position in bit_positions(value):
+      (block, dest) = self.definitions[position]
+      names.append(f'{dest}@{"args" if block is None else self.cfg.names[block]}')
+
+    return str(sorted(names))
+
+
+class LiveVariables(BitVectorDataflow):
+  forward = False
+  union = True
+
+  def __init__(self, cfg: CFG) -> None:
+    super().__init__(cfg)
+
+    self.variables = Variables()
+
+    # block id -> { pred block id -> bitset of the variables the phis read }
+    # a phi reads its argument at the end of the predecessor, not in the block
+    self.phi_uses = [ {} for _ in range(len(cfg)) ]
+
+    for (id, insts) in enumerate(cfg.blocks):
+      # read before being written / written
+      block_gen = 0
+      block_kill = 0
+
+      for inst in insts:
+        if inst.get("op") == "phi":
+          for (arg, label) in zip(inst.get("args", []), inst.get("labels", [])):
+            if label in cfg.index:
+              pred = cfg.index[label]
+              self.phi_uses[id][pred] = self.phi_uses[id].get(pred, 0) | self.variables.bit(arg)
+        elif "args" in inst:
+          for arg in inst["args"]:
+            arg_bit = self.variables.bit(arg)
+
+            if not block_kill & arg_bit:
+              block_gen = block_gen | arg_bit
+
+        if "dest" in inst:
+          block_kill = block_kill | self.variables.bit(inst["dest"])
+
+      self.gen.append(block_gen)
+      self.kill.append(block_kill)
+
+    self.universe = (1 << len(self.variables.names)) - 1
+
+  def flow(self, source: int, target: int, value: int) -> int:
+    return value | self.phi_uses[target].get(source, 0)
+
+  def format(self, value: int) -> str:
+    return str(self.variables.to_names(value))
+
+
+def expression_key(inst: dict) -> tuple:
+  op = inst["op"]
+  args = inst.get("args", [])
 
-  return cfg
+  if op in COMMUTATIVE_OPS:
+    args = sorted(args)
 
+  return (op, *args)
 
-def find_all_blocks_which_ret(cfg: dict) -> list:
-  blocks_ret = []
 
-  for (label, node) in cfg.items():
-    if 0 == len(node.successors):
-      blocks_ret.append(label)
+class AvailableExpressions(BitVectorDataflow):
+  forward = True
+  union = False
 
-  return blocks_ret
+  def __init__(self, cfg: CFG) -> None:
+    super().__init__(cfg)
 
+    # bit position -> (op, *args)
+    self.expressions = []
 
-def live_variables_analysis(cfg: dict, blocks: dict):
-  total_uses = {}
+    # (op, *args) -> bit position
+    self.index = {}
 
-  work_list = find_all_blocks_which_ret(cfg)
+    # variable -> bitset of the expressions reading it
+    self.readers = {}
 
-  print(f'work_list: {work_list}')
+    # block id -> [(expression bit position or None, dest or None)]
+    block_effects = []
 
-  while True:
-    if 0 == len(work_list):
-      break
+    for insts in cfg.blocks:
+      effects = []
 
-    current_label = work_list.pop(0)
-    current_node = cfg[current_label]
+      for inst in insts:
+        position = None
 
-    for pred in current_node.predecessors:
-      if pred not in work_list:
-        work_list.append(pred)
+        if inst.get("op") in PURE_OPS and inst["op"] != "id" and "args" in inst:
+          key = expression_key(inst)
 
-    uses = []
+          if key not in self.index:
+            self.index[key] = len(self.expressions)
+            self.expressions.append(key)
 
-    for inst in blocks[current_label]:
-      uses.extend(inst["args"] if "args" in inst else [])
+            for arg in inst["args"]:
+              self.readers[arg] = self.readers.get(arg, 0) | (1 << self.index[key])
 
-    final_uses = []
+          position = self.index[key]
 
-    final_uses.extend(uses)
+        effects.append((position, inst.get("dest")))
 
-    for successor in current_node.successors:
-      if successor not in total_uses.keys():
-        print("error in the algorithm")
-        exit(1)
+      block_effects.append(effects)
+
+    self.universe = (1 << len(self.expressions)) - 1
+
+    for effects in block_effects:
+      block_gen = 0
+      block_kill = 0
+
+      for (position, dest) in effects:
+        if position is not None:
+          block_gen = block_gen | (1 << position)
+
+        if dest is not None:
+          # redefining an argument invalidates the expression
+          readers = self.readers.get(dest, 0)
+
+          block_gen = block_gen & ~readers
+          block_kill = block_kill | readers
+
+      self.gen.append(block_gen)
+      self.kill.append(block_kill)
+
+  def format(self, value: int) -> str:
+    return str(sorted([ " ".join(self.expressions[position])
+                        for position in bit_positions(value) ]))
+
+
+class ConstantPropagation(Dataflow):
+  # value: (bitset of the variables which are not constant,
+  #         bitset of the variables which are constant,
+  #         planes)
+  # the constants of every variable are numbered, plane j holds bit j
+  # of the number for each constant variable. variables which are
+  # neither are not defined yet (top)
+  forward = True
+
+  def __init__(self, cfg: CFG, args: list) -> None:
+    super().__init__(cfg)
+
+    self.variables = Variables()
+    self.arg_bits = 0
+
+    for arg in args:
+      self.arg_bits = self.arg_bits | self.variables.bit(arg)
+
+    # variable bit position -> [constant], the index is the number
+    self.constants = {}
+
+    # variable bit position -> { constant_key of the constant -> number }
+    self.numbers = {}
+
+    # block id -> [(dest bit position, op, const value, [arg bit positions])]
+    # for the instructions with a dest
+    self.block_defs = []
+
+    for insts in cfg.blocks:
+      defs = []
+
+      for inst in insts:
+        if "dest" in inst:
+          defs.append((self.variables.intern(inst["dest"]), inst.get("op"), inst.get("value"),
+                       [ self.variables.intern(arg) for arg in inst.get("args", []) ]))
+
+      self.block_defs.append(defs)
+
+  def number(self, position: int, constant) -> int:
+    numbers = self.numbers.setdefault(position, {})
+    key = constant_key(constant)
+
+    if key not in numbers:
+      numbers[key] = len(numbers)
+      self.constants.setdefault(position, []).append(constant)
+
+    return numbers[key]
+
+  def top(self) -> tuple:
+    return (0, 0, ())
+
+  def boundary(self) -> tuple:
+    return (self.arg_bits, 0, ())
+
+  def meet(self, left: tuple, right: tuple) -> tuple:
+    (left_nac, left_known, left_planes) = left
+    (right_nac, right_known, right_planes) = right
+
+    width = max(len(left_planes), len(right_planes))
+    left_planes = left_planes + (0,) * (width - len(left_planes))
+    right_planes = right_planes + (0,) * (width - len(right_planes))
+
+    differ = 0
+
+    for (left_plane, right_plane) in zip(left_planes, right_planes):
+      differ = differ | (left_plane ^ right_plane)
+
+    # known on both sides but as different constants
+    nac = left_nac | right_nac | (left_known & right_known & differ)
+    known = (left_known | right_known) & ~nac
+
+    return trim_planes(nac, known, [ (left_plane | right_plane) & known
+                                     for (left_plane, right_plane) in zip(left_planes, right_planes) ])
+
+  def constant(self, value: tuple, name: str):
+    (_, known, planes) = value
+
+    return self.planes_constant(known, planes, self.variables.intern(name))
+
+  def planes_constant(self, known: int, planes, position: int):
+    if not known & (1 << position):
+      # not constant, or not defined on this path
+      return None
+
+    number = 0
+
+    for (j, plane) in enumerate(planes):
+      number = number | (((plane >> position) & 1) << j)
+
+    return self.constants[position][number]
+
+  def transfer(self, block: int, value: tuple) -> tuple:
+    (nac, known, planes) = value
+    planes = list(planes)
+
+    for (position, op, const_value, arg_positions) in self.block_defs[block]:
+      result = None
+
+      if op == "const":
+        result = const_value
+      elif op == "id" or op == "phi" or op in PURE_OPS:
+        arg_values = [ self.planes_constant(known, planes, arg_position)
+                       for arg_position in arg_positions ]
+
+        if all([ arg_value is not None for arg_value in arg_values ]):
+          if op == "id":
+            result = arg_values[0]
+          elif op == "phi":
+            if arg_values and all([ arg_value == arg_values[0] for arg_value in arg_values ]):
+              result = arg_values[0]
+          else:
+            result = evaluate(op, arg_values)
+
+      bit = 1 << position
+
+      if result is None:
+        nac = nac | bit
+        known = known & ~bit
+        number = 0
       else:
-        final_uses.extend(total_uses[successor])
+        nac = nac & ~bit
+        known = known | bit
+        number = self.number(position, result)
 
-    total_uses[current_label] = final_uses
+        while len(planes) < number.bit_length():
+          planes.append(0)
 
-  return total_uses
+      for j in range(len(planes)):
+        if (number >> j) & 1:
+          planes[j] = planes[j] | bit
+        elif planes[j] & bit:
+          planes[j] = planes[j] & ~bit
 
+    return trim_planes(nac, known, planes)
 
-def analyze(program: dict) -> None:
-  for function in program["functions"]:
-    blocks = blockify(function["instrs"], function["name"])
-    cfg = build_cfg(blocks)
-    lv = live_variables_analysis(cfg, blocks)
+  def format(self, value: tuple) -> str:
+    (nac, known, _) = value
+    names = [ f'{self.variables.names[position]}=?' for position in bit_positions(nac) ]
+
+    for position in bit_positions(known):
+      name = self.variables.names[position]
+      names.append(f'{name}={self.constant(value, name)}')
+
+    return str(sorted(names))
 
-    print('')
 
-    for (label, node) in cfg.items():
-      assert label == node.name
-      print(f'{label} -->')
-      print(f'pred: {node.predecessors}')
-      print(f'succ: {node.successors}')
-      print('---------------------------------------')
+def trim_planes(nac: int, known: int, planes: list) -> tuple:
+  # no trailing empty planes, so equal values compare equal
+  while planes and 0 == planes[-1]:
+    planes.pop()
+
+  return (nac, known, tuple(planes))
+
+
+def live_variables_analysis(cfg: CFG) -> DataflowResult:
+  # kept with the graph until it's instructions change
+  if "live variables" not in cfg.analyses:
+    cfg.analyses["live variables"] = solve(cfg, LiveVariables(cfg))
+
+  return cfg.analyses["live variables"]
+
+
+def analyze_function(function: dict) -> None:
+  cfg = build_cfg(function)
+  args = function_args(function)
+
+  print('')
+
+  for (id, label) in enumerate(cfg.names):
+    print(f'{label} -->')
+    print(f'pred: {[ cfg.names[pred] for pred in cfg.preds[id] ]}')
+    print(f'succ: {[ cfg.names[succ] for succ in cfg.succs[id] ]}')
+    print('---------------------------------------')
+
+  analyses = [ ("reaching definitions", ReachingDefinitions(cfg, args)),
+               ("live variables", LiveVariables(cfg)),
+               ("available expressions", AvailableExpressions(cfg)),
+               ("constant propagation", ConstantPropagation(cfg, args)) ]
+
+  for (title, analysis) in analyses:
+    result = solve(cfg, analysis)
 
     print('')
+    print(f'{title}:')
 
-    for (label, _) in blocks.items():
-      if label in lv.keys():
-        print(f'{label}:\t {set(lv[label])}')
-      else:
-        # not all labels are necessarily be present
-        # some labels might not have any instructions
-        # and be empty
-        print(f'{label}: not found')
+    for (id, label) in enumerate(cfg.names):
+      print(f'{label}:\t in: {analysis.format(result.ins[id])}')
+      print(f'{" " * len(label)} \t out: {analysis.format(result.outs[id])}')
+
+
+def analyze(program: dict, jobs: int = 1) -> None:
+  report_functions(analyze_function, jobs, program["functions"])
 
 
 if __name__ == "__main__":
@@ -183,6 +540,8 @@ if __name__ == "__main__":
 
   assert sys.version_info >= (3, 7)
 
-  with open(sys.argv[1]) as source:
-    program = json.load(source)
-    analyze(program)
+  args = parse_args("dataflow analyses")
+
+  with open_program(args.program) as source:
+    program = load_program(source)
+    analyze(program, args.jobs)
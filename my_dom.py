@@ -1,241 +1,400 @@
 import sys
-import time
 import json
+import functools
 
+from my_cfg import CFG, build_cfg, reverse_postorder
+from my_dfa import bit_positions
+from my_parallel import parse_args, report_functions
+from my_stream import load_program, open_program
 
-GENERATED_BLOCK_NAME_PERFIX = 'r'
 
+# no immediate dominator: the entry and the unreachable blocks
+NO_IDOM = -1
 
-class Node:
-  def __init__(self, name: str,
-               predecessors: list,
-               successors: list) -> None:
-    # name of this basic block
-    self.name = name
 
-    # labels of the basic blocks
-    self.predecessors = predecessors
-    self.successors = successors
+class Dominators:
+  def __init__(self, cfg: CFG, idom: list) -> None:
+    self.cfg = cfg
 
+    # block id -> immediate dominator block id (or NO_IDOM)
+    self.idom = idom
 
-def gen_rand_name() -> str:
-  t = time.time()
-  return f'{GENERATED_BLOCK_NAME_PERFIX}_{t}'
+    # block id -> [block id] immediately dominated by it
+    self.children = [ [] for _ in range(len(cfg)) ]
 
+    for (node, dominator) in enumerate(idom):
+      if dominator != NO_IDOM:
+        self.children[dominator].append(node)
 
-def get_block_name(label: str) -> str:
-  return label
+    # block id -> pre / post order number in the dominator tree,
+    # a dominates b iff b's interval is inside a's
+    self.pre = [ -1 ] * len(cfg)
+    self.post = [ -1 ] * len(cfg)
 
+    # reachable block ids in dominator tree preorder
+    self.preorder = []
 
-def blockify(insts: list, func: str) -> dict:
-  blocks = {}
+    if 0 == len(cfg):
+      return
 
-  current_block_name = get_block_name(func)
-  current_block_insts = []
+    counter = 0
+    stack = [ (cfg.entry, 0) ]
 
-  for inst in insts:
-    if "op" in inst.keys():
-      op = inst["op"]
+    self.pre[cfg.entry] = 0
+    self.preorder.append(cfg.entry)
 
-      if op == "br" or op == "jmp" or op == "ret":
-        current_block_insts.append(inst)
+    while stack:
+      (node, next_child) = stack[-1]
 
-        blocks[current_block_name] = current_block_insts
+      if next_child < len(self.children[node]):
+        stack[-1] = (node, next_child + 1)
+        child = self.children[node][next_child]
 
-        current_block_name = gen_rand_name()
-        current_block_insts = []        
+        self.pre[child] = len(self.preorder)
+        self.preorder.append(child)
+        stack.append((child, 0))
       else:
-        current_block_insts.append(inst)
+        stack.pop()
+        self.post[node] = counter
+        counter = counter + 1
 
-    elif "label" in inst.keys():
-      if current_block_insts:
-        blocks[current_block_name] = current_block_insts
+  def reachable(self, node: int) -> bool:
+    return -1 != self.pre[node]
 
-      current_block_name = get_block_name(inst["label"])
-      current_block_insts = [ inst ]
-    else:
-      print(f"Illegal instruction detected: {inst}")
-      exit(1)
+  def dominates(self, a: int, b: int) -> bool:
+    if not self.reachable(a) or not self.reachable(b):
+      # only a block dominates itself in the dead code
+      return a == b
 
-  if current_block_insts:
-    blocks[current_block_name] = current_block_insts
+    return self.pre[a] <= self.pre[b] and self.post[b] <= self.post[a]
 
-  return blocks
+  def strictly_dominates(self, a: int, b: int) -> bool:
+    return a != b and self.dominates(a, b)
 
+  def dominators(self, node: int) -> list:
+    # node and everything above it in the tree
+    dominators = [ node ]
 
-def build_cfg(blocks: dict) -> dict:
-  # label -> Node
-  cfg = {}
+    while self.idom[node] != NO_IDOM:
+      node = self.idom[node]
+      dominators.append(node)
 
-  blocks = list(blocks.items())
+    return dominators
 
-  for (block_idx, (label, insts)) in enumerate(blocks):
-    last_inst = insts[-1]
 
-    if "op" in last_inst:
-      op = last_inst["op"]
+def cooper_harvey_kennedy(cfg: CFG) -> list:
+  # "A Simple, Fast Dominance Algorithm", iterates over reverse postorder
+  # and walks the partial tree up to the common ancestor of the preds
+  idom = [ NO_IDOM ] * len(cfg)
 
-      if op == "br" or op == "jmp":
-        target_labels = last_inst["labels"]
-      elif op == "ret":
-        target_labels = []
-      else:
-        # flows to the next block implicitly
+  if 0 == len(cfg):
+    return idom
 
-        if block_idx + 1 < len(blocks):
-          target_labels = [ blocks[block_idx + 1][0] ]
-        else:
-          target_labels = []
+  order = reverse_postorder(cfg)
+  rank = [ len(cfg) ] * len(cfg)
 
-      if label not in cfg.keys():
-        cfg[label] = Node(label, [], target_labels)
-      else:
-        cfg[label].successors = target_labels
+  for (position, node) in enumerate(order):
+    rank[node] = position
+
+  def intersect(a: int, b: int) -> int:
+    while a != b:
+      while rank[a] > rank[b]:
+        a = idom[a]
+
+      while rank[b] > rank[a]:
+        b = idom[b]
+
+    return a
+
+  idom[cfg.entry] = cfg.entry
+  changed = True
+
+  while changed:
+    changed = False
+
+    for node in order[1:]:
+      new_idom = NO_IDOM
+
+      for pred in cfg.preds[node]:
+        if idom[pred] == NO_IDOM:
+          # not processed yet, or unreachable
+          continue
+
+        new_idom = pred if new_idom == NO_IDOM else intersect(pred, new_idom)
+
+      if idom[node] != new_idom:
+        idom[node] = new_idom
+        changed = True
+
+  idom[cfg.entry] = NO_IDOM
+
+  return idom
+
+
+def lengauer_tarjan(cfg: CFG) -> list:
+  # the semidominator algorithm with path compression, O(e log n)
+  # no matter how the graph looks. everything is iterative
+  n = len(cfg)
+  idom = [ NO_IDOM ] * n
 
-      for target_label in target_labels:
-        if target_label not in cfg.keys():
-          cfg[target_label] = Node(target_label, [], [])
+  if 0 == n:
+    return idom
 
-        target = cfg[target_label]
-        target.predecessors.append(label)
+  # dfs number -> block id, block id -> dfs number
+  vertex = []
+  number = [ -1 ] * n
+
+  # by dfs number
+  parent = []
+
+  number[cfg.entry] = 0
+  vertex.append(cfg.entry)
+  parent.append(-1)
+  stack = [ (cfg.entry, 0) ]
+
+  while stack:
+    (node, next_succ) = stack[-1]
+    succs = cfg.succs[node]
+
+    if next_succ < len(succs):
+      stack[-1] = (node, next_succ + 1)
+      succ = succs[next_succ]
+
+      if -1 == number[succ]:
+        number[succ] = len(vertex)
+        vertex.append(succ)
+        parent.append(number[node])
+        stack.append((succ, 0))
     else:
-      # implicit return maybe?
-      if label not in cfg.keys():
-        cfg[label] = Node(label, [], [])
+      stack.pop()
+
+  count = len(vertex)
+
+  # all by dfs number
+  semi = list(range(count))
+  label = list(range(count))
+  ancestor = [ -1 ] * count
+  dom = [ 0 ] * count
+  bucket = [ [] for _ in range(count) ]
+
+  def compress(v: int) -> None:
+    path = []
+
+    while -1 != ancestor[ancestor[v]]:
+      path.append(v)
+      v = ancestor[v]
+
+    while path:
+      v = path.pop()
+      a = ancestor[v]
+
+      if semi[label[a]] < semi[label[v]]:
+        label[v] = label[a]
+
+      ancestor[v] = ancestor[a]
+
+  def evaluate(v: int) -> int:
+    if -1 == ancestor[v]:
+      return v
+
+    compress(v)
+
+    return label[v]
 
-  return cfg
+  for w in range(count - 1, 0, -1):
+    for pred in cfg.preds[vertex[w]]:
+      v = number[pred]
 
+      if -1 == v:
+        # unreachable pred
+        continue
 
-def find_dominators(node: str, cfg: dict, strict_dominators: set) -> str:
-  prev_node = None
-  current_node = node
+      u = evaluate(v)
 
-  dominator = None
+      if semi[u] < semi[w]:
+        semi[w] = semi[u]
 
-  seen = set()
+    bucket[semi[w]].append(w)
+    ancestor[w] = parent[w]
 
-  while prev_node != current_node:
-    # print(f'{current_node}')
-    pred = current_node
+    for v in bucket[parent[w]]:
+      u = evaluate(v)
+      dom[v] = u if semi[u] < semi[v] else parent[w]
 
-    if current_node in seen:
-      break
+    bucket[parent[w]] = []
 
-    if 0 != len(cfg[current_node].predecessors):
-      found = False
+  for w in range(1, count):
+    if dom[w] != semi[w]:
+      dom[w] = dom[dom[w]]
 
-      for pred in cfg[current_node].predecessors:
-        if pred in strict_dominators:
-          dominator = pred
-          found = True
+    idom[vertex[w]] = vertex[dom[w]]
 
-      if found:
-        break
+  return idom
 
-    seen.add(current_node)
 
-    prev_node = current_node
-    current_node = pred
+ALGORITHMS = {
+  "chk": cooper_harvey_kennedy,
+  "lt": lengauer_tarjan,
+}
 
-  return dominator
 
+def compute_dominators(cfg: CFG, algorithm: str = "chk") -> Dominators:
+  # kept with the graph, the passes after the one computing it
+  # get the same tree as long as the edges stay the same
+  key = ("dominators", algorithm)
 
-def build_dom(blocks: dict, cfg: dict) -> None:
-  # block_label -> (dominators)
-  dom = {}
-  current_dom = {}
+  if key not in cfg.edge_analyses:
+    cfg.edge_analyses[key] = Dominators(cfg, ALGORITHMS[algorithm](cfg))
 
-  # initialize dom with all blocks for each block
-  all_blocks = set()
+  return cfg.edge_analyses[key]
 
-  for (label, _) in blocks.items():
-    all_blocks.add(label)
 
-  for (label, _) in blocks.items():
-    current_dom[label] = set(all_blocks)
+def dominance_frontiers(doms: Dominators) -> list:
+  # block id -> bitset of block ids, cooper-harvey-kennedy's runners: from
+  # every pred of a join point walk up the tree until the join's idom
+  cfg = doms.cfg
+  frontiers = [ 0 ] * len(cfg)
 
-  while dom != current_dom:
-    dom = {}
+  for join in range(len(cfg)):
+    if len(cfg.preds[join]) < 2 or not doms.reachable(join):
+      continue
 
-    for (node_label, dominators) in current_dom.items():
-      dom[node_label] = set(dominators)
+    join_bit = 1 << join
 
-    for (node_label, node) in cfg.items():
-      dom_entry = set()
+    for pred in cfg.preds[join]:
+      if not doms.reachable(pred):
+        continue
 
-      # get the union of all preds
-      for pred in node.predecessors:
-        dom_entry = dom_entry.union(current_dom[pred])
+      runner = pred
 
-      # now get the intersection
-      for pred in node.predecessors:
-        dom_entry = dom_entry.intersection(current_dom[pred])
+      while runner != doms.idom[join] and runner != NO_IDOM:
+        frontiers[runner] = frontiers[runner] | join_bit
+        runner = doms.idom[runner]
 
-      dom_entry.add(node_label)
+  return frontiers
 
-      current_dom[node_label] = dom_entry
+
+def iterated_dominance_frontier(frontiers: list, blocks: list) -> list:
+  # DF+ of the blocks, i.e. where the phis for variables defined in those
+  # blocks go. block ids in increasing order. a frontier is merged in with
+  # one or and the blocks new to the result are the only ones looked at again
+  result = 0
+  seen = 0
+
+  for block in blocks:
+    seen = seen | (1 << block)
+
+  work_list = list(set(blocks))
+
+  while work_list:
+    block = work_list.pop()
+    new = frontiers[block] & ~result
+
+    if not new:
+      continue
+
+    result = result | new
+
+    for join in bit_positions(new & ~seen):
+      work_list.append(join)
+
+    seen = seen | new
+
+  return bit_positions(result)
+
+
+class Loop:
+  def __init__(self, header: int) -> None:
+    self.header = header
+
+    # block ids of the loop, the header included
+    self.body = { header }
+
+    # block ids with a back edge to the header
+    self.latches = []
+
+
+def natural_loops(doms: Dominators) -> list:
+  # an edge to a block dominating it's source is a back edge, the loop is
+  # everything reaching the source without going through the header.
+  # back edges to the same header make one loop. smaller loops come
+  # first, so a nested loop is always before the loops around it
+  cfg = doms.cfg
+  loops = {}
+
+  for source in doms.preorder:
+    for target in cfg.succs[source]:
+      if not doms.dominates(target, source):
+        continue
+
+      loop = loops.setdefault(target, Loop(target))
+      loop.latches.append(source)
+
+      work_list = [ source ]
+
+      while work_list:
+        node = work_list.pop()
+
+        if node in loop.body:
+          continue
+
+        loop.body.add(node)
+        work_list.extend([ pred for pred in cfg.preds[node] if doms.reachable(pred) ])
+
+  return sorted(loops.values(), key=lambda loop: (len(loop.body), doms.pre[loop.header]))
+
+
+def build_dom(cfg: CFG, algorithm: str = "chk") -> None:
+  doms = compute_dominators(cfg, algorithm)
 
   print('')
   print('dominators:')
 
   # printing the dominators of each block
-  for (master, slaves) in dom.items():
-    slaves = list(slaves)
-    slaves.sort()
+  for node in range(len(cfg)):
+    dominators = [ cfg.names[dominator] for dominator in doms.dominators(node) ]
+    dominators.sort()
 
-    print(f'{master}: \t\t{", ".join(slaves)}')
+    print(f'{cfg.names[node]}: \t\t{", ".join(dominators)}')
 
   print('')
   print('dominance tree:')
 
-  # building the dominator tree
-  dom_tree = {}
-
-  for (node_label, dominators) in dom.items():
-    strict_dominators = set(dominators)
-
-    strict_dominators.remove(node_label)
-
-    dom_tree[node_label] = find_dominators(node_label, cfg, strict_dominators)
-
-  for (node, dominator) in dom_tree.items():
-    print(f'{node}: \t\t{dominator}')
+  for (node, dominator) in enumerate(doms.idom):
+    print(f'{cfg.names[node]}: \t\t{None if dominator == NO_IDOM else cfg.names[dominator]}')
 
   print('')
   print('dominance frontier:')
 
-  # building the dominance frontier
-  dom_frontier = {}
-
-  for (node_label, dominators) in dom.items():
+  dom_frontier = dominance_frontiers(doms)
 
-    frontier = []
+  for (node, frontier) in enumerate(dom_frontier):
+    print(f'{cfg.names[node]}: \t\t{[ cfg.names[id] for id in bit_positions(frontier) ]}')
 
-    for succ in cfg[node_label].successors:
-      strict_dominators = set(dom[succ])
 
-      strict_dominators.remove(succ)
+def build_function_dom_tree(function: dict, algorithm: str = "chk") -> None:
+  cfg = build_cfg(function)
 
-      if node_label != find_dominators(succ, cfg, strict_dominators):
-        frontier.append(succ)
+  for (id, label) in enumerate(cfg.names):
+    preds = [ cfg.names[pred] for pred in cfg.preds[id] ]
+    succs = [ cfg.names[succ] for succ in cfg.succs[id] ]
 
-    dom_frontier[node_label] = frontier
+    print(f'{label}  <- ({preds}) -> ({succs})')
 
-  for (node, frontier) in dom_frontier.items():
-    print(f'{node}: \t\t{frontier}')
+  print("")
 
+  build_dom(cfg, algorithm)
 
-def build_dom_tree(program: dict) -> None:
-  for function in program["functions"]:
-    blocks = blockify(function["instrs"], function["name"])
-    cfg = build_cfg(blocks)
 
-    for (node_label, node) in cfg.items():
-      print(f'{node_label}  <- ({node.predecessors}) -> ({node.successors})')
+def build_dom_tree(program: dict, jobs: int = 1, algorithm: str = "chk") -> None:
+  report_functions(functools.partial(build_function_dom_tree, algorithm=algorithm),
+                   jobs, program["functions"])
 
-    print("")
 
-    build_dom(blocks, cfg)
+def add_options(parser) -> None:
+  parser.add_argument("-a", "--algorithm", choices=sorted(ALGORITHMS.keys()), default="chk",
+                      help="cooper-harvey-kennedy (chk) or lengauer-tarjan (lt), "
+                           "the latter for huge graphs")
 
 
 if __name__ == "__main__":
@@ -245,6 +404,8 @@ if __name__ == "__main__":
 
   assert sys.version_info >= (3, 7)
 
-  with open(sys.argv[1]) as source:
-    program = json.load(source)
-    build_dom_tree(program)
+  args = parse_args("dominators, dominator tree and dominance frontier", add_options)
+
+  with open_program(args.program) as source:
+    program = load_program(source)
+    build_dom_tree(program, args.jobs, args.algorithm)
@@ -0,0 +1,274 @@
+import sys
+import json
+
+from my_dce import optimize_function
+from my_parallel import map_functions, parse_args
+from my_stream import load_program, open_program
+from my_ssa import Versions
+
+
+# callees with at most this many instructions are inlined at every call site
+SMALL_FUNCTION = 24
+
+# no function grows past this many instructions by inlining into it
+INSTRUCTION_BUDGET = 2000
+
+
+class CallGraph:
+  def __init__(self, functions: list) -> None:
+    # function name -> function
+    self.functions = { function["name"]: function for function in functions }
+
+    # function name -> [callee name], every callee once, in the order of the calls
+    self.callees = {}
+
+    # function name -> number of call instructions calling it
+    self.call_sites = { name: 0 for name in self.functions }
+
+    for function in functions:
+      callees = []
+
+      for inst in function["instrs"]:
+        if inst.get("op") != "call" or not inst.get("funcs"):
+          continue
+
+        callee = inst["funcs"][0]
+
+        if callee in self.call_sites:
+          self.call_sites[callee] = self.call_sites[callee] + 1
+          callees.append(callee)
+
+      self.callees[function["name"]] = list(dict.fromkeys(callees))
+
+    # function name -> strongly connected component number,
+    # the components are numbered callees first
+    self.component = {}
+
+    # function names calling themselves, directly or not
+    self.recursive = set()
+
+    for names in self.bottom_up():
+      for name in names:
+        self.component[name] = len(self.component)
+
+      if 1 < len(names) or names[0] in self.callees[names[0]]:
+        self.recursive.update(names)
+
+  def bottom_up(self) -> list:
+    # tarjan's strongly connected components, iterative. a component comes
+    # out after every component it calls into, so callees come first
+    components = []
+
+    number = {}
+    low = {}
+    stack = []
+    on_stack = set()
+
+    for root in self.functions:
+      if root in number:
+        continue
+
+      number[root] = low[root] = len(number)
+      stack.append(root)
+      on_stack.add(root)
+      work_list = [ (root, 0) ]
+
+      while work_list:
+        (name, next_callee) = work_list[-1]
+        callees = self.callees[name]
+
+        if next_callee < len(callees):
+          work_list[-1] = (name, next_callee + 1)
+          callee = callees[next_callee]
+
+          if callee not in number:
+            number[callee] = low[callee] = len(number)
+            stack.append(callee)
+            on_stack.add(callee)
+            work_list.append((callee, 0))
+          elif callee in on_stack:
+            low[name] = min(low[name], number[callee])
+
+          continue
+
+        work_list.pop()
+
+        if work_list:
+          caller = work_list[-1][0]
+          low[caller] = min(low[caller], low[name])
+
+        if low[name] == number[name]:
+          names = []
+
+          while True:
+            member = stack.pop()
+            on_stack.discard(member)
+            names.append(member)
+
+            if member == name:
+              break
+
+          components.append(names)
+
+    return components
+
+
+def variables_of(instrs: list) -> set:
+  variables = set()
+
+  for inst in instrs:
+    variables.update(inst.get("args", []))
+
+    if "dest" in inst:
+      variables.add(inst["dest"])
+
+  return variables
+
+
+def inline_call(call: dict, callee: dict, variables: Versions, labels: Versions) -> list:
+  # the instructions replacing the call: the params get the arguments,
+  # the body follows with every variable and label renamed, and each
+  # ret becomes a copy to the call's dest and a jump past the body
+  name = callee["name"]
+  params = callee.get("args", [])
+
+  renamed = {}
+
+  for var in [ param["name"] for param in params ] + sorted(variables_of(callee["instrs"])):
+    if var not in renamed:
+      renamed[var] = variables.fresh(f'{name}_{var}')
+
+  relabeled = { inst["label"]: labels.fresh(f'{name}_{inst["label"]}')
+                for inst in callee["instrs"] if "label" in inst }
+
+  done = labels.fresh(f'{name}_return')
+
+  insts = [ { "op": "id", "dest": renamed[param["name"]], "type": param["type"], "args": [ arg ] }
+            for (param, arg) in zip(params, call.get("args", [])) ]
+
+  body = callee["instrs"]
+
+  for (position, inst) in enumerate(body):
+    if "label" in inst:
+      insts.append({ "label": relabeled[inst["label"]] })
+      continue
+
+    inst = dict(inst)
+
+    if "args" in inst:
+      inst["args"] = [ renamed[arg] for arg in inst["args"] ]
+
+    if "dest" in inst:
+      inst["dest"] = renamed[inst["dest"]]
+
+    if "labels" in inst:
+      inst["labels"] = [ relabeled.get(label, label) for label in inst["labels"] ]
+
+    if inst.get("op") != "ret":
+      insts.append(inst)
+      continue
+
+    if "dest" in call and inst.get("args"):
+      insts.append({ "op": "id", "dest": call["dest"], "type": call["type"], "args": inst["args"] })
+
+    if position + 1 < len(body):
+      # the last ret falls through to the end anyway
+      insts.append({ "op": "jmp", "labels": [ done ] })
+
+  insts.append({ "label": done })
+
+  return insts
+
+
+def inline_program(program: dict, budget: int = INSTRUCTION_BUDGET,
+                   small: int = SMALL_FUNCTION) -> tuple:
+  # callees are done before their callers, so what gets inlined already has
+  # it's own calls inlined. a call is inlined when the callee is small or
+  # this is the only call to it, the callee is not recursive and the caller
+  # stays within the budget. returns (program, function name -> calls inlined)
+  graph = CallGraph(program["functions"])
+  functions = dict(graph.functions)
+
+  inlined = { name: 0 for name in functions }
+
+  for names in graph.bottom_up():
+    for name in names:
+      function = functions[name]
+
+      if not any([ inst.get("op") == "call" for inst in function["instrs"] ]):
+        continue
+
+      instrs = function["instrs"]
+      size = len(instrs)
+
+      variables = Versions(variables_of(instrs) | set([ arg["name"] for arg in function.get("args", []) ]))
+      labels = Versions(set([ inst["label"] for inst in instrs if "label" in inst ] + [ name ]))
+
+      new_instrs = []
+
+      for inst in instrs:
+        callee = functions.get(inst["funcs"][0]) if inst.get("op") == "call" and inst.get("funcs") else None
+
+        if callee is None or callee["name"] in graph.recursive \
+           or len(callee.get("args", [])) != len(inst.get("args", [])) \
+           or (len(callee["instrs"]) > small and 1 != graph.call_sites[callee["name"]]) \
+           or size + len(callee["instrs"]) > budget:
+          new_instrs.append(inst)
+          continue
+
+        new_instrs.extend(inline_call(inst, callee, variables, labels))
+
+        size = size + len(callee["instrs"])
+        inlined[name] = inlined[name] + 1
+
+      if inlined[name]:
+        function = dict(function)
+        function["instrs"] = new_instrs
+        functions[name] = function
+
+  new_program = {}
+  new_program["functions"] = [ functions[function["name"]] for function in program["functions"] ]
+
+  return (new_program, inlined)
+
+
+def inline(program: dict, jobs: int = 1, budget: int = INSTRUCTION_BUDGET,
+           small: int = SMALL_FUNCTION) -> dict:
+  (program, inlined) = inline_program(program, budget, small)
+
+  # the functions which got calls inlined are cleaned up, the copies
+  # of the arguments and return values mostly go away
+  changed = [ function for function in program["functions"] if inlined[function["name"]] ]
+  cleaned = dict(zip([ function["name"] for function in changed ],
+                     map_functions(optimize_function, jobs, changed)))
+
+  for function in program["functions"]:
+    if inlined[function["name"]]:
+      print(f'{function["name"]}: {inlined[function["name"]]} calls inlined', file=sys.stderr)
+
+  new_program = {}
+  new_program["functions"] = [ cleaned.get(function["name"], function) for function in program["functions"] ]
+
+  return new_program
+
+
+def add_options(parser) -> None:
+  parser.add_argument("-b", "--budget", type=int, default=INSTRUCTION_BUDGET,
+                      help="number of instructions a function may grow to by inlining")
+  parser.add_argument("-s", "--small", type=int, default=SMALL_FUNCTION,
+                      help="callees up to this many instructions are inlined at every call site")
+
+
+if __name__ == "__main__":
+  # Python dictionary beign used is expected
+  # in the ordered fashion, which is a feature
+  # in python 3.7 and above
+
+  assert sys.version_info >= (3, 7)
+
+  args = parse_args("function inlining", add_options)
+
+  with open_program(args.program) as source:
+    program = load_program(source)
+
+    print(json.dumps(inline(program, args.jobs, args.budget, args.small)))
@@ -0,0 +1,183 @@
+import sys
+import json
+
+from my_cfg import build_cfg
+from my_dfa import live_variables_analysis
+from my_inline import CallGraph
+from my_parallel import parse_args
+from my_stream import load_program, open_program
+
+
+def reachable_functions(graph: CallGraph, root: str = "main") -> set:
+  # function names the root can end up calling, the root included
+  if root not in graph.functions:
+    return set()
+
+  reached = { root }
+  work_list = [ root ]
+
+  while work_list:
+    for callee in graph.callees[work_list.pop()]:
+      if callee not in reached:
+        reached.add(callee)
+        work_list.append(callee)
+
+  return reached
+
+
+def liveness(function: dict) -> tuple:
+  # (names of the params read before being written,
+  #  ids of the call instructions whose result nobody reads)
+  cfg = build_cfg(function)
+  result = live_variables_analysis(cfg)
+  variables = result.analysis.variables
+
+  def is_live(bits: int, name: str) -> bool:
+    return name in variables.index and 0 != bits & (1 << variables.index[name])
+
+  params = set()
+
+  if len(cfg):
+    params = set([ arg["name"] for arg in function.get("args", [])
+                   if is_live(result.ins[cfg.entry], arg["name"]) ])
+
+  dead_calls = set()
+
+  for (block, insts) in enumerate(cfg.blocks):
+    live = result.outs[block]
+
+    for inst in reversed(insts):
+      if "dest" in inst:
+        if inst.get("op") == "call" and not is_live(live, inst["dest"]):
+          # the blocks hold the instructions of the function itself
+          dead_calls.add(id(inst))
+
+        live = live & ~variables.bit(inst["dest"])
+
+      if inst.get("op") != "phi":
+        for arg in inst.get("args", []):
+          live = live | variables.bit(arg)
+
+  return (params, dead_calls)
+
+
+def eliminate_dead_code(program: dict, root: str = "main") -> tuple:
+  # the functions root does not reach go, then until nothing changes: the
+  # params nobody reads leave the function and every call passing them,
+  # the results nobody reads leave the calls, and a function whose result
+  # no call takes anymore returns nothing. root keeps it's params, they
+  # come from the command line. a program without root is left alone.
+  # returns (program, (functions, params, results) removed)
+  graph = CallGraph(program["functions"])
+  reached = reachable_functions(graph, root)
+
+  if not reached:
+    return (program, (0, 0, 0))
+
+  functions = { function["name"]: function for function in program["functions"]
+                if function["name"] in reached }
+
+  removed_functions = len(program["functions"]) - len(functions)
+  removed_params = 0
+  removed_results = 0
+
+  changed = True
+
+  while changed:
+    changed = False
+
+    # function name -> [bool] per param, whether it stays
+    keep = {}
+
+    # ids of the calls whose result nobody reads
+    dead_calls = set()
+
+    for (name, function) in functions.items():
+      (params, function_dead_calls) = liveness(function)
+      dead_calls.update(function_dead_calls)
+
+      if name != root:
+        keep[name] = [ arg["name"] in params for arg in function.get("args", []) ]
+
+    for (name, function) in list(functions.items()):
+      instrs = []
+
+      for inst in function["instrs"]:
+        callee = inst["funcs"][0] if inst.get("op") == "call" and inst.get("funcs") else None
+
+        if callee not in functions:
+          instrs.append(inst)
+          continue
+
+        new_inst = dict(inst)
+
+        if callee in keep and len(keep[callee]) == len(inst.get("args", [])):
+          new_inst["args"] = [ arg for (arg, stays) in zip(inst["args"], keep[callee]) if stays ]
+
+        if id(inst) in dead_calls:
+          del new_inst["dest"]
+          new_inst.pop("type", None)
+
+        instrs.append(new_inst if new_inst != inst else inst)
+
+      function = dict(function)
+      function["instrs"] = instrs
+
+      if name in keep and not all(keep[name]):
+        function["args"] = [ arg for (arg, stays) in zip(function["args"], keep[name]) if stays ]
+        removed_params = removed_params + keep[name].count(False)
+        changed = True
+
+      functions[name] = function
+
+    # the functions some call still takes the result of
+    taken = set()
+
+    for function in functions.values():
+      for inst in function["instrs"]:
+        if inst.get("op") == "call" and "dest" in inst and inst.get("funcs"):
+          taken.add(inst["funcs"][0])
+
+    for (name, function) in list(functions.items()):
+      if name == root or name in taken or "type" not in function:
+        continue
+
+      function = dict(function)
+      del function["type"]
+
+      function["instrs"] = [ { "op": "ret" } if inst.get("op") == "ret" else inst
+                             for inst in function["instrs"] ]
+
+      functions[name] = function
+      removed_results = removed_results + 1
+      changed = True
+
+  new_program = {}
+  new_program["functions"] = [ functions[function["name"]] for function in program["functions"]
+                               if function["name"] in functions ]
+
+  return (new_program, (removed_functions, removed_params, removed_results))
+
+
+def eliminate(program: dict) -> dict:
+  (program, (functions, params, results)) = eliminate_dead_code(program)
+
+  # stdout carries the program
+  print(f'{functions} functions, {params} params and {results} return values removed', file=sys.stderr)
+
+  return program
+
+
+if __name__ == "__main__":
+  # Python dictionary beign used is expected
+  # in the ordered fashion, which is a feature
+  # in python 3.7 and above
+
+  assert sys.version_info >= (3, 7)
+
+  args = parse_args("interprocedural dead function, param and return value elimination")
+
+  with open_program(args.program) as source:
+    program = load_program(source)
+
+    print(json.dumps(eliminate(program)))
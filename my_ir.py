@@ -0,0 +1,298 @@
+import sys
+import json
+import tracemalloc
+
+from my_parallel import open_program, parse_args
+
+
+class Symbols:
+  # interned names: every name gets a dense id, the passes compare and
+  # index by those instead of hashing the strings over and over
+  def __init__(self, names: list = ()) -> None:
+    # id -> name
+    self.names = []
+
+    # name -> id
+    self.index = {}
+
+    for name in names:
+      self.intern(name)
+
+  def intern(self, name: str) -> int:
+    if name not in self.index:
+      self.index[name] = len(self.names)
+      self.names.append(name)
+
+    return self.index[name]
+
+  def __len__(self) -> int:
+    return len(self.names)
+
+
+class Names(Symbols):
+  # interned variable names, which also hands out fresh versions of a name:
+  # x_0, x_1, ... skipping the ones already in the table. checking a version
+  # is a lookup of it's counter, the string is only made when it is spelled
+  def __init__(self, names: list = ()) -> None:
+    # name -> { counter -> id } of it's versions in the table
+    self.versions = {}
+
+    # name -> counter the next fresh version starts from
+    self.counters = {}
+
+    # id -> (name, counter) of the versions not spelled yet
+    self.unspelled = {}
+
+    super().__init__(names)
+
+  def intern(self, name: str) -> int:
+    if name in self.index:
+      return self.index[name]
+
+    (base, separator, counter) = name.rpartition("_")
+
+    if not separator or not counter.isascii() or not counter.isdigit() or str(int(counter)) != counter:
+      return super().intern(name)
+
+    versions = self.versions.setdefault(base, {})
+
+    if int(counter) in versions:
+      # handed out by fresh, spelled for the first time
+      return versions[int(counter)]
+
+    id = super().intern(name)
+    versions[int(counter)] = id
+
+    return id
+
+  def __contains__(self, name: str) -> bool:
+    if name in self.index:
+      return True
+
+    (base, separator, counter) = name.rpartition("_")
+
+    return bool(separator) and counter.isascii() and counter.isdigit() \
+           and str(int(counter)) == counter and int(counter) in self.versions.get(base, {})
+
+  def fresh(self, name: str, first: int = 0) -> int:
+    versions = self.versions.setdefault(name, {})
+    counter = self.counters.get(name, first)
+
+    while counter in versions:
+      counter = counter + 1
+
+    self.counters[name] = counter + 1
+
+    id = len(self.names)
+    self.names.append(None)
+
+    versions[counter] = id
+    self.unspelled[id] = (name, counter)
+
+    return id
+
+  def spelling(self, id: int) -> str:
+    name = self.names[id]
+
+    if name is None:
+      (base, counter) = self.unspelled.pop(id)
+
+      name = f'{base}_{counter}'
+      self.names[id] = name
+      self.index[name] = id
+
+    return name
+
+
+# the ops of the core, memory, float and ssa extensions get fixed ids,
+# whatever else shows up is interned on the way in
+OPCODES = Symbols([
+  "label",
+  "const", "id", "add", "mul", "sub", "div",
+  "eq", "lt", "gt", "le", "ge", "not", "and", "or",
+  "jmp", "br", "call", "ret", "print", "nop",
+  "alloc", "free", "store", "load", "ptradd",
+  "fadd", "fmul", "fsub", "fdiv", "feq", "flt", "fgt", "fle", "fge",
+  "phi",
+])
+
+LABEL = OPCODES.index["label"]
+CALL = OPCODES.index["call"]
+
+# keys of an instruction which have a slot, anything else is kept in extra
+INSTRUCTION_KEYS = ("label", "op", "dest", "type", "args", "funcs", "labels", "value")
+
+# dest of the instructions without one
+NO_DEST = -1
+
+
+class Instruction:
+  # what a json instruction holds, without a dict per instruction: the op is
+  # an opcode id, dest and args are variable ids of the function. a label is
+  # an instruction with the LABEL opcode and the name in labels. the absent
+  # keys are None, so the conversion back gives the same dict
+  __slots__ = ("op", "dest", "type", "args", "funcs", "labels", "value", "extra")
+
+  def __init__(self, op: int, dest: int = NO_DEST, type=None, args: tuple = None,
+               funcs: tuple = None, labels: tuple = None, value=None, extra: dict = None) -> None:
+    self.op = op
+    self.dest = dest
+    self.type = type
+    self.args = args
+    self.funcs = funcs
+    self.labels = labels
+    self.value = value
+
+    # keys of the json instruction the other slots do not cover, or None
+    self.extra = extra
+
+
+class Function:
+  __slots__ = ("name", "args", "type", "variables", "instrs", "extra")
+
+  def __init__(self, name: str, args: list, type, variables: Symbols,
+               instrs: list, extra: dict = None) -> None:
+    self.name = name
+
+    # json args of the function, None if it has none
+    self.args = args
+    self.type = type
+
+    # variable id -> name, the params first
+    self.variables = variables
+    self.instrs = instrs
+
+    self.extra = extra
+
+
+def intern_tuple(names: list) -> tuple:
+  # labels and function names repeat a lot, one string object each
+  return None if names is None else tuple([ sys.intern(name) for name in names ])
+
+
+def inst_from_json(inst: dict, variables: Symbols) -> Instruction:
+  extra = { key: value for (key, value) in inst.items() if key not in INSTRUCTION_KEYS } or None
+
+  if "label" in inst:
+    return Instruction(LABEL, labels=(sys.intern(inst["label"]),), extra=extra)
+
+  type = inst.get("type")
+
+  return Instruction(OPCODES.intern(inst["op"]),
+                     variables.intern(inst["dest"]) if "dest" in inst else NO_DEST,
+                     sys.intern(type) if isinstance(type, str) else type,
+                     None if "args" not in inst else tuple([ variables.intern(arg) for arg in inst["args"] ]),
+                     intern_tuple(inst.get("funcs")),
+                     intern_tuple(inst.get("labels")),
+                     inst.get("value"),
+                     extra)
+
+
+def inst_to_json(inst: Instruction, variables: Symbols) -> dict:
+  names = variables.names
+
+  if inst.op == LABEL:
+    new_inst = { "label": inst.labels[0] }
+  else:
+    new_inst = { "op": OPCODES.names[inst.op] }
+
+    if inst.dest != NO_DEST:
+      new_inst["dest"] = names[inst.dest]
+
+    if inst.type is not None:
+      new_inst["type"] = inst.type
+
+    if inst.args is not None:
+      new_inst["args"] = [ names[arg] for arg in inst.args ]
+
+    if inst.funcs is not None:
+      new_inst["funcs"] = list(inst.funcs)
+
+    if inst.labels is not None:
+      new_inst["labels"] = list(inst.labels)
+
+    if inst.value is not None:
+      new_inst["value"] = inst.value
+
+  if inst.extra is not None:
+    new_inst.update(inst.extra)
+
+  return new_inst
+
+
+def function_from_json(function: dict) -> Function:
+  variables = Symbols([ arg["name"] for arg in function.get("args", []) ])
+  instrs = [ inst_from_json(inst, variables) for inst in function["instrs"] ]
+
+  extra = { key: value for (key, value) in function.items()
+            if key not in ("name", "args", "type", "instrs") } or None
+
+  return Function(function["name"], function.get("args"), function.get("type"),
+                  variables, instrs, extra)
+
+
+def function_to_json(function: Function) -> dict:
+  new_function = {}
+
+  new_function["instrs"] = [ inst_to_json(inst, function.variables) for inst in function.instrs ]
+  new_function["name"] = function.name
+
+  if function.args is not None:
+    new_function["args"] = function.args
+
+  if function.type is not None:
+    new_function["type"] = function.type
+
+  if function.extra is not None:
+    new_function.update(function.extra)
+
+  return new_function
+
+
+def program_from_json(program: dict) -> list:
+  return [ function_from_json(function) for function in program["functions"] ]
+
+
+def program_to_json(functions: list) -> dict:
+  new_program = {}
+  new_program["functions"] = [ function_to_json(function) for function in functions ]
+
+  return new_program
+
+
+def measure(build) -> tuple:
+  # (what build returned, bytes it allocated and still holds)
+  tracemalloc.start()
+  before = tracemalloc.get_traced_memory()[0]
+
+  result = build()
+
+  after = tracemalloc.get_traced_memory()[0]
+  tracemalloc.stop()
+
+  return (result, after - before)
+
+
+def compare(text: str) -> None:
+  (program, json_size) = measure(lambda: json.loads(text))
+  (functions, ir_size) = measure(lambda: program_from_json(program))
+
+  count = max(1, sum([ len(function["instrs"]) for function in program["functions"] ]))
+
+  print(f'instructions: {count}')
+  print(f'json: {json_size / count:.1f} bytes per instruction')
+  print(f'ir: {ir_size / count:.1f} bytes per instruction')
+  print(f'round trip: {"ok" if program_to_json(functions) == program else "different"}')
+
+
+if __name__ == "__main__":
+  # Python dictionary beign used is expected
+  # in the ordered fashion, which is a feature
+  # in python 3.7 and above
+
+  assert sys.version_info >= (3, 7)
+
+  args = parse_args("memory of the compact ir against the json form")
+
+  with open_program(args.program) as source:
+    compare(source.read())
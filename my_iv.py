@@ -0,0 +1,360 @@
+import sys
+import json
+
+from my_cfg import CFG, build_cfg, function_args, new_function
+from my_dom import compute_dominators, natural_loops
+from my_licm import add_preheaders, preheader
+from my_ops import SWAPPED_COMPARISONS, TERMINATOR_OPS, wrap_int
+from my_parallel import imap_functions, parse_args
+from my_ssa import Versions, ssa_cfg, out_of_ssa_cfg
+from my_stream import load_program, open_program, read_functions, write_program
+
+
+class InductionVariable:
+  # basic induction variable: phi = phi(init from the preheader, next from
+  # the latches), next = phi + step or phi - step, step loop invariant
+  def __init__(self, phi: dict, init: str, next_inst: dict, next_block: int) -> None:
+    self.phi = phi
+    self.init = init
+
+    self.next_inst = next_inst
+    self.next_block = next_block
+
+    self.step = next_inst["args"][1] if next_inst["args"][0] == phi["dest"] else next_inst["args"][0]
+    self.op = next_inst["op"]
+
+
+def basic_induction_variables(cfg: CFG, loop, blocks: list, defined: dict) -> list:
+  # defined: variable -> (block id, instruction) of the definitions in the loop
+  pre_label = cfg.names[preheader(cfg, loop)]
+  variables = []
+
+  for inst in blocks[loop.header]:
+    if inst.get("op") != "phi" or inst.get("type") != "int":
+      continue
+
+    init = [ arg for (arg, label) in zip(inst["args"], inst["labels"]) if label == pre_label ]
+    nexts = set([ arg for (arg, label) in zip(inst["args"], inst["labels"]) if label != pre_label ])
+
+    if 1 != len(init) or 1 != len(nexts):
+      continue
+
+    next_var = nexts.pop()
+
+    if next_var not in defined:
+      continue
+
+    (next_block, next_inst) = defined[next_var]
+    args = next_inst.get("args", [])
+
+    if next_inst.get("op") == "add" and 2 == len(args) and inst["dest"] in args:
+      step = args[1] if args[0] == inst["dest"] else args[0]
+    elif next_inst.get("op") == "sub" and 2 == len(args) and args[0] == inst["dest"]:
+      step = args[1]
+    else:
+      continue
+
+    if step in defined:
+      # not loop invariant
+      continue
+
+    variables.append(InductionVariable(inst, init[0], next_inst, next_block))
+
+  return variables
+
+
+def fits(value: int) -> bool:
+  return wrap_int(value) == value
+
+
+def iv_cfg(cfg: CFG, args: list) -> tuple:
+  # strength reduction, the cfg has to be in ssa form. j = i * k for a basic
+  # induction variable i and a loop invariant k becomes a new induction
+  # variable stepping by step * k, no multiply left in the loop. an i only
+  # compared against constants afterwards is replaced by one of those in the
+  # comparisons (when the constants prove it can not overflow) and deleted.
+  # returns (cfg, number of instructions added, removed or rewritten)
+  (cfg, changes) = add_preheaders(cfg)
+
+  doms = compute_dominators(cfg)
+  blocks = [ list(insts) for insts in cfg.blocks ]
+
+  taken = set(args)
+
+  # variable -> value of it's const definition
+  constants = {}
+
+  for insts in blocks:
+    for inst in insts:
+      taken.update(inst.get("args", []))
+
+      if "dest" in inst:
+        taken.add(inst["dest"])
+
+        if inst.get("op") == "const":
+          constants[inst["dest"]] = inst["value"]
+
+  versions = Versions(taken)
+
+  # product -> the induction variable replacing it
+  copies = {}
+
+  def position_of(block: int, anchor: dict) -> int:
+    # by identity, the instructions are looked up after others got inserted
+    return next(position for (position, inst) in enumerate(blocks[block]) if inst is anchor)
+
+  def insert_after(block: int, anchor: dict, new_insts: list) -> None:
+    position = position_of(block, anchor)
+    blocks[block][position + 1:position + 1] = new_insts
+
+  def append_to_preheader(block: int, new_insts: list) -> None:
+    insts = blocks[block]
+
+    if insts and insts[-1].get("op") in TERMINATOR_OPS:
+      blocks[block] = insts[:-1] + new_insts + insts[-1:]
+    else:
+      blocks[block] = insts + new_insts
+
+  for loop in natural_loops(doms):
+    pre = preheader(cfg, loop)
+
+    # variable -> (block id, instruction) defining it in the loop
+    defined = {}
+
+    for id in loop.body:
+      for inst in blocks[id]:
+        if "dest" in inst:
+          defined[inst["dest"]] = (id, inst)
+
+    for iv in basic_induction_variables(cfg, loop, blocks, defined):
+      i = iv.phi["dest"]
+
+      # invariant k -> [(block id, instruction)] of the i * k in the loop
+      products = {}
+
+      for id in loop.body:
+        for inst in blocks[id]:
+          if inst.get("op") == "mul" and inst.get("type") == "int" and i in inst["args"]:
+            k = inst["args"][1] if inst["args"][0] == i else inst["args"][0]
+
+            if k not in defined:
+              products.setdefault(k, []).append((id, inst))
+
+      # k -> the induction variable which is i * k
+      derived = {}
+
+      for (k, places) in products.items():
+        start = versions.fresh(f'{i}_start')
+        step = versions.fresh(f'{i}_step')
+        current = versions.fresh(f'{i}_iv')
+        next_var = versions.fresh(f'{i}_iv')
+
+        append_to_preheader(pre, [ product_inst(start, iv.init, k, constants),
+                                   product_inst(step, iv.step, k, constants) ])
+
+        phi = { "op": "phi", "dest": current, "type": "int",
+                "args": [ start if label == cfg.names[pre] else next_var for label in iv.phi["labels"] ],
+                "labels": list(iv.phi["labels"]) }
+        update = { "op": iv.op, "dest": next_var, "type": "int", "args": [ current, step ] }
+
+        header_insts = blocks[loop.header]
+        blocks[loop.header].insert(1 if header_insts and "label" in header_insts[0] else 0, phi)
+        insert_after(iv.next_block, iv.next_inst, [ update ])
+
+        defined[current] = (loop.header, phi)
+        defined[next_var] = (iv.next_block, update)
+
+        for (id, mul) in places:
+          # current is defined in the header, which dominates every use of the product
+          blocks[id] = [ inst for inst in blocks[id] if inst is not mul ]
+          copies[mul["dest"]] = current
+
+        derived[k] = current
+
+        # the start and the step, the phi and the update in, the products out
+        changes = changes + 4 + len(places)
+
+      changes = changes + eliminate_induction_variable(cfg, doms, loop, blocks, iv, derived, constants,
+                                                       versions, lambda new_insts: append_to_preheader(pre, new_insts))
+
+  for (id, insts) in enumerate(blocks):
+    for (position, inst) in enumerate(insts):
+      if any([ arg in copies for arg in inst.get("args", []) ]):
+        inst = dict(inst)
+        inst["args"] = [ copies.get(arg, arg) for arg in inst["args"] ]
+        insts[position] = inst
+        changes = changes + 1
+
+  return (cfg.with_blocks(blocks), changes)
+
+
+def product_inst(dest: str, a: str, b: str, constants: dict) -> dict:
+  # dest = a * b, folded when both are constants
+  values = [ constants.get(a), constants.get(b) ]
+
+  if all([ isinstance(value, int) and not isinstance(value, bool) for value in values ]):
+    constants[dest] = wrap_int(values[0] * values[1])
+
+    return { "op": "const", "dest": dest, "type": "int", "value": constants[dest] }
+
+  return { "op": "mul", "dest": dest, "type": "int", "args": [ a, b ] }
+
+
+def exit_conditions(cfg: CFG, doms, loop) -> dict:
+  # condition variable -> True if the loop goes on when it is true, for the
+  # branches out of the loop which run in every iteration (they dominate
+  # the latches). other exits only leave earlier
+  conditions = {}
+
+  for id in loop.body:
+    insts = cfg.blocks[id]
+
+    if not insts or insts[-1].get("op") != "br" \
+       or not all([ doms.dominates(id, latch) for latch in loop.latches ]):
+      continue
+
+    inside = [ cfg.index[label] in loop.body for label in insts[-1]["labels"] ]
+
+    if inside[0] != inside[1]:
+      conditions[insts[-1]["args"][0]] = inside[0]
+
+  return conditions
+
+
+def eliminate_induction_variable(cfg: CFG, doms, loop, blocks: list, iv: InductionVariable,
+                                 derived: dict, constants: dict, versions: Versions,
+                                 append_to_preheader) -> int:
+  # linear function test replacement: i < n is i * k < n * k for a positive
+  # constant k, as long as nothing on the way wraps around. a comparison
+  # of i with a constant deciding the way out of the loop in every iteration
+  # bounds the values of i, without one nothing is rewritten. only when
+  # every other use of i is a comparison i goes away.
+  # returns the number of instructions added, removed or rewritten
+  i = iv.phi["dest"]
+  next_var = iv.next_inst["dest"]
+
+  scales = [ (k, current) for (k, current) in derived.items()
+             if isinstance(constants.get(k), int) and not isinstance(constants.get(k), bool)
+             and constants[k] > 0 ]
+
+  if not scales or not isinstance(constants.get(iv.init), int) or not isinstance(constants.get(iv.step), int):
+    return 0
+
+  (k, current) = scales[0]
+  scale = constants[k]
+
+  init = constants[iv.init]
+  step = constants[iv.step] if iv.op == "add" else -constants[iv.step]
+
+  # [(block id, comparison, the constant it compares with)]
+  comparisons = []
+
+  # the constant i is kept on one side of while the loop runs
+  limit = None
+
+  exits = exit_conditions(cfg, doms, loop)
+
+  for (id, insts) in enumerate(blocks):
+    for inst in insts:
+      if inst is iv.next_inst:
+        continue
+
+      uses = inst.get("args", [])
+
+      if next_var in uses and inst is not iv.phi:
+        return 0
+
+      if i not in uses:
+        continue
+
+      if inst.get("op") not in ("lt", "le", "gt", "ge") or 2 != len(uses) or uses[0] == uses[1]:
+        return 0
+
+      (op, bound) = (inst["op"], uses[1]) if uses[0] == i else (SWAPPED_COMPARISONS[inst["op"]], uses[0])
+
+      if not isinstance(constants.get(bound), int) or isinstance(constants.get(bound), bool):
+        return 0
+
+      # the loop only goes on while i has not passed the bound yet, in the
+      # direction it moves: i < n is true, or i > n is false, for a growing i
+      if inst["dest"] in exits and exits[inst["dest"]] == ((op in ("lt", "le")) == (step > 0)):
+        limit = constants[bound]
+
+      comparisons.append((id, inst, bound))
+
+  if not comparisons or limit is None:
+    return 0
+
+  # every i the loop sees, one step past the limit at most
+  low = min(init, limit) - abs(step)
+  high = max(init, limit) + abs(step)
+
+  if not fits(low * scale) or not fits(high * scale):
+    return 0
+
+  for (_, _, bound) in comparisons:
+    if not fits(constants[bound] * scale):
+      return 0
+
+  scaled = {}
+
+  for (id, inst, bound) in comparisons:
+    if bound not in scaled:
+      scaled[bound] = versions.fresh(f'{bound}_times_{k}')
+
+      append_to_preheader([ { "op": "const", "dest": scaled[bound], "type": "int",
+                              "value": constants[bound] * scale } ])
+
+    new_inst = dict(inst)
+    new_inst["args"] = [ current if arg == i else scaled[bound] for arg in inst["args"] ]
+
+    blocks[id] = [ new_inst if old is inst else old for old in blocks[id] ]
+
+  blocks[loop.header] = [ inst for inst in blocks[loop.header] if inst is not iv.phi ]
+  blocks[iv.next_block] = [ inst for inst in blocks[iv.next_block] if inst is not iv.next_inst ]
+
+  # the scaled bounds in, the comparisons rewritten, the phi and the update out
+  return len(scaled) + len(comparisons) + 2
+
+
+def iv_function(function: dict) -> tuple:
+  cfg = ssa_cfg(build_cfg(function), function.get("args", []))
+  (cfg, changes) = iv_cfg(cfg, function_args(function))
+  cfg = out_of_ssa_cfg(cfg, function.get("args", []))
+
+  return (new_function(function, cfg.instrs()), changes)
+
+
+def strength_reduce_functions(functions, jobs: int = 1):
+  # lazy, the functions may be a stream
+  for (function, changes) in imap_functions(iv_function, jobs, functions):
+    # stdout carries the program
+    print(f'{function["name"]}: {changes} changes', file=sys.stderr)
+
+    yield function
+
+
+def strength_reduce(program: dict, jobs: int = 1) -> dict:
+  new_program = {}
+  new_program["functions"] = list(strength_reduce_functions(program["functions"], jobs))
+
+  return new_program
+
+
+if __name__ == "__main__":
+  # Python dictionary beign used is expected
+  # in the ordered fashion, which is a feature
+  # in python 3.7 and above
+
+  assert sys.version_info >= (3, 7)
+
+  args = parse_args("induction variable strength reduction", streaming=True)
+
+  with open_program(args.program) as source:
+    if args.stream:
+      reader = read_functions(source)
+      write_program(strength_reduce_functions(reader, args.jobs), reader.extra, args.binary)
+    else:
+      program = load_program(source)
+
+      print(json.dumps(strength_reduce(program, args.jobs)))
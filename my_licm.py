@@ -0,0 +1,234 @@
+import sys
+import json
+
+from my_cfg import CFG, build_cfg, connect, function_args, new_function, with_entry_block
+from my_dom import compute_dominators, natural_loops
+from my_ops import PURE_OPS, TERMINATOR_OPS, TRAPPING_OPS
+from my_parallel import map_functions, parse_args
+from my_ssa import Versions, ssa_cfg, out_of_ssa_cfg
+from my_stream import load_program, open_program, stream_program
+
+
+# computing them again and again in a loop gives the same value every time
+HOISTABLE_OPS = (PURE_OPS | { "const", "ptradd" }) - { "phi" }
+
+
+def preheader(cfg: CFG, loop) -> int:
+  # the block entering the loop, if there is exactly one, it only goes to
+  # the header and it is not a generated block, which dce would delete
+  # with the code hoisted into it. -1 if the loop does not have one
+  outside = set([ pred for pred in cfg.preds[loop.header] if pred not in loop.body ])
+
+  if 1 != len(outside):
+    return -1
+
+  pred = outside.pop()
+
+  if set(cfg.succs[pred]) != { loop.header } or cfg.generated[pred]:
+    return -1
+
+  return pred
+
+
+def add_preheaders(cfg: CFG) -> tuple:
+  # every loop gets a block of it's own in front of the header, the edges
+  # entering the loop go to it instead and the header phis merging those
+  # edges move to it. returns (cfg, number of blocks added)
+  if cfg.preds[cfg.entry]:
+    cfg = with_entry_block(cfg)
+
+  doms = compute_dominators(cfg)
+
+  # header block id -> Loop without a preheader
+  needed = {}
+
+  for loop in natural_loops(doms):
+    if -1 == preheader(cfg, loop):
+      needed[loop.header] = loop
+
+  if not needed:
+    return (cfg, 0)
+
+  taken = set()
+
+  for insts in cfg.blocks:
+    for inst in insts:
+      taken.update(inst.get("args", []))
+
+      if "dest" in inst:
+        taken.add(inst["dest"])
+
+  versions = Versions(taken)
+
+  # (pred block id, header block id) -> preheader label
+  redirect = {}
+
+  # header block id -> (preheader label, phi instructions of the preheader, new header)
+  split = {}
+
+  for (header, loop) in needed.items():
+    name = cfg.name_gen.fresh()
+    outside = [ cfg.names[pred] for pred in dict.fromkeys(cfg.preds[header])
+                if pred not in loop.body ]
+
+    for pred in cfg.preds[header]:
+      if pred not in loop.body:
+        redirect[(pred, header)] = name
+
+    pre_phis = []
+    header_insts = []
+
+    for inst in cfg.blocks[header]:
+      if inst.get("op") != "phi":
+        header_insts.append(inst)
+        continue
+
+      inside_args = [ (arg, label) for (arg, label) in zip(inst["args"], inst["labels"])
+                      if label not in outside ]
+      outside_args = [ (arg, label) for (arg, label) in zip(inst["args"], inst["labels"])
+                       if label in outside ]
+
+      if 1 == len(outside_args):
+        entering = outside_args[0][0]
+      elif outside_args:
+        entering = versions.fresh(inst["dest"])
+
+        pre_phis.append({ "op": "phi", "dest": entering, "type": inst.get("type"),
+                          "args": [ arg for (arg, _) in outside_args ],
+                          "labels": [ label for (_, label) in outside_args ] })
+      else:
+        entering = None
+
+      inst = dict(inst)
+      inst["args"] = [ arg for (arg, _) in inside_args ]
+      inst["labels"] = [ label for (_, label) in inside_args ]
+
+      if entering is not None:
+        inst["args"].append(entering)
+        inst["labels"].append(name)
+
+      header_insts.append(inst)
+
+    split[header] = (name, pre_phis, header_insts)
+
+  names = []
+  blocks = []
+  generated = []
+
+  for (id, insts) in enumerate(cfg.blocks):
+    if id in split:
+      (name, pre_phis, insts) = split[id]
+
+      if blocks and id - 1 in needed[id].body and not (blocks[-1] and blocks[-1][-1].get("op") in TERMINATOR_OPS):
+        # a latch falling through to the header would fall into the preheader
+        blocks[-1].append({ "op": "jmp", "labels": [ cfg.names[id] ] })
+
+      # right before the header, so it falls through to it
+      names.append(name)
+      blocks.append([ { "label": name } ] + pre_phis)
+      generated.append(False)
+
+    insts = list(insts)
+
+    if insts and insts[-1].get("op") in ("br", "jmp"):
+      last = dict(insts[-1])
+      last["labels"] = [ redirect.get((id, cfg.index[label]), label) for label in last["labels"] ]
+      insts[-1] = last
+
+    names.append(cfg.names[id])
+    blocks.append(insts)
+    generated.append(cfg.generated[id])
+
+  return (connect(CFG(cfg.func, names, blocks, generated, cfg.name_gen)), len(split))
+
+
+def licm_cfg(cfg: CFG, args: list) -> tuple:
+  # loop invariant code motion, the cfg has to be in ssa form. an instruction
+  # is invariant if it's args are defined outside the loop or by invariant
+  # instructions, it moves to the preheader. the ones which can trap only
+  # move if they run on every way out of the loop anyway
+  (cfg, changes) = add_preheaders(cfg)
+
+  doms = compute_dominators(cfg)
+  blocks = [ list(insts) for insts in cfg.blocks ]
+
+  for loop in natural_loops(doms):
+    pre = preheader(cfg, loop)
+
+    # variables still defined in the loop
+    defined = set()
+
+    for id in loop.body:
+      for inst in blocks[id]:
+        if "dest" in inst:
+          defined.add(inst["dest"])
+
+    exits = [ id for id in loop.body if any([ succ not in loop.body for succ in cfg.succs[id] ]) ]
+    body = [ id for id in doms.preorder if id in loop.body ]
+
+    hoisted = []
+    changed = True
+
+    while changed:
+      changed = False
+
+      for id in body:
+        staying = []
+
+        for inst in blocks[id]:
+          if inst.get("op") in HOISTABLE_OPS and "dest" in inst \
+             and not any([ arg in defined for arg in inst.get("args", []) ]) \
+             and (inst["op"] not in TRAPPING_OPS or
+                  (exits and all([ doms.dominates(id, exit) for exit in exits ]))):
+            hoisted.append(inst)
+            defined.discard(inst["dest"])
+            changed = True
+          else:
+            staying.append(inst)
+
+        blocks[id] = staying
+
+    if hoisted:
+      insts = blocks[pre]
+
+      if insts and insts[-1].get("op") in TERMINATOR_OPS:
+        blocks[pre] = insts[:-1] + hoisted + insts[-1:]
+      else:
+        blocks[pre] = insts + hoisted
+
+      changes = changes + len(hoisted)
+
+  return (cfg.with_blocks(blocks), changes)
+
+
+def licm_function(function: dict) -> dict:
+  cfg = ssa_cfg(build_cfg(function), function.get("args", []))
+  (cfg, _) = licm_cfg(cfg, function_args(function))
+  cfg = out_of_ssa_cfg(cfg, function.get("args", []))
+
+  return new_function(function, cfg.instrs())
+
+
+def licm(program: dict, jobs: int = 1) -> dict:
+  new_program = {}
+  new_program["functions"] = map_functions(licm_function, jobs, program["functions"])
+
+  return new_program
+
+
+if __name__ == "__main__":
+  # Python dictionary beign used is expected
+  # in the ordered fashion, which is a feature
+  # in python 3.7 and above
+
+  assert sys.version_info >= (3, 7)
+
+  args = parse_args("loop invariant code motion", streaming=True)
+
+  if args.stream:
+    stream_program(licm_function, args.program, args.jobs, binary=args.binary)
+  else:
+    with open_program(args.program) as source:
+      program = load_program(source)
+
+      print(json.dumps(licm(program, args.jobs)))
@@ -0,0 +1,290 @@
+import sys
+import json
+
+from my_cfg import CFG, build_cfg, function_args, new_function, reverse_postorder
+from my_parallel import map_functions, parse_args
+from my_ssa import UNDEFINED, ssa_cfg, out_of_ssa_cfg
+from my_stream import load_program, open_program, stream_program
+
+
+# the allocation site of memory the function did not allocate itself,
+# e.g. behind a param or a loaded pointer. it may be any escaped allocation
+UNKNOWN = ""
+
+
+def is_pointer(type) -> bool:
+  return isinstance(type, dict) and "ptr" in type
+
+
+class MemoryAliases:
+  # flow insensitive points-to analysis, the cfg has to be in ssa form.
+  # an allocation site is the dest of it's alloc. every pointer variable
+  # gets the sites it may point into, followed through ptradd, id and phi,
+  # and an address: the variable it was derived from by id and ptradd with
+  # constant offsets, and the offset. same address is the same cell
+  def __init__(self, cfg: CFG, args: list) -> None:
+    # variable -> instruction defining it
+    self.defs = {}
+
+    # variable -> value of it's int const definition
+    self.constants = {}
+
+    for insts in cfg.blocks:
+      for inst in insts:
+        if "dest" in inst:
+          self.defs[inst["dest"]] = inst
+
+          if inst.get("op") == "const" and isinstance(inst.get("value"), int) \
+             and not isinstance(inst.get("value"), bool):
+            self.constants[inst["dest"]] = inst["value"]
+
+    # variable -> frozenset of allocation sites, the ones computed from other
+    # pointers. anything else (params, loads, calls) is UNKNOWN
+    self.sites = {}
+
+    derived = [ dest for (dest, inst) in self.defs.items()
+                if inst.get("op") in ("alloc", "ptradd", "id", "phi") and is_pointer(inst.get("type")) ]
+
+    for dest in derived:
+      self.sites[dest] = frozenset([ dest ]) if self.defs[dest]["op"] == "alloc" else frozenset()
+
+    changed = True
+
+    while changed:
+      changed = False
+
+      for dest in derived:
+        inst = self.defs[dest]
+
+        if inst["op"] == "alloc":
+          continue
+
+        sources = inst["args"][:1] if inst["op"] != "phi" else inst["args"]
+        sites = self.sites[dest]
+
+        for source in sources:
+          if source != UNDEFINED:
+            sites = sites | self.sites_of(source)
+
+        if sites != self.sites[dest]:
+          self.sites[dest] = sites
+          changed = True
+
+    # allocation sites code outside the function may get to: passed to calls,
+    # stored to memory or returned. UNKNOWN pointers may point into them
+    self.escaped = set()
+
+    for insts in cfg.blocks:
+      for inst in insts:
+        op = inst.get("op")
+
+        if op == "call" or op == "ret":
+          escaping = inst.get("args", [])
+        elif op == "store":
+          escaping = inst["args"][1:]
+        else:
+          continue
+
+        for arg in escaping:
+          if arg in self.sites:
+            self.escaped.update(self.sites[arg])
+
+    self.escaped.discard(UNKNOWN)
+
+    # variable -> (root variable, offset from it)
+    self.addresses = {}
+
+  def sites_of(self, var: str) -> frozenset:
+    return self.sites.get(var, frozenset([ UNKNOWN ]))
+
+  def address(self, var: str) -> tuple:
+    # iterative, the chains of ptradds can be long
+    path = []
+
+    while var not in self.addresses:
+      inst = self.defs.get(var, {})
+      op = inst.get("op")
+
+      if op == "id" or (op == "ptradd" and inst["args"][1] in self.constants):
+        path.append(var)
+        var = inst["args"][0]
+      else:
+        self.addresses[var] = (var, 0)
+
+    (root, offset) = self.addresses[var]
+
+    for var in reversed(path):
+      inst = self.defs[var]
+
+      if inst["op"] == "ptradd":
+        offset = offset + self.constants[inst["args"][1]]
+
+      self.addresses[var] = (root, offset)
+
+    return (root, offset)
+
+  def reachable_from_unknown(self, sites: frozenset) -> bool:
+    return UNKNOWN in sites or 0 != len(sites & self.escaped)
+
+  def may_alias(self, a: str, b: str) -> bool:
+    (root_a, offset_a) = self.address(a)
+    (root_b, offset_b) = self.address(b)
+
+    if root_a == root_b:
+      return offset_a == offset_b
+
+    sites_a = self.sites_of(a)
+    sites_b = self.sites_of(b)
+
+    if sites_a & sites_b:
+      return True
+
+    return (UNKNOWN in sites_a and self.reachable_from_unknown(sites_b)) \
+           or (UNKNOWN in sites_b and self.reachable_from_unknown(sites_a))
+
+
+def forward_memory(cfg: CFG, aliases: MemoryAliases, blocks: list) -> int:
+  # store to load forwarding and redundant load elimination. a load from an
+  # address with a known content becomes an id of it, the content being the
+  # last value stored there or loaded from there. the contents flow on to a
+  # block with a single pred, i.e. along the extended basic blocks
+  changes = 0
+
+  # block id -> address -> (pointer variable, variable holding the content)
+  contents_out = [ None ] * len(cfg)
+
+  for id in reverse_postorder(cfg):
+    preds = cfg.preds[id]
+
+    if 1 == len(preds) and contents_out[preds[0]] is not None:
+      contents = dict(contents_out[preds[0]])
+    else:
+      contents = {}
+
+    def kill(pointer: str) -> None:
+      for (address, (other, _)) in list(contents.items()):
+        if aliases.may_alias(pointer, other):
+          del contents[address]
+
+    insts = blocks[id]
+
+    for (position, inst) in enumerate(insts):
+      op = inst.get("op")
+
+      if op == "store":
+        (pointer, value) = inst["args"]
+
+        kill(pointer)
+        contents[aliases.address(pointer)] = (pointer, value)
+      elif op == "load":
+        pointer = inst["args"][0]
+        address = aliases.address(pointer)
+
+        if address in contents:
+          insts[position] = { "op": "id", "dest": inst["dest"], "type": inst.get("type"),
+                              "args": [ contents[address][1] ] }
+          changes = changes + 1
+        else:
+          contents[address] = (pointer, inst["dest"])
+      elif op == "free":
+        kill(inst["args"][0])
+      elif op == "call":
+        # the callee may write whatever escaped
+        for (address, (pointer, _)) in list(contents.items()):
+          if aliases.reachable_from_unknown(aliases.sites_of(pointer)):
+            del contents[address]
+
+    contents_out[id] = contents
+
+  return changes
+
+
+def eliminate_dead_stores(cfg: CFG, aliases: MemoryAliases, blocks: list) -> int:
+  # a store is dead when the cell is stored to again before anything may
+  # read it, or when nothing ever reads it's allocation sites at all
+  read_sites = set(aliases.escaped)
+
+  for insts in blocks:
+    for inst in insts:
+      if inst.get("op") == "load":
+        sites = aliases.sites_of(inst["args"][0])
+        read_sites.update(sites)
+
+        if UNKNOWN in sites:
+          read_sites.update(aliases.escaped)
+
+  changes = 0
+
+  for (id, insts) in enumerate(blocks):
+    # pointers stored to further down, nothing reading them in between
+    overwritten = []
+    alive = []
+
+    for inst in reversed(insts):
+      op = inst.get("op")
+
+      if op == "store":
+        pointer = inst["args"][0]
+        sites = aliases.sites_of(pointer)
+
+        if (UNKNOWN not in sites and not (sites & read_sites)) \
+           or any([ aliases.address(pointer) == aliases.address(other) for other in overwritten ]):
+          changes = changes + 1
+          continue
+
+        overwritten.append(pointer)
+      elif op == "load":
+        overwritten = [ other for other in overwritten if not aliases.may_alias(inst["args"][0], other) ]
+      elif op == "call" or op == "ret":
+        overwritten = []
+
+      alive.append(inst)
+
+    alive.reverse()
+    blocks[id] = alive
+
+  return changes
+
+
+def mem_cfg(cfg: CFG, args: list) -> tuple:
+  # the cfg has to be in ssa form. returns (cfg, number of loads and stores removed)
+  aliases = MemoryAliases(cfg, args)
+  blocks = [ list(insts) for insts in cfg.blocks ]
+
+  changes = forward_memory(cfg, aliases, blocks)
+  changes = changes + eliminate_dead_stores(cfg, aliases, blocks)
+
+  return (cfg.with_blocks(blocks), changes)
+
+
+def mem_function(function: dict) -> dict:
+  cfg = ssa_cfg(build_cfg(function), function.get("args", []))
+  (cfg, _) = mem_cfg(cfg, function_args(function))
+  cfg = out_of_ssa_cfg(cfg, function.get("args", []))
+
+  return new_function(function, cfg.instrs())
+
+
+def mem(program: dict, jobs: int = 1) -> dict:
+  new_program = {}
+  new_program["functions"] = map_functions(mem_function, jobs, program["functions"])
+
+  return new_program
+
+
+if __name__ == "__main__":
+  # Python dictionary beign used is expected
+  # in the ordered fashion, which is a feature
+  # in python 3.7 and above
+
+  assert sys.version_info >= (3, 7)
+
+  args = parse_args("store to load forwarding, redundant load and dead store elimination", streaming=True)
+
+  if args.stream:
+    stream_program(mem_function, args.program, args.jobs, binary=args.binary)
+  else:
+    with open_program(args.program) as source:
+      program = load_program(source)
+
+      print(json.dumps(mem(program, args.jobs)))
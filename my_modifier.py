@@ -1,42 +1,59 @@
-import sys
 import json
+import itertools
 
+from my_cfg import new_function
+from my_parallel import imap_functions, map_functions, parse_args
+from my_stream import load_program, open_program, read_functions, write_program
 
-def modify_program(program):
-  inst_counter = 0
-  new_program = {}
-  new_functions = []
 
-  for function in program["functions"]:
-    new_function = {}
-    new_instructions = []
+def modify_function(function: dict, inst_counter: int) -> dict:
+  new_instructions = []
+
+  for instruction in function["instrs"]:
+    new_instructions.append({ "op": "const", "value": inst_counter, "dest": f"myNewThingy{inst_counter}", "type": "int" })
+    new_instructions.append({ "op": "print", "args": [ f"myNewThingy{inst_counter}" ] })
+    new_instructions.append(instruction)
+
+    inst_counter = inst_counter + 1
 
-    for instruction in function["instrs"]:
-      new_instructions.append({ "op": "const", "value": inst_counter, "dest": f"myNewThingy{inst_counter}", "type": "int" })
-      new_instructions.append({ "op": "print", "args": [ f"myNewThingy{inst_counter}" ] })
-      new_instructions.append(instruction)
+  return new_function(function, new_instructions)
 
-      inst_counter = inst_counter + 1
 
-    new_function["instrs"] = new_instructions
-    new_function["name"] = function["name"]
-    new_function["args"] = function["args"]
+def modify_program(program, jobs: int = 1):
+  new_program = {}
 
-    if "type" in function.keys():
-      new_function["type"] = function["type"]
+  # the counter runs across the functions,
+  # so every function starts where the previous one stopped
+  inst_counters = []
+  inst_counter = 0
 
-    new_functions.append(new_function)
+  for function in program["functions"]:
+    inst_counters.append(inst_counter)
+    inst_counter = inst_counter + len(function["instrs"])
 
-  new_program["functions"] = new_functions
+  new_program["functions"] = map_functions(modify_function, jobs,
+                                           program["functions"], inst_counters)
 
   return new_program
 
 
-assert(2 == len(sys.argv))
+if __name__ == "__main__":
+  args = parse_args("instruments every instruction with a print", streaming=True)
+
+  with open_program(args.program) as source:
+    if args.stream:
+      reader = read_functions(source)
+
+      # the counters are worked out as the functions come in, every
+      # function starts where the previous one stopped
+      (functions, counted) = itertools.tee(reader)
+      inst_counters = itertools.accumulate(itertools.chain([ 0 ], (len(function["instrs"]) for function in counted)))
 
-with open(sys.argv[1]) as source:
-  program = json.load(source)
+      write_program(imap_functions(modify_function, args.jobs, functions, inst_counters),
+                    reader.extra, args.binary)
+    else:
+      program = load_program(source)
 
-  new_program = modify_program(program)
+      new_program = modify_program(program, args.jobs)
 
-  print(json.dumps(new_program))
+      print(json.dumps(new_program))
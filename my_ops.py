@@ -0,0 +1,95 @@
+import math
+
+
+# value operations which only depend on their arguments
+INT_OPS = {
+  "add": lambda a, b: a + b,
+  "mul": lambda a, b: a * b,
+  "sub": lambda a, b: a - b,
+  # truncates towards zero
+  "div": lambda a, b: (abs(a) // abs(b)) * (1 if (a < 0) == (b < 0) else -1),
+}
+
+COMPARISON_OPS = {
+  "eq": lambda a, b: a == b,
+  "lt": lambda a, b: a < b,
+  "gt": lambda a, b: a > b,
+  "le": lambda a, b: a <= b,
+  "ge": lambda a, b: a >= b,
+}
+
+LOGIC_OPS = {
+  "and": lambda a, b: a and b,
+  "or": lambda a, b: a or b,
+  "not": lambda a: not a,
+}
+
+FLOAT_OPS = {
+  "fadd": lambda a, b: a + b,
+  "fmul": lambda a, b: a * b,
+  "fsub": lambda a, b: a - b,
+  "fdiv": lambda a, b: a / b,
+  "feq": lambda a, b: a == b,
+  "flt": lambda a, b: a < b,
+  "fgt": lambda a, b: a > b,
+  "fle": lambda a, b: a <= b,
+  "fge": lambda a, b: a >= b,
+}
+
+EVALUATORS = { **INT_OPS, **COMPARISON_OPS, **LOGIC_OPS, **FLOAT_OPS }
+
+# the order of the arguments does not matter
+COMMUTATIVE_OPS = { "add", "mul", "eq", "and", "or", "fadd", "fmul", "feq" }
+
+# a < b is b > a, a <= b is b >= a
+SWAPPED_COMPARISONS = { "lt": "gt", "gt": "lt", "le": "ge", "ge": "le",
+                        "flt": "fgt", "fgt": "flt", "fle": "fge", "fge": "fle" }
+
+# no side effects and the result only depends on the arguments,
+# so two of them with the same arguments compute the same value
+PURE_OPS = set(EVALUATORS.keys()) | { "id" }
+
+# pure, but executing them where the program would not may trap
+TRAPPING_OPS = { "div" }
+
+TERMINATOR_OPS = { "br", "jmp", "ret" }
+
+MEMORY_OPS = { "alloc", "free", "store", "load", "ptradd" }
+
+
+def wrap_int(value: int) -> int:
+  # bril integers are 64 bit two's complement
+  return ((value + 2 ** 63) % 2 ** 64) - 2 ** 63
+
+
+def constant_key(value) -> tuple:
+  # constants with equal keys are the same value. python says 1 == True and
+  # 0.0 == -0.0, bril does not: `true` is not `1` and 1 / -0.0 is -inf
+  if isinstance(value, float):
+    return (float, value, math.copysign(1.0, value))
+
+  return (type(value), value)
+
+
+def evaluate(op: str, values: list):
+  # the constant result of op, None if it can not be computed here
+  if op not in EVALUATORS:
+    return None
+
+  try:
+    if op == "div" and 0 == values[1]:
+      # traps at runtime, leave it there
+      return None
+
+    result = EVALUATORS[op](*values)
+  except (ArithmeticError, TypeError, ValueError):
+    return None
+
+  if op in INT_OPS:
+    return wrap_int(result)
+
+  if op in FLOAT_OPS and isinstance(result, float) and not math.isfinite(result):
+    # json can not carry inf / nan
+    return None
+
+  return result
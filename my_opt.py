@@ -0,0 +1,170 @@
+import sys
+import json
+import time
+import functools
+
+from my_cfg import build_cfg, function_args, new_function
+from my_dce import dce_cfg, gvn_cfg
+from my_iv import iv_cfg
+from my_licm import licm_cfg
+from my_mem import mem_cfg
+from my_parallel import imap_functions, parse_args
+from my_sccp import sccp_cfg
+from my_ssa import ssa_cfg, out_of_ssa_cfg
+from my_stream import load_program, open_program, read_functions, write_program
+
+
+# the passes of my_dce.optimize_function, in it's order
+DEFAULT_PIPELINE = "ssa,sccp,mem,gvn,licm,iv,dce,out-of-ssa"
+
+
+def with_arg_names(cfg_pass, cfg, function: dict) -> tuple:
+  # the *_cfg passes take the names of the args
+  return cfg_pass(cfg, function_args(function))
+
+
+def to_ssa(cfg, function: dict) -> tuple:
+  # the conversions do not count, they always change the function
+  return (ssa_cfg(cfg, function.get("args", [])), 1)
+
+
+def from_ssa(cfg, function: dict) -> tuple:
+  return (out_of_ssa_cfg(cfg, function.get("args", [])), 1)
+
+
+# name -> pass(cfg, function) -> (cfg, number of changes made)
+PASSES = {
+  "ssa": to_ssa,
+  "sccp": functools.partial(with_arg_names, sccp_cfg),
+  "mem": functools.partial(with_arg_names, mem_cfg),
+  "gvn": functools.partial(with_arg_names, gvn_cfg),
+  "licm": functools.partial(with_arg_names, licm_cfg),
+  "iv": functools.partial(with_arg_names, iv_cfg),
+  "dce": functools.partial(with_arg_names, dce_cfg),
+  "out-of-ssa": from_ssa,
+}
+
+# the passes which only work on the ssa form
+SSA_PASSES = ("sccp", "mem", "gvn", "licm", "iv")
+
+
+def check_pipeline(names: list) -> str:
+  # what is wrong with the pipeline, None if nothing
+  in_ssa = False
+
+  for name in names:
+    if name not in PASSES:
+      return f'unknown pass {name}, the passes are {", ".join(PASSES.keys())}'
+
+    if name in SSA_PASSES and not in_ssa:
+      return f'{name} needs the ssa form, put ssa before it'
+
+    if name == "ssa":
+      in_ssa = True
+    elif name == "out-of-ssa":
+      in_ssa = False
+
+  return None
+
+
+def carry_analyses(old, new) -> None:
+  # a pass which changed nothing keeps what was worked out before it, the
+  # dominators and the liveness are not computed again by the next pass.
+  # a pass rebuilding the graph (e.g. adding preheaders) may still report
+  # no changes, the edges have to match as well
+  if new is not old and len(new) == len(old) and new.succs == old.succs:
+    new.edge_analyses = old.edge_analyses
+    new.analyses = old.analyses
+
+
+class Pipeline:
+  def __init__(self, names: list) -> None:
+    # pass names, run once each in this order
+    self.names = names
+
+    # pass name -> seconds spent in it, summed over the functions
+    self.times = { name: 0.0 for name in names }
+
+    # pass name -> changes it reported, summed over the functions
+    self.changes = { name: 0 for name in names }
+
+  def run_function(self, function: dict) -> tuple:
+    # (function, [seconds per pass], [changes per pass]), the graph and the
+    # analyses cached with it go from pass to pass, no json in between
+    cfg = build_cfg(function)
+
+    times = []
+    changes = []
+
+    for name in self.names:
+      start = time.perf_counter()
+
+      (new_cfg, pass_changes) = PASSES[name](cfg, function)
+
+      if 0 == pass_changes:
+        carry_analyses(cfg, new_cfg)
+
+      times.append(time.perf_counter() - start)
+      changes.append(pass_changes)
+
+      cfg = new_cfg
+
+    return (new_function(function, cfg.instrs()), times, changes)
+
+  def run_functions(self, functions, jobs: int = 1):
+    # lazy, the functions may be a stream. the workers time their own
+    # share, the totals are in self.times once the functions are used up
+    for (function, times, changes) in imap_functions(self.run_function, jobs, functions):
+      for (name, seconds, pass_changes) in zip(self.names, times, changes):
+        self.times[name] = self.times[name] + seconds
+        self.changes[name] = self.changes[name] + pass_changes
+
+      yield function
+
+  def report(self, out=None) -> None:
+    out = out or sys.stderr
+
+    for name in self.names:
+      print(f'{name}: {self.times[name]:.3f}s, {self.changes[name]} changes', file=out)
+
+    print(f'total: {sum(self.times.values()):.3f}s', file=out)
+
+
+def add_options(parser) -> None:
+  parser.add_argument("-p", "--passes", default=DEFAULT_PIPELINE,
+                      help=f'comma separated passes to run, out of {", ".join(PASSES.keys())}')
+
+
+if __name__ == "__main__":
+  # Python dictionary beign used is expected
+  # in the ordered fashion, which is a feature
+  # in python 3.7 and above
+
+  assert sys.version_info >= (3, 7)
+
+  args = parse_args("runs a pipeline of passes in one process", add_options, streaming=True)
+
+  names = [ name.strip() for name in args.passes.split(",") if name.strip() ]
+  problem = check_pipeline(names)
+
+  if problem is not None:
+    sys.exit(problem)
+
+  pipeline = Pipeline(names)
+
+  start = time.perf_counter()
+
+  with open_program(args.program) as source:
+    if args.stream:
+      reader = read_functions(source)
+      write_program(pipeline.run_functions(reader, args.jobs), reader.extra, args.binary)
+    else:
+      program = load_program(source)
+
+      new_program = {}
+      new_program["functions"] = list(pipeline.run_functions(program["functions"], args.jobs))
+
+      print(json.dumps(new_program))
+
+    pipeline.report()
+    print(f'wall: {time.perf_counter() - start:.3f}s, load and store included', file=sys.stderr)
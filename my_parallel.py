@@ -0,0 +1,114 @@
+import io
+import sys
+import argparse
+import collections
+import functools
+import contextlib
+
+from concurrent.futures import ProcessPoolExecutor
+
+
+def parse_args(description: str, add_options=None, streaming: bool = False) -> argparse.Namespace:
+  parser = argparse.ArgumentParser(description=description)
+
+  parser.add_argument("program", nargs="?", default="-",
+                      help="bril program in json or binary form, stdin if it is - or missing")
+  parser.add_argument("-j", "--jobs", type=int, default=1,
+                      help="number of processes to shard the functions across")
+
+  # the function local passes can work on one function at a time
+  if streaming:
+    parser.add_argument("-s", "--stream", action="store_true",
+                        help="read, transform and write one function at a time, "
+                             "memory stays around the size of the largest function")
+    parser.add_argument("-B", "--binary", action="store_true",
+                        help="write the binary form of my_binary instead of json, implies --stream")
+
+  # the scripts can add their own options
+  if add_options is not None:
+    add_options(parser)
+
+  args = parser.parse_args()
+
+  if streaming and args.binary:
+    # the binary form is only written a function at a time
+    args.stream = True
+
+  return args
+
+
+def open_program(path: str):
+  # "-" is stdin, so the scripts can sit in a pipe after bril2json
+  if path == "-":
+    return contextlib.nullcontext(sys.stdin)
+
+  return open(path)
+
+
+def chunk_size(count: int, jobs: int) -> int:
+  # a few chunks per worker, big enough to amortize the pickling
+  return max(1, count // (jobs * 4))
+
+
+def map_functions(function_pass, jobs: int, functions: list, *iterables) -> list:
+  # function_pass(function, *extra) is applied to every function,
+  # the results come back in the order of the functions
+  if jobs <= 1 or len(functions) <= 1:
+    return list(map(function_pass, functions, *iterables))
+
+  with ProcessPoolExecutor(max_workers=jobs) as executor:
+    return list(executor.map(function_pass, functions, *iterables,
+                             chunksize=chunk_size(len(functions), jobs)))
+
+
+def imap_functions(function_pass, jobs: int, functions, *iterables):
+  # lazy map_functions: the functions may be a stream, only a few of them
+  # are read ahead of the results handed out, which come in order
+  if jobs <= 1:
+    yield from map(function_pass, functions, *iterables)
+    return
+
+  with ProcessPoolExecutor(max_workers=jobs) as executor:
+    pending = collections.deque()
+
+    for args in zip(functions, *iterables):
+      pending.append(executor.submit(function_pass, *args))
+
+      if len(pending) >= 2 * jobs:
+        yield pending.popleft().result()
+
+    while pending:
+      yield pending.popleft().result()
+
+
+def capture_output(function_pass, *args) -> tuple:
+  output = io.StringIO()
+
+  try:
+    with contextlib.redirect_stdout(output):
+      result = function_pass(*args)
+  except SystemExit as error:
+    # the passes bail out with exit(), keep what they printed before it
+    result = error
+
+  return (result, output.getvalue())
+
+
+def report_functions(function_pass, jobs: int, functions: list, *iterables) -> list:
+  # same as map_functions, for the passes which print as they go.
+  # whatever a worker prints is replayed in the order of the functions
+  if jobs <= 1 or len(functions) <= 1:
+    return list(map(function_pass, functions, *iterables))
+
+  results = []
+
+  for (result, output) in map_functions(functools.partial(capture_output, function_pass),
+                                        jobs, functions, *iterables):
+    sys.stdout.write(output)
+
+    if isinstance(result, SystemExit):
+      raise result
+
+    results.append(result)
+
+  return results
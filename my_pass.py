@@ -0,0 +1,69 @@
+from my_cfg import build_cfg, function_args, new_function
+from my_parallel import map_functions
+
+
+class PassManager:
+  def __init__(self, passes: list) -> None:
+    # function local passes, run in the given order:
+    # pass(cfg, function args) -> (cfg, number of changes made)
+    self.passes = passes
+
+    # number of rounds the last run took to converge
+    self.rounds = 0
+
+  def run_function(self, cfg, args: list) -> tuple:
+    changes = 0
+
+    for function_pass in self.passes:
+      (cfg, pass_changes) = function_pass(cfg, args)
+      changes = changes + pass_changes
+
+    return (cfg, changes)
+
+  def run_to_fixpoint(self, function: dict) -> dict:
+    cfg = build_cfg(function)
+    args = function_args(function)
+
+    while True:
+      (cfg, changes) = self.run_function(cfg, args)
+
+      if 0 == changes:
+        return new_function(function, cfg.instrs())
+
+  def run(self, program: dict, jobs: int = 1) -> dict:
+    functions = program["functions"]
+
+    if jobs > 1:
+      # the passes are function local, so every worker
+      # takes its share of the functions to a fixpoint alone
+      new_program = {}
+      new_program["functions"] = map_functions(self.run_to_fixpoint, jobs, functions)
+
+      return new_program
+
+    # the graphs are built once and handed from pass to pass
+    cfgs = [ build_cfg(function) for function in functions ]
+    args = [ function_args(function) for function in functions ]
+
+    # functions changed in the last round, all of them to begin with
+    dirty = list(range(len(functions)))
+
+    self.rounds = 0
+
+    while dirty:
+      still_dirty = []
+
+      for id in dirty:
+        (cfgs[id], changes) = self.run_function(cfgs[id], args[id])
+
+        if 0 != changes:
+          still_dirty.append(id)
+
+      dirty = still_dirty
+      self.rounds = self.rounds + 1
+
+    new_program = {}
+    new_program["functions"] = [ new_function(function, cfg.instrs())
+                                 for (function, cfg) in zip(functions, cfgs) ]
+
+    return new_program
@@ -0,0 +1,301 @@
+import sys
+import json
+
+from my_cfg import CFG, build_cfg, function_args, new_function
+from my_ops import EVALUATORS, constant_key, evaluate
+from my_parallel import map_functions, parse_args
+from my_ssa import UNDEFINED, ssa_cfg, out_of_ssa_cfg
+from my_stream import load_program, open_program, stream_program
+
+
+# lattice of a variable: missing (nothing known yet), a constant or NOT_CONSTANT
+NOT_CONSTANT = object()
+
+
+class Constant:
+  __slots__ = ("value",)
+
+  def __init__(self, value) -> None:
+    self.value = value
+
+  def __eq__(self, other: object) -> bool:
+    # `true` and `1` are different constants, so are -0.0 and 0.0
+    return isinstance(other, Constant) and constant_key(self.value) == constant_key(other.value)
+
+  def __hash__(self) -> int:
+    return hash(constant_key(self.value))
+
+
+class SCCP:
+  # wegman and zadeck's sparse conditional constant propagation, the cfg has
+  # to be in ssa form. values and executable edges are found together: a
+  # branch on a constant only makes one edge executable, and whatever flows
+  # in over a dead edge does not disturb the phis
+  def __init__(self, cfg: CFG, args: list) -> None:
+    self.cfg = cfg
+
+    # variable -> Constant or NOT_CONSTANT
+    self.values = { arg: NOT_CONSTANT for arg in args }
+
+    # variable -> [(block id, instruction)] reading it
+    self.uses = {}
+
+    defined = set(args)
+
+    for (id, insts) in enumerate(cfg.blocks):
+      for inst in insts:
+        for arg in inst.get("args", []):
+          self.uses.setdefault(arg, []).append((id, inst))
+
+        if "dest" in inst:
+          defined.add(inst["dest"])
+
+    for var in self.uses.keys():
+      if var not in defined and var != UNDEFINED:
+        # read without ever being written, nothing to assume
+        self.values[var] = NOT_CONSTANT
+
+    # (source, target) edges and blocks known to run
+    self.executable_edges = set()
+    self.executable = bytearray(len(cfg))
+
+    self.edge_work_list = []
+    self.ssa_work_list = []
+
+    if len(cfg):
+      self.reach(cfg.entry)
+
+    while True:
+      self.propagate()
+
+      # a branch on a value which is only ever undefined has no edge to take,
+      # the program reads garbage there. both ways stay, or the targets would
+      # be deleted under the branch
+      undecided = [ inst["args"][0] for (id, insts) in enumerate(cfg.blocks) if self.executable[id]
+                    for inst in insts[-1:] if inst.get("op") == "br" and self.value(inst["args"][0]) is None ]
+
+      if not undecided:
+        break
+
+      for var in undecided:
+        self.update(var, NOT_CONSTANT)
+
+  def propagate(self) -> None:
+    cfg = self.cfg
+
+    while self.edge_work_list or self.ssa_work_list:
+      while self.edge_work_list:
+        (source, target) = self.edge_work_list.pop()
+
+        if self.executable[target]:
+          # only the phis see the new edge
+          for inst in cfg.blocks[target]:
+            if inst.get("op") == "phi":
+              self.visit(target, inst)
+        else:
+          self.reach(target)
+
+      while self.ssa_work_list:
+        var = self.ssa_work_list.pop()
+
+        for (id, inst) in self.uses.get(var, []):
+          if self.executable[id]:
+            self.visit(id, inst)
+
+  def reach(self, block: int) -> None:
+    self.executable[block] = 1
+
+    for inst in self.cfg.blocks[block]:
+      self.visit(block, inst)
+
+    insts = self.cfg.blocks[block]
+
+    if not insts or insts[-1].get("op") not in ("br", "jmp", "ret"):
+      for succ in self.cfg.succs[block]:
+        self.mark_edge(block, succ)
+
+  def mark_edge(self, source: int, target: int) -> None:
+    if (source, target) not in self.executable_edges:
+      self.executable_edges.add((source, target))
+      self.edge_work_list.append((source, target))
+
+  def value(self, var: str):
+    return self.values.get(var)
+
+  def update(self, var: str, value) -> None:
+    old = self.values.get(var)
+
+    if old is NOT_CONSTANT or old == value:
+      return
+
+    if old is not None and value is not None:
+      # two different constants
+      value = NOT_CONSTANT
+
+    if value is None:
+      return
+
+    self.values[var] = value
+    self.ssa_work_list.append(var)
+
+  def visit(self, block: int, inst: dict) -> None:
+    cfg = self.cfg
+    op = inst.get("op")
+
+    if op == "br":
+      condition = self.value(inst["args"][0])
+
+      if condition is NOT_CONSTANT:
+        targets = inst["labels"]
+      elif condition is not None:
+        targets = [ inst["labels"][0 if condition.value else 1] ]
+      else:
+        targets = []
+
+      for label in targets:
+        self.mark_edge(block, cfg.index[label])
+    elif op == "jmp":
+      self.mark_edge(block, cfg.index[inst["labels"][0]])
+
+    if "dest" not in inst:
+      return
+
+    dest = inst["dest"]
+
+    if op == "phi":
+      value = None
+
+      for (arg, label) in zip(inst["args"], inst["labels"]):
+        if label not in cfg.index or (cfg.index[label], block) not in self.executable_edges:
+          continue
+
+        arg_value = self.value(arg)
+
+        if arg_value is None:
+          continue
+
+        if value is None:
+          value = arg_value
+        elif value is NOT_CONSTANT or arg_value is NOT_CONSTANT or value != arg_value:
+          value = NOT_CONSTANT
+          break
+
+      self.update(dest, value)
+    elif op == "const":
+      self.update(dest, Constant(inst["value"]))
+    elif op == "id":
+      self.update(dest, self.value(inst["args"][0]))
+    elif op in EVALUATORS:
+      arg_values = [ self.value(arg) for arg in inst.get("args", []) ]
+
+      if any([ arg_value is NOT_CONSTANT for arg_value in arg_values ]):
+        self.update(dest, NOT_CONSTANT)
+      elif all([ arg_value is not None for arg_value in arg_values ]):
+        result = evaluate(op, [ arg_value.value for arg_value in arg_values ])
+        self.update(dest, NOT_CONSTANT if result is None else Constant(result))
+    else:
+      # calls, loads, ...
+      self.update(dest, NOT_CONSTANT)
+
+  def constant(self, var: str):
+    # the Constant of the variable, None if it is not one
+    value = self.values.get(var)
+
+    return value if isinstance(value, Constant) else None
+
+
+def sccp_cfg(cfg: CFG, args: list) -> tuple:
+  # the variables found constant get a const definition, the branches on
+  # constants become jumps and the blocks which can not run are deleted
+  sccp = SCCP(cfg, args)
+  changes = 0
+
+  blocks = []
+
+  for (id, insts) in enumerate(cfg.blocks):
+    if not sccp.executable[id]:
+      blocks.append(insts)
+      continue
+
+    labels = []
+    phis = []
+    body = []
+
+    for inst in insts:
+      op = inst.get("op")
+      constant = sccp.constant(inst["dest"]) if "dest" in inst else None
+
+      if "label" in inst:
+        labels.append(inst)
+      elif constant is not None and op != "const" and (op == "phi" or op == "id" or op in EVALUATORS):
+        const = { "op": "const", "dest": inst["dest"], "type": inst.get("type"), "value": constant.value }
+
+        # the phis stay together at the top of the block
+        (body if op != "phi" else phis).append(const)
+        changes = changes + 1
+      elif op == "phi":
+        # the arguments coming over the edges which never run go
+        live = [ (arg, label) for (arg, label) in zip(inst["args"], inst["labels"])
+                 if label in cfg.index and (cfg.index[label], id) in sccp.executable_edges ]
+
+        if len(live) != len(inst["args"]):
+          changes = changes + 1
+
+        if 1 == len(live) and live[0][0] != UNDEFINED:
+          inst = { "op": "id", "dest": inst["dest"], "type": inst.get("type"), "args": [ live[0][0] ] }
+        else:
+          inst = dict(inst)
+          inst["args"] = [ arg for (arg, _) in live ]
+          inst["labels"] = [ label for (_, label) in live ]
+
+        phis.append(inst)
+      elif op == "br" and sccp.constant(inst["args"][0]) is not None:
+        taken = inst["labels"][0 if sccp.constant(inst["args"][0]).value else 1]
+        body.append({ "op": "jmp", "labels": [ taken ] })
+        changes = changes + 1
+      else:
+        body.append(inst)
+
+    # ids first among the phis would read the other phis' results, they go after them
+    phi_insts = [ inst for inst in phis if inst.get("op") == "phi" ]
+    other_insts = [ inst for inst in phis if inst.get("op") != "phi" ]
+
+    blocks.append(labels + phi_insts + other_insts + body)
+
+  keep = [ id for id in range(len(cfg)) if sccp.executable[id] ]
+  changes = changes + sum([ len(cfg.blocks[id]) for id in range(len(cfg)) if not sccp.executable[id] ])
+
+  return (cfg.with_blocks(blocks).subgraph(keep), changes)
+
+
+def sccp_function(function: dict) -> dict:
+  cfg = ssa_cfg(build_cfg(function), function.get("args", []))
+  (cfg, _) = sccp_cfg(cfg, function_args(function))
+  cfg = out_of_ssa_cfg(cfg, function.get("args", []))
+
+  return new_function(function, cfg.instrs())
+
+
+def sccp(program: dict, jobs: int = 1) -> dict:
+  new_program = {}
+  new_program["functions"] = map_functions(sccp_function, jobs, program["functions"])
+
+  return new_program
+
+
+if __name__ == "__main__":
+  # Python dictionary beign used is expected
+  # in the ordered fashion, which is a feature
+  # in python 3.7 and above
+
+  assert sys.version_info >= (3, 7)
+
+  args = parse_args("sparse conditional constant propagation", streaming=True)
+
+  if args.stream:
+    stream_program(sccp_function, args.program, args.jobs, binary=args.binary)
+  else:
+    with open_program(args.program) as source:
+      program = load_program(source)
+
+      print(json.dumps(sccp(program, args.jobs)))
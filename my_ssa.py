@@ -1,248 +1,573 @@
 import sys
-import time
 import json
 
+from my_cfg import CFG, build_cfg, connect, with_entry_block, new_function
+from my_dfa import live_variables_analysis
+from my_dom import compute_dominators, dominance_frontiers, iterated_dominance_frontier
+from my_ir import Names
+from my_ops import TERMINATOR_OPS
+from my_parallel import map_functions, parse_args, report_functions
+from my_stream import load_program, open_program, stream_program
 
-GENERATED_BLOCK_NAME_PERFIX = 'r'
 
+# the phi argument for a predecessor the variable is not defined on
+UNDEFINED = "__undefined"
 
-class Node:
-  def __init__(self, name: str,
-               predecessors: list,
-               successors: list) -> None:
-    # name of this basic block
-    self.name = name
 
-    # labels of the basic blocks
-    self.predecessors = predecessors
-    self.successors = successors
+class Versions(Names):
+  # taken: every variable name in the function, the versions must not clash
+  # with them. the versions are spelled right away, the ssa form is json
+  def fresh(self, var: str) -> str:
+    return self.spelling(super().fresh(var))
 
 
-def gen_rand_name() -> str:
-  t = time.time()
-  return f'{GENERATED_BLOCK_NAME_PERFIX}_{t}'
+class Phi:
+  __slots__ = ("var", "type", "sources", "dest", "incoming")
 
+  def __init__(self, var: str, type, sources: dict = None) -> None:
+    self.var = var
+    self.type = type
 
-def get_block_name(label: str) -> str:
-  return f'{label}'
+    # pred block id -> variable read along that edge,
+    # None for the inserted phis which read var on every edge
+    self.sources = sources
 
+    self.dest = None
 
-def blockify(insts: list, func: str) -> dict:
-  blocks = {}
+    # pred block id -> ssa name flowing in along that edge
+    self.incoming = {}
 
-  current_block_name = get_block_name(func)
-  current_block_insts = []
+  def source(self, pred: int) -> str:
+    if self.sources is None:
+      return self.var
 
-  for inst in insts:
-    if "op" in inst.keys():
-      op = inst["op"]
+    return self.sources.get(pred, UNDEFINED)
 
-      if op == "br" or op == "jmp" or op == "ret":
-        current_block_insts.append(inst)
+  def to_inst(self, cfg: CFG, preds: list) -> dict:
+    return { "op": "phi", "dest": self.dest, "type": self.type,
+             "args": [ self.incoming.get(pred, UNDEFINED) for pred in preds ],
+             "labels": [ cfg.names[pred] for pred in preds ] }
 
-        blocks[current_block_name] = current_block_insts
 
-        current_block_name = gen_rand_name()
-        current_block_insts = []        
-      else:
-        current_block_insts.append(inst)
+def ssa_cfg(cfg: CFG, args: list) -> CFG:
+  # args are the argument dicts of the function (name and type).
+  # phis go to the iterated dominance frontier of the definitions, but only
+  # where the variable is live, then a dominator tree walk renames everything
+  # with a stack of versions per variable. the unreachable blocks are dropped
+  if 0 == len(cfg):
+    return cfg
 
-    elif "label" in inst.keys():
-      if current_block_insts:
-        blocks[current_block_name] = current_block_insts
+  if cfg.preds[cfg.entry]:
+    # the phis of the entry would need a predecessor for the function start
+    cfg = with_entry_block(cfg)
 
-      current_block_name = get_block_name(inst["label"])
-      current_block_insts = [ inst ]
-    else:
-      print(f"Illegal instruction detected: {inst}")
-      exit(1)
+  doms = compute_dominators(cfg)
+  frontiers = dominance_frontiers(doms)
 
-  if current_block_insts:
-    blocks[current_block_name] = current_block_insts
+  liveness = live_variables_analysis(cfg)
+  variables = liveness.analysis.variables
 
-  return blocks
+  # variable -> type, variable -> [block id defining it]
+  types = {}
+  def_blocks = {}
 
+  taken = { UNDEFINED }
 
-def build_cfg(blocks: dict) -> dict:
-  # label -> Node
-  cfg = {}
+  for arg in args:
+    types[arg["name"]] = arg.get("type")
+    def_blocks[arg["name"]] = [ cfg.entry ]
+    taken.add(arg["name"])
 
-  blocks = list(blocks.items())
+  for insts in cfg.blocks:
+    for inst in insts:
+      taken.update(inst.get("args", []))
 
-  for (block_idx, (label, insts)) in enumerate(blocks):
-    last_inst = insts[-1]
+      if "dest" in inst:
+        taken.add(inst["dest"])
 
-    if "op" in last_inst:
-      op = last_inst["op"]
+  # block id -> [Phi]
+  phis = [ [] for _ in range(len(cfg)) ]
 
-      if op == "br" or op == "jmp":
-        target_labels = last_inst["labels"]
-      elif op == "ret":
-        target_labels = []
-      else:
-        # flows to the next block implicitly
+  # block id -> instructions to rename, without the phis
+  bodies = [ [] for _ in range(len(cfg)) ]
+
+  for id in doms.preorder:
+    for inst in cfg.blocks[id]:
+      if "dest" in inst:
+        dest = inst["dest"]
+
+        if dest not in types:
+          types[dest] = inst.get("type")
+
+        blocks = def_blocks.setdefault(dest, [])
+
+        if not blocks or blocks[-1] != id:
+          blocks.append(id)
 
-        if block_idx + 1 < len(blocks):
-          target_labels = [ blocks[block_idx + 1][0] ]
-        else:
-          target_labels = []
+      if inst.get("op") == "phi":
+        # already there (the input is partly in ssa), renamed like the inserted ones
+        sources = {}
 
-      if label not in cfg.keys():
-        cfg[label] = Node(label, [], target_labels)
+        for (arg, label) in zip(inst.get("args", []), inst.get("labels", [])):
+          if label in cfg.index:
+            sources[cfg.index[label]] = arg
+
+        phis[id].append(Phi(inst["dest"], inst.get("type"), sources))
       else:
-        cfg[label].successors = target_labels
+        bodies[id].append(inst)
 
-      for target_label in target_labels:
-        if target_label not in cfg.keys():
-          cfg[target_label] = Node(target_label, [], [])
+  for (var, blocks) in def_blocks.items():
+    var_bit = variables.bit(var)
 
-        target = cfg[target_label]
-        target.predecessors.append(label)
-    else:
-      # implicit return maybe?
-      if label not in cfg.keys():
-        cfg[label] = Node(label, [], [])
+    for join in iterated_dominance_frontier(frontiers, blocks):
+      # pruned: a dead variable does not need to be merged
+      if liveness.ins[join] & var_bit:
+        phis[join].append(Phi(var, types[var]))
+
+  # variable -> [ssa name], the top is the version reaching the current point
+  stacks = { arg["name"]: [ arg["name"] ] for arg in args }
+  versions = Versions(taken)
+
+  def current(var: str) -> str:
+    stack = stacks.get(var)
+
+    return stack[-1] if stack else None
+
+  # block id -> [variable] versions pushed by the block, popped when leaving it
+  pushed = [ None ] * len(cfg)
 
-  return cfg
+  work_list = [ (cfg.entry, False) ]
 
+  while work_list:
+    (node, leaving) = work_list.pop()
 
-def get_arg_name(arg: str, counter: int) -> str:
-  return f'{arg}_{counter}'
+    if leaving:
+      for var in pushed[node]:
+        stacks[var].pop()
 
+      pushed[node] = None
+      continue
+
+    defined = []
+
+    for phi in phis[node]:
+      phi.dest = versions.fresh(phi.var)
+      stacks.setdefault(phi.var, []).append(phi.dest)
+      defined.append(phi.var)
+
+    new_insts = []
+
+    for inst in bodies[node]:
+      inst = dict(inst)
+
+      if "args" in inst:
+        # an undefined variable stays as it is, the program reads garbage anyway
+        inst["args"] = [ current(arg) or arg for arg in inst["args"] ]
+
+      if "dest" in inst:
+        var = inst["dest"]
+        inst["dest"] = versions.fresh(var)
+        stacks.setdefault(var, []).append(inst["dest"])
+        defined.append(var)
 
-def update_state(dest: str, state: dict, current_block_state: dict) -> int:
-  count = 0
+      new_insts.append(inst)
 
-  if dest in state.keys():
-    count = state[dest] + 1
+    bodies[node] = new_insts
+    pushed[node] = defined
 
-  state[dest] = count
+    for succ in set(cfg.succs[node]):
+      for phi in phis[succ]:
+        name = current(phi.source(node))
 
-  if current_block_state is not None:
-    current_block_state[dest] = count
+        if name is not None:
+          phi.incoming[node] = name
 
-  return count
+    work_list.append((node, True))
 
+    for child in reversed(doms.children[node]):
+      work_list.append((child, False))
 
-def convert_blocks_to_ssa(entry_block: str, blocks: dict, cfg: dict,
-                          state: dict = {}, block_states: dict = {},
-                          out_blocks: dict = {}, ssa_sarted: list = [],
-                          ssa_completed: list = []) -> dict:
+  # block id -> [pred block id], reachable and without duplicates
+  preds = [ [] for _ in range(len(cfg)) ]
 
-  modified_insts = []
+  # the preds the phis name need a label, even if they started without one
+  labelled = bytearray(len(cfg))
 
-  # variable name -> [count]
-  current_block_state = {}
+  for id in doms.preorder:
+    if phis[id]:
+      preds[id] = [ pred for pred in dict.fromkeys(cfg.preds[id]) if doms.reachable(pred) ]
 
-  for predecessor in cfg[entry_block].predecessors:
-    if predecessor not in block_states.keys():
+      for pred in preds[id]:
+        labelled[pred] = 1
+
+  names = []
+  blocks = []
+  generated = []
+
+  for id in range(len(cfg)):
+    if not doms.reachable(id):
       continue
 
-    # variable and it's count
-    pred_block_state = block_states[predecessor]
+    insts = []
+    has_label = bool(cfg.blocks[id]) and "label" in cfg.blocks[id][0]
+
+    if has_label:
+      insts.append(cfg.blocks[id][0])
+    elif labelled[id]:
+      insts.append({ "label": cfg.names[id] })
+
+    insts.extend([ phi.to_inst(cfg, preds[id]) for phi in phis[id] ])
+    insts.extend([ inst for inst in bodies[id] if "op" in inst ])
+
+    names.append(cfg.names[id])
+    blocks.append(insts)
+    generated.append(not has_label and not labelled[id] and cfg.generated[id])
+
+  return connect(CFG(cfg.func, names, blocks, generated, cfg.name_gen))
 
-    for (var_name, count) in pred_block_state.items():
-      if var_name in current_block_state.keys():
-        # phi node is needed for this
-        current_block_state[var_name].append(count)
+
+def sequentialize(copies: list, temporary) -> list:
+  # copies is a parallel copy [(dest, source)], every dest at most once.
+  # returns [(dest, source)] to run one after the other. a dest nobody reads
+  # any more is written first, a cycle is broken by saving one of it's
+  # values in temporary(dest), so a cycle costs one extra copy
+  sequence = []
+
+  # dest -> source, value -> where it is right now
+  pred = {}
+  location = {}
+
+  todo = []
+
+  for (dest, source) in copies:
+    if dest != source:
+      location[source] = source
+      pred[dest] = source
+      todo.append(dest)
+
+  ready = [ dest for dest in todo if dest not in location ]
+
+  while todo:
+    while ready:
+      dest = ready.pop()
+      source = pred[dest]
+      current = location[source]
+
+      sequence.append((dest, current))
+      location[source] = dest
+
+      if source == current and source in pred:
+        # the value of source is saved in dest, source can be overwritten now
+        ready.append(source)
+
+    dest = todo.pop()
+
+    if dest != location[pred[dest]]:
+      # still not written, so it is on a cycle
+      saved = temporary(dest)
+
+      sequence.append((saved, dest))
+      location[dest] = saved
+      ready.append(dest)
+
+  return sequence
+
+
+def out_of_ssa_cfg(cfg: CFG, args: list) -> CFG:
+  # args are the argument dicts of the function (name and type).
+  # phi webs (and id copies) whose live ranges do not interfere are coalesced
+  # into one variable, what is left of the phis becomes parallel copies at the
+  # end of the predecessors, on a new block if the edge is critical
+  if 0 == len(cfg):
+    return cfg
+
+  doms = compute_dominators(cfg)
+
+  liveness = live_variables_analysis(cfg)
+  variables = liveness.analysis.variables
+
+  # variable -> (block id, position of the definition in the block),
+  # the phis are defined together before the block, the args before them
+  defs = {}
+  types = {}
+
+  for arg in args:
+    defs[arg["name"]] = (cfg.entry, -2)
+    types[arg["name"]] = arg.get("type")
+
+  # block id -> { variable -> position of the last use in the block }
+  last_use = [ {} for _ in range(len(cfg)) ]
+
+  for (id, insts) in enumerate(cfg.blocks):
+    for (position, inst) in enumerate(insts):
+      if inst.get("op") == "phi":
+        position = -1
       else:
-        current_block_state[var_name] = [ count ]
+        for arg in inst.get("args", []):
+          last_use[id][arg] = position
 
-  for (var_name, counters) in current_block_state.items():
-    assert (0 != len(counters))
+      if "dest" in inst:
+        defs[inst["dest"]] = (id, position)
+        types[inst["dest"]] = inst.get("type")
 
-    if 1 != len(counters):
-      # insert the phi node
-      # todo: insert the phi node correctly
-      # and get the type information correctly
-      modified_insts.append(None)
+  def live_after(var: str, block: int, position: int) -> bool:
+    return bool(liveness.outs[block] & variables.bit(var)) or last_use[block].get(var, -3) > position
 
-      count = update_state(var_name, state)
-      current_block_state[var_name] = [ count ]
+  def interfere(a: str, b: str) -> bool:
+    # in ssa two live ranges meet only if one of the definitions dominates the
+    # other and that variable is still live after the other definition
+    ((a_block, a_position), (b_block, b_position)) = (defs[a], defs[b])
 
-  for inst in blocks[entry_block]:
-    if "args" in inst.keys():
-      new_args = []
+    if a_block == b_block:
+      if a_position == b_position:
+        # defined together (phis, args), kept apart
+        return True
 
-      for arg in inst["args"]:
-        if arg not in current_block_state.keys():
-          # maybe this is the function argument
-          # So, do not rename
-          new_args.append(arg)
-        else:
-          counter = current_block_state[arg]
-          new_args.append(get_arg_name(arg, counter))
+      if a_position < b_position:
+        return live_after(a, b_block, b_position)
 
-      inst["args"] = new_args
+      return live_after(b, a_block, a_position)
 
-    if "dest" in inst.keys():
-      dest = inst["dest"]
-      count = update_state(dest, state, current_block_state)
-      inst["dest"] = get_arg_name(dest, count)
+    if doms.dominates(a_block, b_block):
+      return live_after(a, b_block, b_position)
 
-    modified_insts.append(inst)
+    if doms.dominates(b_block, a_block):
+      return live_after(b, a_block, a_position)
 
-  ssa_sarted.append(entry_block)
+    return False
 
-  all_predecessors_ssa_ed = True
+  # variable -> the variable it is coalesced into (union find)
+  leader = {}
+  members = {}
 
-  for predecessor in cfg[entry_block].predecessors:
-    if predecessor not in ssa_sarted:
-      all_predecessors_ssa_ed = False
+  def find(var: str) -> str:
+    root = var
 
-  if all_predecessors_ssa_ed:
-    ssa_completed.append(entry_block)
-    out_blocks[entry_block] = modified_insts
+    while leader.get(root, root) != root:
+      root = leader[root]
 
-  for successor in cfg[entry_block].successors:
-    if successor not in ssa_completed:
-      convert_blocks_to_ssa(successor, blocks, cfg, state, block_states, out_blocks, ssa_completed)
+    while var != root:
+      (var, leader[var]) = (leader[var], root)
 
-  return out_blocks
+    return root
 
+  def coalesce(a: str, b: str) -> None:
+    if a not in defs or b not in defs or types.get(a) != types.get(b):
+      return
 
-def convert_to_ssa(program: dict) -> dict:
-  # make the blocks
-  new_program = {}
-  new_functions = []  
+    (a, b) = (find(a), find(b))
+
+    if a == b:
+      return
+
+    a_members = members.get(a, [ a ])
+    b_members = members.get(b, [ b ])
+
+    for a_member in a_members:
+      for b_member in b_members:
+        if interfere(a_member, b_member):
+          return
+
+    if b in defs and defs[b][1] == -2:
+      # an argument has to keep it's name
+      (a, b) = (b, a)
+      (a_members, b_members) = (b_members, a_members)
 
-  for function in program["functions"]:
-    new_function = {}
-    instrs = function["instrs"]
-    func_name = function["name"]
-    blocks = blockify(instrs, func_name)
-    cfg = build_cfg(blocks)
+    leader[b] = a
+    members[a] = a_members + b_members
+    members.pop(b, None)
 
-    for (node_label, node) in cfg.items():
-      print(f'{node_label}  <- ({node.predecessors}) -> ({node.successors})')
+  for insts in cfg.blocks:
+    for inst in insts:
+      if inst.get("op") == "phi":
+        for arg in inst["args"]:
+          coalesce(inst["dest"], arg)
 
-    modified_blocks = convert_blocks_to_ssa(func_name, blocks, cfg)
+  for insts in cfg.blocks:
+    for inst in insts:
+      if inst.get("op") == "id":
+        coalesce(inst["dest"], inst["args"][0])
 
-    # print('----------------------------')
+  # edge -> parallel copy [(dest, source)] for the phis of the target
+  edge_copies = {}
 
-    modified_instrs = []
+  for (id, insts) in enumerate(cfg.blocks):
+    for inst in insts:
+      if inst.get("op") != "phi":
+        continue
 
-    for (block_label, _) in blocks.items():
-      block_insts = modified_blocks[block_label]
+      dest = find(inst["dest"])
 
-      modified_instrs.extend(block_insts)
+      for (arg, label) in zip(inst["args"], inst["labels"]):
+        if arg == UNDEFINED or arg not in defs or label not in cfg.index:
+          continue
 
-    new_function["instrs"] = modified_instrs
-    new_function["name"] = func_name
+        source = find(arg)
 
-    if "args" in function.keys():
-      new_function["args"] = function["args"]
+        if source != dest:
+          edge_copies.setdefault((cfg.index[label], id), []).append((dest, source))
 
-    if "type" in function.keys():
-      new_function["type"] = function["type"]
+  # types of the temporaries breaking the copy cycles -> name
+  temporaries = {}
+  taken = set(defs.keys())
 
-    new_functions.append(new_function)
+  for insts in cfg.blocks:
+    for inst in insts:
+      taken.update(inst.get("args", []))
 
-  new_program["functions"] = new_functions
+  versions = Versions(taken)
+
+  def temporary(dest: str) -> str:
+    type = types.get(dest)
+    key = json.dumps(type, sort_keys=True)
+
+    if key not in temporaries:
+      temporaries[key] = versions.fresh("ssa_tmp")
+      types[temporaries[key]] = type
+
+    return temporaries[key]
+
+  def copy_insts(copies: list) -> list:
+    return [ { "op": "id", "dest": dest, "type": types.get(dest), "args": [ source ] }
+             for (dest, source) in sequentialize(copies, temporary) ]
+
+  def rename(inst: dict) -> dict:
+    inst = dict(inst)
+
+    if "args" in inst:
+      inst["args"] = [ find(arg) if arg in defs else arg for arg in inst["args"] ]
+
+    if "dest" in inst:
+      inst["dest"] = find(inst["dest"])
+
+    return inst
+
+  # block id -> copies going to the top of the block (it's only pred branches)
+  head_copies = [ [] for _ in range(len(cfg)) ]
+
+  # block id -> copies going before the terminator
+  tail_copies = [ [] for _ in range(len(cfg)) ]
+
+  # block id -> [(name, instructions)] of the blocks splitting it's edges
+  split_blocks = [ [] for _ in range(len(cfg)) ]
+
+  # (pred, target) -> label to jump to instead of the target
+  redirect = {}
+
+  for ((pred, target), copies) in edge_copies.items():
+    last = cfg.blocks[pred][-1] if cfg.blocks[pred] else {}
+    branches = last.get("op") == "br"
+
+    if not branches:
+      tail_copies[pred].extend(copies)
+    elif 1 == len(set(cfg.preds[target])):
+      head_copies[target].extend(copies)
+    else:
+      # critical edge, the copies get a block of their own
+      name = cfg.name_gen.fresh()
+      redirect[(pred, target)] = name
+
+      split_blocks[pred].append((name, [ { "label": name } ] + copy_insts(copies) +
+                                       [ { "op": "jmp", "labels": [ cfg.names[target] ] } ]))
+
+  names = []
+  blocks = []
+  generated = []
+
+  for (id, insts) in enumerate(cfg.blocks):
+    new_insts = []
+    body = []
+
+    for inst in insts:
+      if "label" in inst:
+        new_insts.append(inst)
+      elif inst.get("op") == "phi":
+        continue
+      elif inst.get("op") == "id" and find(inst["dest"]) == find(inst["args"][0]) \
+           and inst["args"][0] in defs:
+        # coalesced away
+        continue
+      else:
+        body.append(rename(inst))
+
+    new_insts.extend(copy_insts(head_copies[id]))
+
+    if body and body[-1].get("op") in TERMINATOR_OPS:
+      terminator = body.pop()
+    else:
+      terminator = None
+
+    new_insts.extend(body)
+    new_insts.extend(copy_insts(tail_copies[id]))
+
+    if terminator is not None:
+      if "labels" in terminator:
+        terminator["labels"] = [ redirect.get((id, cfg.index[label]), label)
+                                 for label in terminator["labels"] ]
+
+      new_insts.append(terminator)
+
+    names.append(cfg.names[id])
+    blocks.append(new_insts)
+    generated.append(cfg.generated[id])
+
+    for (name, split_insts) in split_blocks[id]:
+      # right after the branch, so nothing falls through into it
+      names.append(name)
+      blocks.append(split_insts)
+      generated.append(False)
+
+  return connect(CFG(cfg.func, names, blocks, generated, cfg.name_gen))
+
+
+def convert_function_to_ssa(function: dict) -> dict:
+  cfg = build_cfg(function)
+
+  for (id, label) in enumerate(cfg.names):
+    preds = [ cfg.names[pred] for pred in cfg.preds[id] ]
+    succs = [ cfg.names[succ] for succ in cfg.succs[id] ]
+
+    print(f'{label}  <- ({preds}) -> ({succs})')
+
+  ssa = ssa_cfg(cfg, function.get("args", []))
+
+  return new_function(function, ssa.instrs())
+
+
+def ssa_function(function: dict) -> dict:
+  # convert_function_to_ssa without the listing of the graph
+  cfg = ssa_cfg(build_cfg(function), function.get("args", []))
+
+  return new_function(function, cfg.instrs())
+
+
+def convert_to_ssa(program: dict, jobs: int = 1) -> dict:
+  new_program = {}
+  new_program["functions"] = report_functions(convert_function_to_ssa, jobs,
+                                              program["functions"])
 
   return new_program
 
 
+def convert_function_from_ssa(function: dict) -> dict:
+  cfg = out_of_ssa_cfg(build_cfg(function), function.get("args", []))
+
+  return new_function(function, cfg.instrs())
+
+
+def convert_from_ssa(program: dict, jobs: int = 1) -> dict:
+  new_program = {}
+  new_program["functions"] = map_functions(convert_function_from_ssa, jobs,
+                                           program["functions"])
+
+  return new_program
+
+
+def add_options(parser) -> None:
+  parser.add_argument("-o", "--out-of-ssa", action="store_true",
+                      help="convert an ssa program back to plain bril (no phis)")
+
+
 if __name__ == "__main__":
   # Python dictionary beign used is expected
   # in the ordered fashion, which is a feature
@@ -250,6 +575,17 @@ if __name__ == "__main__":
 
   assert sys.version_info >= (3, 7)
 
-  with open(sys.argv[1]) as source:
-    program = json.load(source)
-    print(json.dumps(convert_to_ssa(program)))
+  args = parse_args("conversion to and out of ssa form", add_options, streaming=True)
+
+  if args.stream:
+    # only the program goes to stdout, no listing of the graphs
+    stream_program(convert_function_from_ssa if args.out_of_ssa else ssa_function,
+                   args.program, args.jobs, binary=args.binary)
+  else:
+    with open_program(args.program) as source:
+      program = load_program(source)
+
+      if args.out_of_ssa:
+        print(json.dumps(convert_from_ssa(program, args.jobs)))
+      else:
+        print(json.dumps(convert_to_ssa(program, args.jobs)))
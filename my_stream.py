@@ -0,0 +1,177 @@
+import sys
+import json
+
+from my_binary import BinaryProgram, is_binary, read_binary, write_binary
+from my_parallel import imap_functions, open_program
+
+
+# bytes read at a time, a function bigger than this just takes more reads
+CHUNK_SIZE = 1 << 16
+
+
+class FunctionReader:
+  # reads {"functions": [ ... ]} one function at a time, only the function
+  # being parsed and one chunk are in memory. other keys of the program
+  # end up in extra once the functions are read
+  def __init__(self, source, chunk_size: int = CHUNK_SIZE) -> None:
+    self.source = source
+    self.chunk_size = chunk_size
+
+    self.decoder = json.JSONDecoder()
+    self.buffer = ""
+    self.position = 0
+    self.eof = False
+
+    # top level key -> value, the keys other than functions
+    self.extra = {}
+
+  def fill(self, size: int) -> bool:
+    # reads at least size more characters if there are any,
+    # false at the end of the input
+    if self.eof:
+      return False
+
+    # the parsed part is dropped, the rest moves to the front
+    self.buffer = self.buffer[self.position:]
+    self.position = 0
+
+    chunks = [ self.buffer ]
+    read = 0
+
+    while read < size:
+      chunk = self.source.read(self.chunk_size)
+
+      if not chunk:
+        self.eof = True
+        break
+
+      chunks.append(chunk)
+      read = read + len(chunk)
+
+    self.buffer = "".join(chunks)
+
+    return True
+
+  def peek(self) -> str:
+    # the next character which is not white space, "" at the end
+    while True:
+      while self.position < len(self.buffer) and self.buffer[self.position] in " \t\n\r":
+        self.position = self.position + 1
+
+      if self.position < len(self.buffer):
+        return self.buffer[self.position]
+
+      if not self.fill(self.chunk_size):
+        return ""
+
+  def expect(self, characters: str) -> str:
+    character = self.peek()
+
+    if character == "" or character not in characters:
+      raise ValueError(f'expected one of {characters!r} at {character!r} in the program')
+
+    self.position = self.position + 1
+
+    return character
+
+  def value(self):
+    # a whole json value; an incomplete one fails to decode,
+    # then the buffer grows by as much as it has and it is tried again
+    self.peek()
+
+    while True:
+      try:
+        (value, end) = self.decoder.raw_decode(self.buffer, self.position)
+
+        # only a number, true, false or null can be cut off and still decode
+        if end < len(self.buffer) or self.eof or self.buffer[end - 1] in "}]\"":
+          self.position = end
+          return value
+      except json.JSONDecodeError:
+        if self.eof:
+          raise
+
+      # a number may go on in the next chunk
+      self.fill(max(self.chunk_size, len(self.buffer) - self.position))
+
+  def __iter__(self):
+    self.expect("{")
+
+    if self.peek() == "}":
+      self.position = self.position + 1
+      return
+
+    while True:
+      key = self.value()
+      self.expect(":")
+
+      if key != "functions":
+        self.extra[key] = self.value()
+      else:
+        self.expect("[")
+
+        if self.peek() == "]":
+          self.position = self.position + 1
+        else:
+          while True:
+            yield self.value()
+
+            if "]" == self.expect(",]"):
+              break
+
+      if "}" == self.expect(",}"):
+        return
+
+
+def write_functions(functions, out, extra: dict = None) -> None:
+  # one function per line, each written as soon as it is done
+  out.write('{"functions": [')
+
+  separator = "\n"
+
+  for function in functions:
+    out.write(separator)
+    out.write(json.dumps(function))
+    separator = ",\n"
+
+  out.write("\n]")
+
+  for (key, value) in (extra or {}).items():
+    out.write(f', {json.dumps(key)}: {json.dumps(value)}')
+
+  out.write("}\n")
+  out.flush()
+
+
+def read_functions(source):
+  # the functions of the program, one at a time, from json or the
+  # binary form. both have the other top level keys in extra
+  if is_binary(source):
+    return BinaryProgram(read_binary(source))
+
+  return FunctionReader(source)
+
+
+def load_program(source) -> dict:
+  # json.load, which also takes the binary form
+  if is_binary(source):
+    return BinaryProgram(read_binary(source)).to_json()
+
+  return json.load(source)
+
+
+def write_program(functions, extra: dict = None, binary: bool = False, out=None) -> None:
+  if binary:
+    write_binary(functions, out or sys.stdout.buffer, extra)
+  else:
+    write_functions(functions, out or sys.stdout, extra)
+
+
+def stream_program(function_pass, path: str, jobs: int = 1, out=None, binary: bool = False) -> None:
+  # function_pass(function) -> function, applied to every function of the
+  # program at path as it is read, the results written out in order
+  with open_program(path) as source:
+    reader = read_functions(source)
+    functions = imap_functions(function_pass, jobs, reader)
+
+    write_program(functions, reader.extra, binary, out)
@@ -0,0 +1,213 @@
+import json
+import math
+
+
+# wrap around like the 64 bit ints of the reference interpreter
+INT_BITS = 64
+
+# instructions a program may run before it is taken to be stuck
+STEP_LIMIT = 1000000
+
+
+class BrilError(Exception):
+  pass
+
+
+class Pointer:
+  __slots__ = ("base", "offset")
+
+  def __init__(self, base: int, offset: int) -> None:
+    self.base = base
+    self.offset = offset
+
+
+def wrap(value: int) -> int:
+  return (value + (1 << (INT_BITS - 1))) % (1 << INT_BITS) - (1 << (INT_BITS - 1))
+
+
+def format_value(value) -> str:
+  if isinstance(value, bool):
+    return "true" if value else "false"
+
+  if isinstance(value, float):
+    return f'{value:.17g}'
+
+  return str(value)
+
+
+def divide(a: int, b: int) -> int:
+  if 0 == b:
+    raise BrilError("division by zero")
+
+  quotient = abs(a) // abs(b)
+
+  return wrap(quotient if (a >= 0) == (b >= 0) else -quotient)
+
+
+OPERATORS = {
+  "add": lambda a, b: wrap(a + b),
+  "sub": lambda a, b: wrap(a - b),
+  "mul": lambda a, b: wrap(a * b),
+  "div": divide,
+  "eq": lambda a, b: a == b,
+  "lt": lambda a, b: a < b,
+  "gt": lambda a, b: a > b,
+  "le": lambda a, b: a <= b,
+  "ge": lambda a, b: a >= b,
+  "not": lambda a: not a,
+  "and": lambda a, b: a and b,
+  "or": lambda a, b: a or b,
+  "fadd": lambda a, b: a + b,
+  "fsub": lambda a, b: a - b,
+  "fmul": lambda a, b: a * b,
+  "feq": lambda a, b: a == b,
+  "flt": lambda a, b: a < b,
+  "fgt": lambda a, b: a > b,
+  "fle": lambda a, b: a <= b,
+  "fge": lambda a, b: a >= b,
+}
+
+
+def float_divide(a: float, b: float) -> float:
+  if 0.0 != b:
+    return a / b
+
+  if a != a or 0.0 == a:
+    return math.nan
+
+  # the sign of a zero counts, 1 / -0.0 is -inf
+  return math.copysign(math.inf, a) * math.copysign(1.0, b)
+
+
+OPERATORS["fdiv"] = float_divide
+
+
+class Interpreter:
+  # runs the json form of a program, what it prints is collected in output.
+  # reading an undefined variable or an unknown label is a BrilError
+  def __init__(self, program: dict) -> None:
+    self.functions = { function["name"]: function for function in program["functions"] }
+    self.output = []
+    self.steps = 0
+
+    self.heap = {}
+    self.next_base = 0
+
+  def call(self, name: str, values: list):
+    function = self.functions[name]
+    instrs = function["instrs"]
+
+    env = { arg["name"]: value for (arg, value) in zip(function.get("args", []), values) }
+    labels = { inst["label"]: position for (position, inst) in enumerate(instrs) if "label" in inst }
+
+    position = 0
+    current = None
+    previous = None
+
+    def read(var: str):
+      if var not in env:
+        raise BrilError(f'undefined variable {var} in {name}')
+
+      return env[var]
+
+    while position < len(instrs):
+      inst = instrs[position]
+      position = position + 1
+
+      if "label" in inst:
+        (previous, current) = (current, inst["label"])
+        continue
+
+      self.steps = self.steps + 1
+
+      if self.steps > STEP_LIMIT:
+        raise BrilError("step limit reached")
+
+      op = inst["op"]
+      dest = inst.get("dest")
+
+      if op == "phi":
+        if previous not in inst["labels"]:
+          raise BrilError(f'phi without an argument for {previous} in {name}')
+
+        arg = inst["args"][inst["labels"].index(previous)]
+
+        # an undefined argument leaves the dest undefined
+        if arg in env:
+          env[dest] = env[arg]
+        else:
+          env.pop(dest, None)
+
+        continue
+
+      args = [ read(arg) for arg in inst.get("args", []) ]
+
+      if op == "const":
+        env[dest] = inst["value"]
+      elif op == "id":
+        env[dest] = args[0]
+      elif op in OPERATORS:
+        env[dest] = OPERATORS[op](*args)
+      elif op == "print":
+        self.output.append(" ".join([ format_value(arg) for arg in args ]))
+      elif op == "nop":
+        pass
+      elif op == "jmp" or op == "br":
+        label = inst["labels"][0 if op == "jmp" or args[0] else 1]
+
+        if label not in labels:
+          raise BrilError(f'unknown label {label} in {name}')
+
+        position = labels[label]
+      elif op == "ret":
+        return args[0] if args else None
+      elif op == "call":
+        result = self.call(inst["funcs"][0], args)
+
+        if dest is not None:
+          env[dest] = result
+      elif op == "alloc":
+        self.heap[self.next_base] = [ None ] * args[0]
+        env[dest] = Pointer(self.next_base, 0)
+        self.next_base = self.next_base + 1
+      elif op == "free":
+        del self.heap[args[0].base]
+      elif op == "store":
+        self.heap[args[0].base][args[0].offset] = args[1]
+      elif op == "load":
+        value = self.heap[args[0].base][args[0].offset]
+
+        if value is None:
+          raise BrilError("load of an uninitialized cell")
+
+        env[dest] = value
+      elif op == "ptradd":
+        env[dest] = Pointer(args[0].base, args[0].offset + args[1])
+      else:
+        raise BrilError(f'unknown op {op}')
+
+    return None
+
+
+def run(program: dict, args: list = ()) -> str:
+  # the output of main, or the error it stopped with
+  interpreter = Interpreter(json.loads(json.dumps(program)))
+  main = interpreter.functions["main"]
+
+  values = []
+
+  for (spec, arg) in zip(main.get("args", []), args):
+    if spec["type"] == "bool":
+      values.append(arg == "true")
+    elif spec["type"] == "float":
+      values.append(float(arg))
+    else:
+      values.append(int(arg))
+
+  try:
+    interpreter.call("main", values)
+  except BrilError as error:
+    interpreter.output.append(f'error: {error}')
+
+  return "\n".join(interpreter.output)
+
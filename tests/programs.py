@@ -0,0 +1,213 @@
+import random
+
+
+# variables every generated function works on
+INT_VARIABLES = [ f'i{k}' for k in range(8) ]
+BOOL_VARIABLES = [ f'b{k}' for k in range(3) ]
+
+
+def random_cfg(seed: int, size: int) -> dict:
+  # a function which is all control flow: size labelled blocks jumping,
+  # branching or returning at random, unreachable blocks and all
+  r = random.Random(seed)
+  instrs = [ { "op": "const", "dest": "c", "type": "bool", "value": True } ]
+
+  for block in range(size):
+    instrs.append({ "label": f'b{block}' })
+    instrs.append({ "op": "const", "dest": "x", "type": "int", "value": block })
+
+    k = r.random()
+
+    if k < 0.3:
+      instrs.append({ "op": "jmp", "labels": [ f'b{r.randrange(size)}' ] })
+    elif k < 0.7:
+      instrs.append({ "op": "br", "args": [ "c" ], "labels": [ f'b{r.randrange(size)}', f'b{r.randrange(size)}' ] })
+    elif k < 0.8:
+      instrs.append({ "op": "ret" })
+
+  return { "name": "main", "instrs": instrs }
+
+
+def counted_loop(r: random.Random, number: int, ints: list) -> list:
+  # for c in range(limit): a few updates of the ints
+  (counter, limit, one, condition) = (f'lc{number}', f'll{number}', f'lo{number}', f'lk{number}')
+  (header, body, exit) = (f'H{number}', f'B{number}', f'E{number}')
+
+  instrs = [ { "op": "const", "dest": counter, "type": "int", "value": 0 },
+             { "op": "const", "dest": limit, "type": "int", "value": r.randint(1, 4) },
+             { "op": "const", "dest": one, "type": "int", "value": 1 },
+             { "label": header },
+             { "op": "lt", "dest": condition, "type": "bool", "args": [ counter, limit ] },
+             { "op": "br", "args": [ condition ], "labels": [ body, exit ] },
+             { "label": body } ]
+
+  for _ in range(r.randint(1, 6)):
+    op = r.choice([ "add", "mul", "sub", "const" ])
+    dest = r.choice(INT_VARIABLES)
+
+    if op == "const":
+      instrs.append({ "op": "const", "dest": dest, "type": "int", "value": r.randint(-5, 5) })
+    else:
+      instrs.append({ "op": op, "dest": dest, "type": "int",
+                      "args": [ r.choice(ints + [ counter ]), r.choice(ints + [ counter, one, limit ]) ] })
+
+  instrs.extend([ { "op": "add", "dest": counter, "type": "int", "args": [ counter, one ] },
+                  { "op": "jmp", "labels": [ header ] },
+                  { "label": exit } ])
+
+  return instrs
+
+
+def random_instruction(r: random.Random, position: int, ints: list) -> list:
+  if r.random() < 0.2:
+    dest = r.choice(BOOL_VARIABLES)
+    op = r.choice([ "lt", "eq", "gt", "le", "ge", "and", "or", "not", "const" ])
+
+    if op == "const":
+      return [ { "op": "const", "dest": dest, "type": "bool", "value": r.random() < 0.5 } ]
+
+    if op == "not":
+      return [ { "op": op, "dest": dest, "type": "bool", "args": [ r.choice(BOOL_VARIABLES) ] } ]
+
+    operands = BOOL_VARIABLES if op in ("and", "or") else ints
+
+    return [ { "op": op, "dest": dest, "type": "bool", "args": [ r.choice(operands), r.choice(operands) ] } ]
+
+  dest = r.choice(INT_VARIABLES)
+  op = r.choice([ "const", "add", "mul", "sub", "id", "add", "mul", "const", "div" ])
+
+  if op == "const":
+    return [ { "op": "const", "dest": dest, "type": "int", "value": r.choice([ 0, 1, 2, -1, 5, r.randint(-50, 50) ]) } ]
+
+  if op == "id":
+    return [ { "op": "id", "dest": dest, "type": "int", "args": [ r.choice(ints) ] } ]
+
+  if op == "div":
+    # never by zero
+    divisor = f'nz{position}'
+
+    return [ { "op": "const", "dest": divisor, "type": "int", "value": r.choice([ 1, 2, 3, -2 ]) },
+             { "op": "div", "dest": dest, "type": "int", "args": [ r.choice(ints), divisor ] } ]
+
+  return [ { "op": op, "dest": dest, "type": "int", "args": [ r.choice(ints), r.choice(ints) ] } ]
+
+
+def memory_instructions(r: random.Random) -> list:
+  return [ { "op": "const", "dest": "msz", "type": "int", "value": 4 },
+           { "op": "alloc", "dest": "mp", "type": { "ptr": "int" }, "args": [ "msz" ] },
+           { "op": "store", "args": [ "mp", r.choice(INT_VARIABLES) ] },
+           { "op": "load", "dest": r.choice(INT_VARIABLES), "type": "int", "args": [ "mp" ] },
+           { "op": "free", "args": [ "mp" ] } ]
+
+
+def random_body(r: random.Random, size: int, params: list, loops: bool, memory: bool) -> list:
+  # straight line code with forward jumps and branches, counted loops and
+  # a print of the ints and bools at the end. everything is defined before
+  # it is read, on every path
+  instrs = [ { "op": "const", "dest": var, "type": "int", "value": r.randint(-3, 3) } for var in INT_VARIABLES ]
+  instrs.extend([ { "op": "const", "dest": var, "type": "bool", "value": r.random() < 0.5 } for var in BOOL_VARIABLES ])
+
+  for param in params:
+    instrs.append({ "op": "add", "dest": r.choice(INT_VARIABLES), "type": "int", "args": [ param, INT_VARIABLES[0] ] })
+
+  ints = INT_VARIABLES + params
+
+  labels = 0
+  pending = []
+  loop_count = 0
+
+  for position in range(size):
+    k = r.random()
+
+    if k < 0.06:
+      target = f'L{labels}'
+      labels = labels + 1
+
+      if r.random() < 0.6:
+        other = f'L{labels}'
+        labels = labels + 1
+
+        instrs.append({ "op": "br", "args": [ r.choice(BOOL_VARIABLES) ], "labels": [ target, other ] })
+        pending.extend([ target, other ])
+      else:
+        instrs.append({ "op": "jmp", "labels": [ target ] })
+        pending.append(target)
+
+        if r.random() < 0.3:
+          # dead code after the jump
+          instrs.append({ "op": "const", "dest": r.choice(INT_VARIABLES), "type": "int", "value": 7 })
+
+      continue
+
+    if loops and k < 0.09 and not pending:
+      instrs.extend(counted_loop(r, loop_count, ints))
+      loop_count = loop_count + 1
+      continue
+
+    if pending and r.random() < 0.25:
+      instrs.append({ "label": pending.pop(0) })
+      continue
+
+    instrs.extend(random_instruction(r, position, ints))
+
+    if memory and r.random() < 0.05:
+      instrs.extend(memory_instructions(r))
+
+    if r.random() < 0.08:
+      instrs.append({ "op": "print", "args": [ r.choice(ints) ] })
+
+  instrs.extend([ { "label": label } for label in pending ])
+  instrs.append({ "op": "print", "args": INT_VARIABLES[:4] })
+  instrs.append({ "op": "print", "args": BOOL_VARIABLES })
+
+  return instrs
+
+
+def random_program(seed: int, size: int = 100, functions: int = 1,
+                   loops: bool = False, memory: bool = False) -> dict:
+  # main calls every other function once, those take two ints and return one
+  r = random.Random(seed)
+  program = { "functions": [] }
+
+  for number in range(functions):
+    params = [ "p0", "p1" ] if number else []
+    function = { "name": f'f{number}' if number else "main",
+                 "instrs": random_body(r, size, params, loops, memory) }
+
+    if params:
+      function["args"] = [ { "name": param, "type": "int" } for param in params ]
+      function["type"] = "int"
+      function["instrs"].append({ "op": "ret", "args": [ INT_VARIABLES[1] ] })
+
+    program["functions"].append(function)
+
+  main = program["functions"][0]
+
+  for number in range(1, functions):
+    main["instrs"].append({ "op": "call", "dest": f'r{number}', "type": "int",
+                            "funcs": [ f'f{number}' ], "args": INT_VARIABLES[:2] })
+    main["instrs"].append({ "op": "print", "args": [ f'r{number}' ] })
+
+  return program
+
+
+def entry_loop_program(seed: int, size: int = 40) -> dict:
+  # main(n: int) whose entry block is the loop header: the whole body
+  # runs n times, so the passes have to put a block in front of it
+  r = random.Random(seed)
+
+  body = random_body(r, size, [ "n" ], False, False)
+
+  instrs = [ { "label": "top" } ] + body[:-2] + [
+    { "label": "latch" },
+    { "op": "print", "args": INT_VARIABLES[:4] },
+    { "op": "const", "dest": "step", "type": "int", "value": 1 },
+    { "op": "sub", "dest": "n", "type": "int", "args": [ "n", "step" ] },
+    { "op": "const", "dest": "zero", "type": "int", "value": 0 },
+    { "op": "gt", "dest": "again", "type": "bool", "args": [ "n", "zero" ] },
+    { "op": "br", "args": [ "again" ], "labels": [ "top", "end" ] },
+    { "label": "end" },
+    { "op": "ret" },
+  ]
+
+  return { "functions": [ { "name": "main", "args": [ { "name": "n", "type": "int" } ], "instrs": instrs } ] }
@@ -0,0 +1,99 @@
+import random
+
+from my_cfg import build_cfg, reverse_postorder
+from my_dfa import bit_positions
+from my_dom import compute_dominators, dominance_frontiers, iterated_dominance_frontier
+
+from programs import random_cfg
+
+
+SEEDS = range(300)
+
+
+def naive_dominators(cfg) -> tuple:
+  # block id -> set of its dominators, by the textbook fixpoint
+  reachable = set(reverse_postorder(cfg))
+  dominators = { block: set(reachable) for block in reachable }
+  dominators[cfg.entry] = { cfg.entry }
+
+  changed = True
+
+  while changed:
+    changed = False
+
+    for block in reachable - { cfg.entry }:
+      new = set.intersection(*[ dominators[pred] for pred in cfg.preds[block] if pred in reachable ]) | { block }
+
+      if new != dominators[block]:
+        dominators[block] = new
+        changed = True
+
+  return (dominators, reachable)
+
+
+def test_dominators_match_the_naive_fixpoint():
+  for seed in SEEDS:
+    cfg = build_cfg(random_cfg(seed, 2 + seed % 40))
+    doms = compute_dominators(cfg)
+    (dominators, reachable) = naive_dominators(cfg)
+
+    for a in range(len(cfg)):
+      for b in range(len(cfg)):
+        expected = a in dominators[b] if b in reachable else a == b
+        assert doms.dominates(a, b) == expected, (seed, a, b)
+
+    for block in reachable - { cfg.entry }:
+      strict = dominators[block] - { block }
+      idom = doms.idom[block]
+
+      # the closest of the strict dominators
+      assert idom in strict and strict <= dominators[idom], (seed, block)
+
+
+def test_lengauer_tarjan_agrees():
+  for seed in SEEDS:
+    cfg = build_cfg(random_cfg(seed, 2 + seed % 40))
+
+    assert compute_dominators(cfg, "chk").idom == compute_dominators(cfg, "lt").idom, seed
+
+
+def test_frontiers_match_the_definition():
+  for seed in SEEDS:
+    cfg = build_cfg(random_cfg(seed, 2 + seed % 40))
+    doms = compute_dominators(cfg)
+    frontiers = dominance_frontiers(doms)
+
+    for x in range(len(cfg)):
+      # y is in the frontier of x if x dominates a pred of y, but not y itself
+      expected = set()
+
+      if doms.reachable(x):
+        expected = { y for y in range(len(cfg)) if doms.reachable(y) and not doms.strictly_dominates(x, y)
+                     and any([ doms.reachable(pred) and doms.dominates(x, pred) for pred in cfg.preds[y] ]) }
+
+      assert set(bit_positions(frontiers[x])) == expected, (seed, x)
+
+
+def test_iterated_frontier_is_the_closure():
+  for seed in SEEDS:
+    cfg = build_cfg(random_cfg(seed, 2 + seed % 40))
+    doms = compute_dominators(cfg)
+    frontiers = dominance_frontiers(doms)
+
+    r = random.Random(seed)
+    blocks = [ block for block in range(len(cfg)) if doms.reachable(block) and r.random() < 0.2 ]
+
+    closure = set()
+
+    while True:
+      new = set()
+
+      for block in set(blocks) | closure:
+        new.update(bit_positions(frontiers[block]))
+
+      if new == closure:
+        break
+
+      closure = new
+
+    assert set(iterated_dominance_frontier(frontiers, blocks)) == closure, seed
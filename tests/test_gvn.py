@@ -0,0 +1,44 @@
+import json
+
+from my_dce import gvn, optimize
+
+from interpreter import run
+from programs import random_program
+
+
+# 1 / -0.0 is -inf, -0.0 must not be numbered like 0.0
+SIGNED_ZERO = { "functions": [ { "name": "main", "instrs": [
+  { "op": "const", "dest": "a", "type": "float", "value": -0.0 },
+  { "op": "const", "dest": "b", "type": "float", "value": 0.0 },
+  { "op": "const", "dest": "one", "type": "float", "value": 1.0 },
+  { "op": "fdiv", "dest": "c", "type": "float", "args": [ "one", "a" ] },
+  { "op": "fdiv", "dest": "d", "type": "float", "args": [ "one", "b" ] },
+  { "op": "flt", "dest": "e", "type": "bool", "args": [ "c", "b" ] },
+  { "op": "flt", "dest": "f", "type": "bool", "args": [ "d", "b" ] },
+  { "op": "print", "args": [ "e", "f" ] },
+] } ] }
+
+
+def copy(program: dict) -> dict:
+  return json.loads(json.dumps(program))
+
+
+def test_gvn_keeps_the_output():
+  for seed in range(60):
+    program = random_program(seed, 60 + seed % 150, 1 + seed % 3, seed % 2 == 0, seed % 5 == 0)
+
+    assert run(gvn(copy(program))) == run(program), seed
+
+
+def test_optimize_keeps_the_output():
+  for seed in range(60):
+    program = random_program(seed, 60 + seed % 150, 1 + seed % 3, seed % 2 == 0, seed % 5 == 0)
+
+    assert run(optimize(copy(program))) == run(program), seed
+
+
+def test_signed_zeros_are_different_values():
+  assert run(SIGNED_ZERO) == "true false"
+
+  for optimized in (gvn(copy(SIGNED_ZERO)), optimize(copy(SIGNED_ZERO))):
+    assert run(optimized) == "true false"
@@ -0,0 +1,118 @@
+import json
+import random
+
+from my_cfg import build_cfg, function_args
+from my_iv import iv_cfg, strength_reduce
+from my_ssa import ssa_cfg
+
+from interpreter import run
+
+
+def copy(program: dict) -> dict:
+  return json.loads(json.dumps(program))
+
+
+def reduced(program: dict) -> dict:
+  return strength_reduce(copy(program))
+
+
+def counted_loop(init: int, n: int, step: int, k: int, update: str, op: str, swap: bool,
+                 second_exit: bool) -> dict:
+  # s = sum of i * k while i op n, at most 20 rounds when there is a second exit
+  instrs = [
+    { "op": "const", "dest": "i", "type": "int", "value": init },
+    { "op": "const", "dest": "n", "type": "int", "value": n },
+    { "op": "const", "dest": "st", "type": "int", "value": step },
+    { "op": "const", "dest": "k", "type": "int", "value": k },
+    { "op": "const", "dest": "s", "type": "int", "value": 0 },
+    { "op": "const", "dest": "lim", "type": "int", "value": 20 },
+    { "op": "const", "dest": "cnt", "type": "int", "value": 0 },
+    { "op": "const", "dest": "one", "type": "int", "value": 1 },
+    { "label": "head" },
+    { "op": op, "dest": "c", "type": "bool", "args": [ "n", "i" ] if swap else [ "i", "n" ] },
+    { "op": "br", "args": [ "c" ], "labels": [ "body", "done" ] },
+    { "label": "body" },
+    { "op": "add", "dest": "cnt", "type": "int", "args": [ "cnt", "one" ] },
+  ]
+
+  if second_exit:
+    instrs.extend([ { "op": "gt", "dest": "stop", "type": "bool", "args": [ "cnt", "lim" ] },
+                    { "op": "br", "args": [ "stop" ], "labels": [ "done", "go" ] },
+                    { "label": "go" } ])
+
+  instrs.extend([
+    { "op": "mul", "dest": "o", "type": "int", "args": [ "i", "k" ] },
+    { "op": "add", "dest": "s", "type": "int", "args": [ "s", "o" ] },
+    { "op": update, "dest": "i", "type": "int", "args": [ "i", "st" ] },
+    { "op": "jmp", "labels": [ "head" ] },
+    { "label": "done" },
+    { "op": "print", "args": [ "s", "cnt" ] },
+  ])
+
+  return { "functions": [ { "name": "main", "instrs": instrs } ] }
+
+
+def test_strength_reduction_keeps_the_output():
+  r = random.Random(1)
+  eliminated = 0
+
+  for _ in range(400):
+    second_exit = r.random() < 0.5
+    program = counted_loop(r.choice([ 0, 1, -5, 10, 2 ** 62, -2 ** 62 ]),
+                           r.choice([ 6, 0, -3, 12, 2 ** 62 + 5, 2 ** 61 ]) if second_exit else r.choice([ 6, 0, -3, 12 ]),
+                           r.choice([ 1, 2, -1, 3 ]), r.choice([ 8, -2, 0, 1, 2 ** 40 ]),
+                           r.choice([ "add", "sub" ]), r.choice([ "lt", "le", "gt", "ge" ]),
+                           r.random() < 0.5, second_exit)
+
+    optimized = reduced(program)
+
+    if "_times_" in json.dumps(optimized):
+      eliminated = eliminated + 1
+
+    assert run(optimized) == run(program), json.dumps(program)
+
+  # the test replacement did happen
+  assert eliminated > 0
+
+
+def test_no_test_replacement_without_a_bound():
+  # the loop ends on j, nothing keeps i * k from wrapping around
+  program = { "functions": [ { "name": "main", "instrs": [
+    { "op": "const", "dest": "i", "type": "int", "value": 0 },
+    { "op": "const", "dest": "j", "type": "int", "value": 0 },
+    { "op": "const", "dest": "one", "type": "int", "value": 1 },
+    { "op": "const", "dest": "st", "type": "int", "value": 2 ** 40 },
+    { "op": "const", "dest": "k", "type": "int", "value": 2 ** 20 },
+    { "op": "const", "dest": "ten", "type": "int", "value": 10 },
+    { "label": "head" },
+    { "op": "lt", "dest": "c", "type": "bool", "args": [ "j", "ten" ] },
+    { "op": "br", "args": [ "c" ], "labels": [ "body", "end" ] },
+    { "label": "body" },
+    { "op": "mul", "dest": "p", "type": "int", "args": [ "i", "k" ] },
+    { "op": "lt", "dest": "t", "type": "bool", "args": [ "i", "ten" ] },
+    { "op": "print", "args": [ "p", "t" ] },
+    { "op": "add", "dest": "i", "type": "int", "args": [ "i", "st" ] },
+    { "op": "add", "dest": "j", "type": "int", "args": [ "j", "one" ] },
+    { "op": "jmp", "labels": [ "head" ] },
+    { "label": "end" },
+    { "op": "ret" },
+  ] } ] }
+
+  optimized = reduced(program)
+
+  assert "_times_" not in json.dumps(optimized)
+  assert run(optimized) == run(program)
+
+
+def test_changes_are_counted_and_constants_folded():
+  program = counted_loop(0, 6, 1, 8, "add", "lt", False, False)
+  function = program["functions"][0]
+
+  (cfg, changes) = iv_cfg(ssa_cfg(build_cfg(copy(function)), []), function_args(function))
+  ops = [ inst.get("op") for inst in cfg.instrs() ]
+
+  # start, step, phi, update, the product, the bound, the comparison, i's phi and update
+  assert changes >= 9
+  assert "mul" not in ops
+
+  assert run(reduced(program)) == run(program) == "120 6"
@@ -0,0 +1,85 @@
+import json
+
+from my_dce import dce_function, optimize
+from my_licm import licm
+from my_opt import DEFAULT_PIPELINE, Pipeline
+
+from interpreter import run
+from programs import entry_loop_program, random_program
+
+
+# the entry block is the loop header, the invariant code has to go to
+# the block put in front of it and stay there
+ENTRY_LOOP = {
+  "functions": [ {
+    "name": "main",
+    "args": [ { "name": "b", "type": "bool" }, { "name": "n", "type": "int" } ],
+    "instrs": [
+      { "label": "loop" },
+      { "op": "const", "dest": "one", "type": "int", "value": 1 },
+      { "op": "add", "dest": "x", "type": "int", "args": [ "n", "one" ] },
+      { "op": "print", "args": [ "x" ] },
+      { "op": "br", "args": [ "b" ], "labels": [ "loop", "end" ] },
+      { "label": "end" },
+      { "op": "ret" },
+    ],
+  } ],
+}
+
+
+def copy(program: dict) -> dict:
+  return json.loads(json.dumps(program))
+
+
+def pipeline(program: dict) -> dict:
+  runner = Pipeline(DEFAULT_PIPELINE.split(","))
+
+  return { "functions": list(runner.run_functions(copy(program)["functions"])) }
+
+
+def test_hoisting_out_of_an_entry_loop():
+  for optimized in (licm(copy(ENTRY_LOOP)), optimize(copy(ENTRY_LOOP)), pipeline(ENTRY_LOOP)):
+    instrs = optimized["functions"][0]["instrs"]
+
+    # the add runs once, before the loop
+    assert instrs.index({ "label": "loop" }) > [ inst.get("op") for inst in instrs ].index("add")
+
+    assert run(optimized, [ "false", "3" ]) == run(ENTRY_LOOP, [ "false", "3" ]) == "4"
+
+
+def test_entry_loop_programs():
+  for seed in range(40):
+    program = entry_loop_program(seed)
+
+    for optimized in (licm(copy(program)), optimize(copy(program)), pipeline(program)):
+      for n in ("1", "3"):
+        assert run(optimized, [ n ]) == run(program, [ n ]), (seed, n)
+
+
+def test_licm_keeps_the_output():
+  for seed in range(40):
+    program = random_program(seed, 60 + seed % 100, 1 + seed % 3, True, seed % 5 == 0)
+
+    assert run(licm(copy(program))) == run(program), seed
+
+
+def test_dce_deletes_the_blocks_nothing_reaches():
+  function = {
+    "name": "main",
+    "instrs": [
+      { "op": "const", "dest": "a", "type": "int", "value": 1 },
+      { "op": "jmp", "labels": [ "end" ] },
+      { "op": "print", "args": [ "a" ] },
+      { "label": "dead" },
+      { "op": "print", "args": [ "a" ] },
+      { "label": "end" },
+      { "op": "phi", "dest": "b", "type": "int", "args": [ "a", "a" ], "labels": [ "main", "dead" ] },
+      { "op": "print", "args": [ "b" ] },
+    ],
+  }
+
+  instrs = dce_function(function)["instrs"]
+
+  assert { "label": "dead" } not in instrs
+  assert [ inst.get("op") for inst in instrs ].count("print") == 1
+  assert [ inst["labels"] for inst in instrs if inst.get("op") == "phi" ] == [ [ "main" ] ]
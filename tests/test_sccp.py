@@ -0,0 +1,77 @@
+import json
+
+from my_sccp import sccp
+
+from interpreter import run
+from programs import random_program
+
+
+def copy(program: dict) -> dict:
+  return json.loads(json.dumps(program))
+
+
+def test_sccp_keeps_the_output():
+  for seed in range(60):
+    program = random_program(seed, 60 + seed % 150, 1 + seed % 3, seed % 2 == 0, seed % 5 == 0)
+
+    assert run(sccp(copy(program))) == run(program), seed
+
+
+def test_branch_on_a_constant_becomes_a_jump():
+  program = { "functions": [ { "name": "main", "instrs": [
+    { "op": "const", "dest": "c", "type": "bool", "value": True },
+    { "op": "br", "args": [ "c" ], "labels": [ "yes", "no" ] },
+    { "label": "yes" },
+    { "op": "const", "dest": "x", "type": "int", "value": 1 },
+    { "op": "print", "args": [ "x" ] },
+    { "op": "ret" },
+    { "label": "no" },
+    { "op": "const", "dest": "y", "type": "int", "value": 2 },
+    { "op": "print", "args": [ "y" ] },
+  ] } ] }
+
+  instrs = sccp(copy(program))["functions"][0]["instrs"]
+
+  assert "br" not in [ inst.get("op") for inst in instrs ]
+  assert { "label": "no" } not in instrs
+  assert run({ "functions": [ { "name": "main", "instrs": instrs } ] }) == "1"
+
+
+def test_branch_on_an_undefined_value_keeps_both_targets():
+  # c is only defined after the loop went round once, which never happens.
+  # the branch has no edge to take, it's targets must not be deleted under it
+  program = { "functions": [ { "name": "main", "instrs": [
+    { "label": "head" },
+    { "op": "br", "args": [ "c" ], "labels": [ "body", "end" ] },
+    { "label": "body" },
+    { "op": "const", "dest": "c", "type": "bool", "value": False },
+    { "op": "jmp", "labels": [ "head" ] },
+    { "label": "end" },
+    { "op": "ret" },
+  ] } ] }
+
+  optimized = sccp(copy(program))
+  instrs = optimized["functions"][0]["instrs"]
+
+  assert { "label": "body" } in instrs and { "label": "end" } in instrs
+  assert run(optimized).startswith("error: undefined variable")
+
+
+def test_phi_of_signed_zeros_is_not_constant():
+  program = { "functions": [ { "name": "main", "args": [ { "name": "b", "type": "bool" } ], "instrs": [
+    { "op": "br", "args": [ "b" ], "labels": [ "left", "right" ] },
+    { "label": "left" },
+    { "op": "const", "dest": "x", "type": "float", "value": 0.0 },
+    { "op": "jmp", "labels": [ "join" ] },
+    { "label": "right" },
+    { "op": "const", "dest": "x", "type": "float", "value": -0.0 },
+    { "label": "join" },
+    { "op": "const", "dest": "one", "type": "float", "value": 1.0 },
+    { "op": "fdiv", "dest": "y", "type": "float", "args": [ "one", "x" ] },
+    { "op": "print", "args": [ "y" ] },
+  ] } ] }
+
+  optimized = sccp(copy(program))
+
+  for arg in ("true", "false"):
+    assert run(optimized, [ arg ]) == run(program, [ arg ]), arg
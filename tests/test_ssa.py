@@ -0,0 +1,102 @@
+import json
+
+from my_cfg import build_cfg, with_entry_block
+from my_ssa import convert_function_from_ssa, ssa_function
+
+from interpreter import run
+from programs import entry_loop_program, random_program
+
+
+SEEDS = range(60)
+
+
+def to_ssa(program: dict) -> dict:
+  return { "functions": [ ssa_function(json.loads(json.dumps(function))) for function in program["functions"] ] }
+
+
+def from_ssa(program: dict) -> dict:
+  return { "functions": [ convert_function_from_ssa(json.loads(json.dumps(function)))
+                          for function in program["functions"] ] }
+
+
+def test_every_variable_is_defined_once():
+  for seed in SEEDS:
+    program = to_ssa(random_program(seed, 60 + seed % 150, 1 + seed % 3, seed % 2 == 0, seed % 5 == 0))
+
+    for function in program["functions"]:
+      dests = [ inst["dest"] for inst in function["instrs"] if "dest" in inst ]
+
+      assert len(dests) == len(set(dests)), (seed, function["name"])
+
+
+def test_ssa_keeps_the_output():
+  for seed in SEEDS:
+    program = random_program(seed, 60 + seed % 150, 1 + seed % 3, seed % 2 == 0, seed % 5 == 0)
+
+    assert run(to_ssa(program)) == run(program), seed
+
+
+def test_entry_loop_header_gets_a_new_entry():
+  # the phis of the header need a pred to come from on the first trip
+  for seed in range(40):
+    program = entry_loop_program(seed)
+    ssa = to_ssa(program)
+
+    instrs = ssa["functions"][0]["instrs"]
+    first = instrs.index({ "label": "top" })
+
+    assert first > 0 and not any([ inst.get("op") == "phi" for inst in instrs[:first] ]), seed
+
+    for n in ("1", "3"):
+      assert run(ssa, [ n ]) == run(program, [ n ]), (seed, n)
+
+
+def test_new_entry_block_is_reached():
+  cfg = with_entry_block(build_cfg(entry_loop_program(0)["functions"][0]))
+
+  assert not cfg.generated[cfg.entry]
+  assert cfg.succs[cfg.entry] == [ cfg.index["top"] ]
+
+
+def copy_propagated(program: dict) -> dict:
+  # the ids the conversion made are read through, as the optimizations
+  # leave them: the live ranges of the versions of a variable then overlap
+  for function in program["functions"]:
+    copies = { inst["dest"]: inst["args"][0] for inst in function["instrs"] if inst.get("op") == "id" }
+
+    def source(var: str) -> str:
+      while var in copies:
+        var = copies[var]
+
+      return var
+
+    for inst in function["instrs"]:
+      if "args" in inst and inst.get("op") != "id":
+        inst["args"] = [ source(arg) for arg in inst["args"] ]
+
+  return program
+
+
+def test_out_of_ssa_round_trip():
+  for seed in SEEDS:
+    program = random_program(seed, 60 + seed % 150, 1 + seed % 3, seed % 2 == 0, seed % 5 == 0)
+    ssa = to_ssa(program)
+
+    if seed % 2:
+      ssa = copy_propagated(ssa)
+
+    back = from_ssa(ssa)
+
+    for function in back["functions"]:
+      assert not any([ inst.get("op") == "phi" for inst in function["instrs"] ]), seed
+
+    assert run(back) == run(program), seed
+
+
+def test_out_of_ssa_round_trip_entry_loop():
+  for seed in range(40):
+    program = entry_loop_program(seed)
+    back = from_ssa(copy_propagated(to_ssa(program)))
+
+    for n in ("1", "3"):
+      assert run(back, [ n ]) == run(program, [ n ]), (seed, n)